@@ -0,0 +1,56 @@
+import os
+import threading
+
+# Process-wide API clients. They are built on first use, so code paths that never call
+# Gemini or fetch news (every read endpoint) never import google.genai or requests, and a
+# warm serverless instance reuses the same clients and their connection pools.
+_lock = threading.Lock()
+_gemini_client = None
+_http_session = None
+
+
+def gemini_client():
+  """
+  :return: The shared genai.Client, created (and GEMINI_API_KEY read) on the first call.
+  """
+  global _gemini_client
+  if _gemini_client is None:
+    with _lock:
+      if _gemini_client is None:
+        from dotenv import load_dotenv
+        from google import genai
+
+        load_dotenv()
+        _gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+  return _gemini_client
+
+
+def http_session(pool_size=8):
+  """
+  :param pool_size: Keep-alive connections kept per host, only used by the first call.
+  :return: The shared pooled requests.Session used to fetch news.
+  """
+  global _http_session
+  if _http_session is None:
+    with _lock:
+      if _http_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        # keep-alive connections are reused across sources on the same host
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _http_session = session
+  return _http_session
+
+
+def gemini_errors():
+  """
+  :return: The exception types a failed Gemini call raises, imported only once one did.
+  """
+  import httpx
+  from google.genai.errors import APIError
+
+  return APIError, httpx.TransportError
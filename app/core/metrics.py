@@ -0,0 +1,245 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+  return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+  if not labels:
+    return ""
+  return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+  if value == float("inf"):
+    return "+Inf"
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+  """Base of the metric types: a name, help text and one series per label combination"""
+
+  kind = None
+
+  def __init__(self, name, documentation, labelnames=()):
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._series = {}
+    self._lock = threading.Lock()
+
+  def _key(self, labels):
+    if set(labels) != set(self.labelnames):
+      raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+    return tuple((name, labels[name]) for name in self.labelnames)
+
+  @property
+  def family(self):
+    return self.name
+
+  def render(self):
+    lines = [f"# HELP {self.family} {self.documentation}", f"# TYPE {self.family} {self.kind}"]
+    with self._lock:
+      series = sorted(self._series.items(), key=lambda item: item[0])
+    for key, value in series:
+      lines.extend(self._render_series(key, value))
+    return lines
+
+
+class Counter(Metric):
+  kind = "counter"
+
+  @property
+  def family(self):
+    return f"{self.name}_total"
+
+  def inc(self, amount=1, **labels):
+    key = self._key(labels)
+    with self._lock:
+      self._series[key] = self._series.get(key, 0) + amount
+
+  def value(self, **labels):
+    return self._series.get(self._key(labels), 0)
+
+  def _render_series(self, key, value):
+    return [f"{self.family}{_format_labels(key)} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+  kind = "histogram"
+
+  def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    super().__init__(name, documentation, labelnames)
+    self.buckets = tuple(sorted(buckets))
+
+  def observe(self, value, **labels):
+    key = self._key(labels)
+    with self._lock:
+      series = self._series.get(key)
+      if series is None:
+        series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+      series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+      series["sum"] += value
+      series["count"] += 1
+
+  @contextmanager
+  def time(self, **labels):
+    started = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - started, **labels)
+
+  def count(self, **labels):
+    series = self._series.get(self._key(labels))
+    return series["count"] if series else 0
+
+  def _render_series(self, key, value):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(self.buckets + (float("inf"),), value["counts"]):
+      cumulative += count
+      lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(float(bound))),))} {cumulative}")
+    lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(value['sum'])}")
+    lines.append(f"{self.name}_count{_format_labels(key)} {value['count']}")
+    return lines
+
+
+class Registry:
+  """The metrics of this process, rendered in the Prometheus text exposition format"""
+
+  def __init__(self):
+    self._metrics = {}
+
+  def register(self, metric):
+    if metric.name in self._metrics:
+      raise ValueError(f"Metric {metric.name} is already registered")
+    self._metrics[metric.name] = metric
+    return metric
+
+  def counter(self, name, documentation, labelnames=()):
+    return self.register(Counter(name, documentation, labelnames))
+
+  def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return self.register(Histogram(name, documentation, labelnames, buckets))
+
+  def render(self):
+    lines = []
+    for metric in self._metrics.values():
+      lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Pipeline
+stage_seconds = registry.histogram(
+    "shield_pipeline_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+stage_articles = registry.counter(
+    "shield_pipeline_articles", "Articles going into and coming out of each pipeline stage.", ["stage", "direction"])
+gemini_requests = registry.counter(
+    "shield_gemini_requests", "Gemini generate_content calls by outcome.", ["outcome"])
+gemini_tokens = registry.counter(
+    "shield_gemini_tokens", "Gemini tokens reported by usage_metadata.", ["kind"])
+analysis_cache_requests = registry.counter(
+    "shield_analysis_cache_requests", "Analysis cache lookups by result.", ["result"])
+rate_limit_wait_seconds = registry.counter(
+    "shield_rate_limit_wait_seconds", "Time spent waiting on the client side rate limiter, by provider.", ["provider"])
+api_retries = registry.counter(
+    "shield_api_retries", "Retried Gemini and news source calls, by provider and reason.", ["provider", "reason"])
+
+# API
+http_request_seconds = registry.histogram(
+    "shield_http_request_seconds", "HTTP request latency until the response starts.", ["method", "route", "status"])
+db_queries = registry.counter(
+    "shield_db_queries", "Database statements executed, by HTTP route (\"none\" outside requests).", ["route"])
+db_query_seconds = registry.histogram(
+    "shield_db_query_seconds", "Database statement duration, by HTTP route (\"none\" outside requests).", ["route"])
+db_queries_per_request = registry.histogram(
+    "shield_db_queries_per_request", "Database statements executed per HTTP request.", ["route"], COUNT_BUCKETS)
+
+
+@contextmanager
+def time_stage(stage):
+  """Times a block as one run of a pipeline stage"""
+  with stage_seconds.time(stage=stage):
+    yield
+
+
+def count_articles(stage, articles_in=None, articles_out=None):
+  """Counts the articles a stage was given and the ones it passed on"""
+  if articles_in is not None:
+    stage_articles.inc(articles_in, stage=stage, direction="in")
+  if articles_out is not None:
+    stage_articles.inc(articles_out, stage=stage, direction="out")
+
+
+def route_template(scope):
+  """
+  The matched route's path template, so ids in paths don't explode the label values.
+  Requests answered by a middleware never reach the router, those are matched here.
+  """
+  route = scope.get("route")
+  if route is None and "app" in scope:
+    for candidate in scope["app"].router.routes:
+      if candidate.matches(scope)[0] == Match.FULL:
+        route = candidate
+        break
+  return getattr(route, "path", None) or "unmatched"
+
+
+class RequestQueries:
+  """Statements run on behalf of one HTTP request, collected by the engine events below"""
+
+  def __init__(self, scope):
+    self.scope = scope
+    self.count = 0
+
+  @property
+  def route(self):
+    return route_template(self.scope)
+
+
+current_request_queries = contextvars.ContextVar("current_request_queries", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  conn.info.setdefault("shield_query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  seconds = time.perf_counter() - conn.info["shield_query_started"].pop()
+  queries = current_request_queries.get()
+  route = "none"
+  if queries is not None:
+    queries.count += 1
+    route = queries.route
+  db_queries.inc(route=route)
+  db_query_seconds.observe(seconds, route=route)
+
+
+def record_request(method, status, seconds, queries):
+  """
+  Records one finished HTTP request.
+  :param method: The HTTP method.
+  :param status: The response status code.
+  :param seconds: Time until the response started.
+  :param queries: The RequestQueries collected while handling it.
+  """
+  route = queries.route
+  http_request_seconds.observe(seconds, method=method, route=route, status=str(status))
+  db_queries_per_request.observe(queries.count, route=route)
@@ -0,0 +1,222 @@
+import email.utils
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from app.core import metrics
+
+# Providers and the env variables holding their per-minute limits: (requests, tokens).
+# 0 or unset means no limit of that kind.
+PROVIDER_LIMITS = {
+  "gemini": (("SHIELD_GEMINI_RPM", "60"), ("SHIELD_GEMINI_TPM", "1000000")),
+  "newsapi": (("SHIELD_NEWSAPI_RPM", "60"), None),
+  "feeds": (("SHIELD_FEEDS_RPM", "0"), None),
+}
+
+_RETRY_DELAY = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+
+
+class TokenBucket:
+  """
+  Allows rate units per second on average, with bursts of up to capacity units. Callers
+  asking for more than is left wait for the refill. Thread safe.
+  """
+
+  def __init__(self, rate, capacity, clock=time.monotonic):
+    """
+    :param rate: Units added per second.
+    :param capacity: Most units the bucket holds, i.e. the largest burst.
+    :param clock: Monotonic clock, in seconds.
+    """
+    self.rate = rate
+    self.capacity = capacity
+    self.clock = clock
+    self._level = capacity
+    self._updated = clock()
+    self._lock = threading.Lock()
+
+  def reserve(self, amount):
+    """
+    Takes amount units, going into debt if there are not enough, so concurrent callers
+    queue up behind each other instead of racing for the refill. A request bigger than
+    the whole capacity is let through once the bucket is full.
+    :param amount: Units to take.
+    :return: Seconds the caller has to wait before using them.
+    """
+    with self._lock:
+      now = self.clock()
+      self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+      self._updated = now
+      needed = min(amount, self.capacity)
+      wait = max(needed - self._level, 0) / self.rate
+      self._level -= amount
+      return wait
+
+  def refund(self, amount):
+    """
+    Gives back units reserved for a request that was not made.
+    :param amount: Units to give back.
+    """
+    with self._lock:
+      self._level = min(self.capacity, self._level + amount)
+
+
+class RateLimiter:
+  """
+  Client side limits for one API provider: a token bucket for requests per minute and,
+  optionally, one for tokens per minute. Every caller in the process shares the limiter of
+  its provider (see limiter), so concurrent chunks and fetches stay under the quota
+  together. When the provider answers 429, back_off holds every caller until the
+  Retry-After time has passed.
+  """
+
+  def __init__(self, name, requests_per_minute=0, tokens_per_minute=0, clock=time.monotonic, sleep=time.sleep):
+    """
+    :param name: Provider name, used as the metrics label.
+    :param requests_per_minute: Request quota, 0 for none.
+    :param tokens_per_minute: Token quota, 0 for none.
+    :param clock: Monotonic clock, in seconds.
+    :param sleep: Called with the seconds to wait.
+    """
+    self.name = name
+    self.requests_per_minute = requests_per_minute
+    self.tokens_per_minute = tokens_per_minute
+    self.clock = clock
+    self.sleep = sleep
+    self._requests = TokenBucket(requests_per_minute / 60, requests_per_minute, clock) if requests_per_minute else None
+    self._tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute, clock) if tokens_per_minute else None
+    self._blocked_until = 0.0
+    self._lock = threading.Lock()
+
+  def tokens_per_request(self):
+    """
+    :return: The average tokens a request can carry without the token quota running out
+             before the request quota does, or None when either is unlimited.
+    """
+    if not self.requests_per_minute or not self.tokens_per_minute:
+      return None
+    return self.tokens_per_minute // self.requests_per_minute
+
+  def acquire(self, tokens=0, max_wait=None):
+    """
+    Blocks until one more request carrying this many tokens fits in the quota.
+    :param tokens: Estimated tokens the request uses, prompt and response.
+    :param max_wait: Longest wait the caller can afford, e.g. the rest of a time budget, or
+                     None for no limit. When the quota needs longer, nothing is taken and
+                     the call returns None at once.
+    :return: Seconds spent waiting, or None if that would have been longer than max_wait.
+    """
+    wait = max(self._blocked_until - self.clock(), 0)
+    if self._requests:
+      wait = max(wait, self._requests.reserve(1))
+    if self._tokens and tokens:
+      wait = max(wait, self._tokens.reserve(tokens))
+    if max_wait is not None and wait > max_wait:
+      if self._requests:
+        self._requests.refund(1)
+      if self._tokens and tokens:
+        self._tokens.refund(tokens)
+      return None
+    if wait > 0:
+      metrics.rate_limit_wait_seconds.inc(wait, provider=self.name)
+      self.sleep(wait)
+    return wait
+
+  def back_off(self, seconds):
+    """
+    Holds every caller of this provider for the given time, e.g. after a 429.
+    :param seconds: How long to hold them.
+    """
+    with self._lock:
+      self._blocked_until = max(self._blocked_until, self.clock() + seconds)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(provider):
+  """
+  :param provider: A key of PROVIDER_LIMITS.
+  :return: The process-wide RateLimiter of the provider, configured from the environment
+           on first use.
+  """
+  if provider not in _limiters:
+    with _limiters_lock:
+      if provider not in _limiters:
+        requests_env, tokens_env = PROVIDER_LIMITS[provider]
+        _limiters[provider] = RateLimiter(
+            provider,
+            requests_per_minute=float(os.getenv(*requests_env)),
+            tokens_per_minute=float(os.getenv(*tokens_env)) if tokens_env else 0
+        )
+  return _limiters[provider]
+
+
+def backoff_delay(attempt, base, cap=60.0, rng=random):
+  """
+  Exponential backoff with full jitter, so clients that failed together do not retry
+  together.
+  :param attempt: The attempt that just failed, starting at 1.
+  :param base: Delay ceiling after the first failure, doubled after every further one.
+  :param cap: Largest delay ceiling.
+  :param rng: Source of randomness.
+  :return: Seconds to wait before the next attempt.
+  """
+  return rng.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def parse_retry_after(value, now=None):
+  """
+  :param value: A Retry-After header, either seconds or an HTTP date.
+  :param now: Unix time, defaults to now.
+  :return: Seconds to wait, or None if the value can't be read.
+  """
+  if value is None:
+    return None
+  value = str(value).strip()
+  try:
+    return max(float(value), 0.0)
+  except ValueError:
+    pass
+  try:
+    moment = email.utils.parsedate_to_datetime(value)
+  except (TypeError, ValueError):
+    return None
+  return max(moment.timestamp() - (now or time.time()), 0.0)
+
+
+def retry_after(error):
+  """
+  How long a rate limited API asked us to wait, read from the Retry-After header of the
+  error's response, or from the RetryInfo detail Google APIs put in the error body.
+  :param error: The exception raised for the failed call.
+  :return: Seconds to wait, or None if the error does not say.
+  """
+  response = getattr(error, "response", None)
+  headers = getattr(response, "headers", None)
+  if headers is not None:
+    seconds = parse_retry_after(headers.get("Retry-After"))
+    if seconds is not None:
+      return seconds
+
+  details = getattr(error, "details", None)
+  if isinstance(details, dict):
+    details = details.get("error", details).get("details", [])
+  for detail in details if isinstance(details, list) else []:
+    match = _RETRY_DELAY.match(str(detail.get("retryDelay", ""))) if isinstance(detail, dict) else None
+    if match:
+      return float(match.group(1))
+  return None
+
+
+def estimate_tokens(text):
+  """
+  Rough token count for prompt sizing, about four characters per token for English text.
+  :param text: The text that will be sent.
+  :return: Estimated tokens.
+  """
+  return math.ceil(len(text) / 4)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+CachedResponse = namedtuple("CachedResponse", ["body", "headers", "etag", "stored_at"])
+
+
+class WriteGeneration:
+  """
+  Process wide counter of writes to the threats table. Every writer bumps it, and since it
+  is part of every response cache key, a bump makes all cached responses unreachable.
+  """
+
+  def __init__(self):
+    self._value = 0
+    self._lock = threading.Lock()
+
+  @property
+  def value(self):
+    return self._value
+
+  def bump(self):
+    with self._lock:
+      self._value += 1
+      return self._value
+
+
+write_generation = WriteGeneration()
+
+
+def bump_write_generation():
+  """Call after committing any change to threats, so cached reads are not served stale."""
+  return write_generation.bump()
+
+
+class ResponseCache:
+  """
+  Bounded LRU cache of serialized GET responses, keyed on route + query params + write
+  generation. Bounded both by entry count and by total body bytes.
+
+  Writes made by another process (e.g. a cron invocation on a different serverless
+  instance) can't bump this process's counter, so entries also expire after ttl_seconds.
+  """
+
+  def __init__(self, max_entries=None, max_bytes=None, ttl_seconds=None):
+    """
+    :param max_entries: SHIELD_RESPONSE_CACHE_MAX_ENTRIES, default 256.
+    :param max_bytes: SHIELD_RESPONSE_CACHE_MAX_BYTES, default 16 MB.
+    :param ttl_seconds: SHIELD_RESPONSE_CACHE_TTL, default 60. 0 disables the cache.
+    """
+    self.max_entries = max_entries if max_entries is not None else int(os.getenv("SHIELD_RESPONSE_CACHE_MAX_ENTRIES", "256"))
+    self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("SHIELD_RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+    self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SHIELD_RESPONSE_CACHE_TTL", "60"))
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+
+  @property
+  def enabled(self):
+    return self.ttl_seconds > 0 and self.max_entries > 0
+
+  @staticmethod
+  def make_key(path, query_items):
+    """
+    :param path: The request path.
+    :param query_items: (name, value) pairs of the query string.
+    :return: A hashable key that also captures the current write generation.
+    """
+    return path, tuple(sorted(query_items)), write_generation.value
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      if time.monotonic() - entry.stored_at > self.ttl_seconds:
+        self._remove(key)
+        return None
+      self._entries.move_to_end(key)
+      return entry
+
+  def put(self, key, body, headers):
+    """
+    Stores a response body with a strong ETag derived from its bytes.
+    :param key: A key from make_key.
+    :param body: The full response body.
+    :param headers: Response headers to replay (content-type and the like).
+    :return: The stored CachedResponse (also returned when it is too big to keep).
+    """
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    entry = CachedResponse(body, headers, etag, time.monotonic())
+    if len(body) > self.max_bytes:
+      return entry
+
+    with self._lock:
+      if key in self._entries:
+        self._remove(key)
+      self._entries[key] = entry
+      self._bytes += len(body)
+      while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+        self._remove(next(iter(self._entries)))
+    return entry
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def _remove(self, key):
+    entry = self._entries.pop(key)
+    self._bytes -= len(entry.body)
+
+
+def etag_matches(if_none_match, etag):
+  """
+  :param if_none_match: The raw If-None-Match header, possibly a list or "*".
+  :param etag: The current strong ETag.
+  :return: True if the client already has this representation.
+  """
+  if not if_none_match:
+    return False
+  candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+  return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
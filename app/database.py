@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 import os
@@ -23,6 +24,31 @@ engine = create_engine(
 # creating session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def async_database_url(url):
+  """
+  Maps the sync database URL onto its asyncio driver: aiosqlite for SQLite, asyncpg for
+  Postgres. asyncpg spells libpq's sslmode as ssl and has no channel_binding option.
+  :param url: The sync SQLAlchemy URL (string or URL object).
+  :return: The equivalent async URL object.
+  """
+  url = make_url(url)
+  if url.get_backend_name() == "sqlite":
+    return url.set(drivername="sqlite+aiosqlite")
+  if url.get_backend_name() == "postgresql":
+    query = dict(url.query)
+    if "sslmode" in query:
+      query["ssl"] = query.pop("sslmode")
+    query.pop("channel_binding", None)
+    return url.set(drivername="postgresql+asyncpg", query=query)
+  return url
+
+
+# async engine and session factory used by the API endpoints. Scripts and the pipeline
+# keep using the sync engine above.
+async_engine = create_async_engine(async_database_url(SQLALCHEMY_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # create base class for all models
 Base = declarative_base()
 
@@ -32,4 +58,32 @@ def get_db():
   try:
     yield db
   finally:
-    db.close()
\ No newline at end of file
+    db.close()
+
+
+# Async dependency for the endpoints
+async def get_async_db():
+  async with AsyncSessionLocal() as db:
+    yield db
+
+
+# Dependency for endpoints that stream their body: the stream outlives the request's
+# dependencies, so it opens its own session from this factory
+def get_async_session_factory():
+  return AsyncSessionLocal
+
+
+def dialect_insert(db, model):
+  """
+  Returns an INSERT construct for the session's backend, so callers can attach
+  ON CONFLICT clauses. Both SQLite and Postgres dialects support them.
+  :param db: The database session (or connection) the statement will be executed on.
+  :param model: The mapped class (or table) to insert into.
+  :return: A dialect specific Insert object.
+  """
+  bind = db.get_bind() if hasattr(db, "get_bind") else db
+  if bind.dialect.name == "postgresql":
+    from sqlalchemy.dialects.postgresql import insert
+  else:
+    from sqlalchemy.dialects.sqlite import insert
+  return insert(model)
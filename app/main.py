@@ -1,17 +1,33 @@
+import csv
+import io
+import json
 import os
+import time
 from contextlib import asynccontextmanager
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from itertools import islice
 from fastapi import FastAPI
 from dotenv import load_dotenv
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from fastapi import Depends, HTTPException
+from typing import Literal, Optional
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
+from fastapi import Depends, HTTPException, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from starlette.responses import PlainTextResponse, RedirectResponse
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, RedirectResponse, Response, StreamingResponse
 
-from app.database import get_db, engine
+from app.core import metrics
+from app.core.response_cache import ResponseCache, bump_write_generation, etag_matches
+from app.database import get_async_db, get_async_session_factory, get_db, engine
 from app.models.threat import Threat
-from app.schemas.threat import ThreatResponse, ThreatOverride, ArticleData, AIAnalysisResult
+from app.schemas.threat import ThreatResponse, ThreatOverride, ThreatPage, ArticleData, AIAnalysisResult
+from app.services.archive import ThreatArchive
+from app.services.job_queue import AnalysisQueue
+from app.services.rollup import ThreatRollups
+from app.services.search import search_condition, search_threats_page
+from app.services.triage import TriageFilter
+from app.utils.pagination import THREAT_FIELD_COLUMNS, build_page, page_statement, parse_fields, serialize_threat
 
 # loading environment variables
 load_dotenv()
@@ -19,10 +35,9 @@ load_dotenv()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # create tables on startup (idempotent — safe to run every cold start)
-    from app.database import Base
-    import app.models.threat  # noqa: ensure model is registered
-    Base.metadata.create_all(bind=engine)
+    # create tables and indexes on startup, only when the schema fingerprint says they changed
+    from app.migrations import upgrade_if_needed
+    upgrade_if_needed(engine)
     yield
 
 
@@ -35,54 +50,184 @@ app = FastAPI(
 )
 
 
+response_cache = ResponseCache()
+# streamed responses are never buffered into the cache
+UNCACHED_PATHS = {"/api/threats/export"}
+# rows fetched per round trip while streaming an export
+EXPORT_BATCH_SIZE = 500
+
+
+@app.middleware("http")
+async def cache_threat_reads(request: Request, call_next):
+  """
+  Serves repeated GETs on the threat read endpoints from memory until the next write,
+  with a strong ETag so polling clients get a 304 and no body at all.
+  """
+  if (request.method != "GET" or not request.url.path.startswith("/api/threats")
+      or request.url.path in UNCACHED_PATHS or not response_cache.enabled):
+    return await call_next(request)
+
+  key = response_cache.make_key(request.url.path, request.query_params.multi_items())
+  entry = response_cache.get(key)
+  if entry is None:
+    response = await call_next(request)
+    if response.status_code != 200:
+      return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    headers = {name: value for name, value in response.headers.items() if name.lower() != "content-length"}
+    entry = response_cache.put(key, body, headers)
+
+  headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+  if etag_matches(request.headers.get("if-none-match"), entry.etag):
+    return Response(status_code=304, headers=headers)
+  return Response(content=entry.body, status_code=200, headers={**entry.headers, **headers})
+
+
+@app.middleware("http")
+async def measure_requests(request: Request, call_next):
+  """
+  Records latency and database statements per route. Registered last so it is the
+  outermost middleware and also sees responses served from the response cache.
+  """
+  queries = metrics.RequestQueries(request.scope)
+  token = metrics.current_request_queries.set(queries)
+  started = time.perf_counter()
+  status = 500
+  try:
+    response = await call_next(request)
+    status = response.status_code
+    return response
+  finally:
+    metrics.current_request_queries.reset(token)
+    metrics.record_request(request.method, status, time.perf_counter() - started, queries)
+
+
+def encode_csv_row(values):
+  """One CSV line, with None written as an empty cell"""
+  buffer = io.StringIO()
+  csv.writer(buffer).writerow(["" if value is None else value for value in values])
+  return buffer.getvalue()
+
+
+async def _page(db: AsyncSession, stmt, limit, cursor, fields):
+  """Runs a paginated list query, turning a bad cursor or field name into a 400"""
+  try:
+    stmt, field_names = page_statement(stmt, limit, cursor, fields)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  threats = (await db.execute(stmt)).scalars().all()
+  return build_page(threats, limit, field_names)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+  """Pipeline, Gemini, database and HTTP metrics of this process, in Prometheus text format"""
+  return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/", include_in_schema=False)
-def read_root():
+async def read_root():
   return RedirectResponse(url="/docs")
 
 
-@app.get("/api/threats", response_model=List[ThreatResponse])
-def get_all_threats(db: Session = Depends(get_db)):
-  """Get all threats that AI has identified"""
-  threats = db.query(Threat).all()
-  return threats
+@app.get("/api/threats", response_model=ThreatPage)
+async def get_all_threats(limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                          fields: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+  """Get all threats that AI has identified, newest first, one page at a time"""
+  return await _page(db, select(Threat), limit, cursor, fields)
 
 
 @app.get("/api/threats/count")  # MOVED THIS BEFORE {threat_id}
-def count_threats(db: Session = Depends(get_db)):
+async def count_threats(db: AsyncSession = Depends(get_async_db)):
   """How many threats do we have?"""
-  total = db.query(Threat).count()
+  total = await db.scalar(select(func.count()).select_from(Threat))
   return {"total_threats": total}
 
 
-@app.get("/api/threats/recent", response_model=List[ThreatResponse])
-def get_recent_threats(days: int = 3, db: Session = Depends(get_db)):
+@app.get("/api/threats/recent", response_model=ThreatPage)
+async def get_recent_threats(days: int = 3, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                             fields: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
   """Gets all 'recent' threats (default last 3 days)"""
   cutoff_date = datetime.now() - timedelta(days=days)
-  threats = db.query(Threat).filter(Threat.created_at >= cutoff_date).all()
-  return threats
-
-
-@app.get("/api/threats/search")
-def search_threats(q: str, db: Session = Depends(get_db)):
-  """Search threats by keywords in title or summary"""
-  threats = db.query(Threat).filter(
-      (Threat.title.contains(q)) | (Threat.ai_summary.contains(q))
-  ).all()
-  return threats
+  return await _page(db, select(Threat).where(Threat.created_at >= cutoff_date), limit, cursor, fields)
+
+
+@app.get("/api/threats/search", response_model=ThreatPage)
+async def search_threats(q: str, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                         fields: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+  """Full-text search over title, description, summary, reason and keywords, best matches first"""
+  try:
+    return await db.run_sync(search_threats_page, q, limit, cursor, fields)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/threats/export")
+async def export_threats(format: Literal["ndjson", "csv"] = "ndjson", days: Optional[int] = None,
+                         min_level: Optional[int] = None, requires_review: Optional[bool] = None,
+                         q: Optional[str] = None, fields: Optional[str] = None,
+                         session_factory=Depends(get_async_session_factory)):
+  """Streams every matching threat as NDJSON or CSV, for offline analysis. Memory use does not grow with the row count."""
+  try:
+    field_names = parse_fields(fields)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+
+  columns = {Threat.id, Threat.created_at}
+  for field in field_names:
+    columns.update(THREAT_FIELD_COLUMNS[field])
+  stmt = select(Threat).options(load_only(*columns)).order_by(Threat.created_at.desc(), Threat.id.desc())
+  if days is not None:
+    stmt = stmt.where(Threat.created_at >= datetime.now() - timedelta(days=days))
+  if min_level is not None:
+    stmt = stmt.where(Threat.effective_threat_level >= min_level)
+  if requires_review is not None:
+    stmt = stmt.where(Threat.requires_review == requires_review)
+
+  async def rows():
+    # the stream outlives the request's dependencies, so it owns its session
+    async with session_factory() as db:
+      filtered = stmt
+      if q:
+        filtered = filtered.where(search_condition(db.get_bind().dialect.name, q))
+      result = await db.stream(filtered.execution_options(yield_per=EXPORT_BATCH_SIZE))
+      if format == "csv":
+        yield encode_csv_row(field_names)
+      async for threat in result.scalars():
+        item = serialize_threat(threat, field_names)
+        if format == "csv":
+          yield encode_csv_row([item[field] for field in field_names])
+        else:
+          yield json.dumps(item, default=str) + "\n"
+
+  media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+  headers = {"Content-Disposition": f"attachment; filename=threats.{format}"}
+  return StreamingResponse(rows(), media_type=media_type, headers=headers)
+
+
+# a sync endpoint: reading the archive is blocking file IO, so it runs in the threadpool
+@app.get("/api/archive/threats")
+def query_archive(start: Optional[date] = None, end: Optional[date] = None, min_level: Optional[int] = None,
+                  max_level: Optional[int] = None, category: Optional[str] = None,
+                  limit: Optional[int] = Query(None, ge=1)):
+  """Streams archived (expired) threats as NDJSON, oldest day first, filtered by day range, level and category."""
+  records = ThreatArchive().query(start, end, min_level, max_level, category)
+  lines = (json.dumps(record) + "\n" for record in islice(records, limit))
+  return StreamingResponse(lines, media_type="application/x-ndjson")
 
 
 @app.get("/api/threats/fury-overview", response_class=PlainTextResponse)
-def fury_overview(db: Session = Depends(get_db)):
+async def fury_overview(db: AsyncSession = Depends(get_async_db)):
   """Overview for Director Fury, to get a general idea of all threats"""
   cutoff_date = datetime.now() - timedelta(days=3)
-  threat_count = db.query(Threat).count()
-  high_threat_count = db.query(Threat).filter(Threat.ai_threat_level >= 7).count()
-  recent_threats = db.query(Threat).filter(Threat.created_at >= cutoff_date).all()
-  recent_categories = db.query(Threat.ai_category).filter(
-      Threat.created_at >= cutoff_date
-  ).distinct().all()
-  threat_titles = [threat.title for threat in recent_threats]
-  category_names = [cat[0] for cat in recent_categories]
+  # counts and categories come from the rollup in one read, only the titles touch threats
+  stats = await db.run_sync(ThreatRollups().summary, days=3)
+  threat_count = stats["total_threats"]
+  high_threat_count = stats["high_threats"]
+  threat_titles = list(await db.scalars(
+      select(Threat.title).where(Threat.created_at >= cutoff_date).order_by(Threat.created_at.desc())
+  ))
+  category_names = list(stats["by_category"])
   shield_logo = """
                        AAAAAAAAA                       
                  AAAAAAAAAAAAAAAAAAAAA                 
@@ -125,20 +270,40 @@ AAAA BAAAAA EAAAAAAA   AAAAAAAAA   AAAAAA MAAAAAAD AAAA
           f"Have a good day Director Fury.")
 
 
-@app.get("/api/threats/pending_review", response_model=List[ThreatResponse])
-def get_threats_to_review(db: Session = Depends(get_db)):
+@app.get("/api/threats/stats")
+async def threat_stats(days: int = Query(3, ge=1, le=30), db: AsyncSession = Depends(get_async_db)):
+  """Dashboard numbers: totals, plus per category, per level and per hour counts for the last N days"""
+  return await db.run_sync(ThreatRollups().summary, days=days)
+
+
+@app.get("/api/triage/agreement")
+async def triage_agreement(db: AsyncSession = Depends(get_async_db)):
+  """How often Gemini agreed with the triage safe score, per score bucket, for tuning SHIELD_TRIAGE_SAFE_CUTOFF"""
+  return await db.run_sync(lambda session: TriageFilter().agreement(session))
+
+
+@app.get("/api/queue/stats")
+async def queue_stats(db: AsyncSession = Depends(get_async_db)):
+  """Analysis jobs per status, and whether the workers are paused for the Gemini quota"""
+  return await db.run_sync(lambda session: AnalysisQueue().stats(session))
+
+
+@app.get("/api/threats/pending_review", response_model=ThreatPage)
+async def get_threats_to_review(limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                                fields: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
   """Get all threats that a human should review if AI analysis presents low confidence."""
-  review_threats = db.query(Threat).filter(Threat.requires_review).all()
-  return review_threats
+  return await _page(db, select(Threat).where(Threat.requires_review), limit, cursor, fields)
 
 
 @app.put("/api/threats/{threat_id}/review")
-def review_threat(threat_id: int, review_data: ThreatOverride, db: Session = Depends(get_db)):
+async def review_threat(threat_id: int, review_data: ThreatOverride, db: AsyncSession = Depends(get_async_db)):
   """Human review/override of a threat"""
-  threat = db.query(Threat).filter(Threat.id == threat_id).first()
+  threat = await db.get(Threat, threat_id)
   if not threat:
     raise HTTPException(status_code=404, detail="Threat not found")
 
+  old_level, old_category = threat.threat_level, threat.category
+
   # update with human review
   threat.human_threat_level = review_data.human_threat_level
   threat.human_category = review_data.human_category
@@ -146,21 +311,24 @@ def review_threat(threat_id: int, review_data: ThreatOverride, db: Session = Dep
   threat.reviewed_by = review_data.reviewed_by
   threat.reviewed_at = datetime.now()
 
-  db.commit()
+  await db.run_sync(ThreatRollups().record_review, threat.created_at, old_level, old_category,
+                    threat.threat_level, threat.category)
+  await db.commit()
+  bump_write_generation()
   return {"message": "Threat reviewed successfully"}
 
 
-@app.get("/api/threats/level/{min_level}", response_model=List[ThreatResponse])
-def get_threats_by_level(min_level: int, db: Session = Depends(get_db)):
-  """Get threats at or above a certain threat level"""
-  threats = db.query(Threat).filter(Threat.ai_threat_level >= min_level).all()
-  return threats
+@app.get("/api/threats/level/{min_level}", response_model=ThreatPage)
+async def get_threats_by_level(min_level: int, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                               fields: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+  """Get threats at or above a certain threat level, human overrides included"""
+  return await _page(db, select(Threat).where(Threat.effective_threat_level >= min_level), limit, cursor, fields)
 
 
 @app.get("/api/threats/{threat_id}", response_model=ThreatResponse)
-def get_one_threat(threat_id: int, db: Session = Depends(get_db)):
+async def get_one_threat(threat_id: int, db: AsyncSession = Depends(get_async_db)):
   """Get a specific threat by its ID"""
-  threat = db.query(Threat).filter(Threat.id == threat_id).first()
+  threat = await db.get(Threat, threat_id)
   if not threat:
     raise HTTPException(status_code=404, detail="Threat not found")
   return threat
@@ -169,28 +337,24 @@ def get_one_threat(threat_id: int, db: Session = Depends(get_db)):
 _bearer = HTTPBearer(auto_error=False)
 
 
+# stays a sync endpoint on the sync engine: the pipeline services (requests, genai) block,
+# so FastAPI runs it in its threadpool
 @app.get("/api/cron/run-pipeline")
-def cron_run_pipeline(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer), db: Session = Depends(get_db)):
-  """Vercel Cron Job endpoint — runs the full threat analysis pipeline. Requires Bearer token matching CRON_SECRET."""
+def cron_run_pipeline(budget: Optional[float] = Query(None, gt=0, description="seconds this invocation may spend"),
+                      credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer), db: Session = Depends(get_db)):
+  """
+  Vercel Cron Job endpoint — runs the threat analysis pipeline for at most the time budget
+  (SHIELD_CRON_BUDGET_SECONDS, or less with ?budget=). Progress is checkpointed, so a
+  "partial" run resumes where it stopped on the next call. Requires Bearer token matching CRON_SECRET.
+  """
   cron_secret = os.getenv("CRON_SECRET")
   token = credentials.credentials if credentials else None
   if cron_secret and token != cron_secret:
     raise HTTPException(status_code=401, detail="Unauthorized")
 
-  from app.services.news_fetcher import NewsFetcher
-  from app.services.threat_processor import ThreatProcessor
-
-  # remove threats older than 5 days
-  cutoff = datetime.now() - timedelta(days=5)
-  deleted = db.query(Threat).filter(Threat.created_at < cutoff).delete()
-  db.commit()
-
-  fetcher = NewsFetcher()
-  processor = ThreatProcessor()
-  articles = fetcher.fetch_and_convert(db)
-
-  if not articles.articles:
-    return {"status": "no_new_articles", "deleted_old": deleted}
+  from app.services.pipeline_run import BudgetedPipeline
 
-  saved = processor.process_articles(articles, db)
-  return {"status": "ok", "new_threats": len(saved), "deleted_old": deleted}
\ No newline at end of file
+  pipeline = BudgetedPipeline()
+  if budget:
+    pipeline.budget_seconds = min(budget, pipeline.budget_seconds)
+  return pipeline.run(db)
\ No newline at end of file
@@ -0,0 +1,138 @@
+import hashlib
+
+from sqlalchemy import delete, inspect, select, text
+
+from app.database import Base
+from app.models.schema_version import SchemaVersion
+from app.models.threat import Threat
+from app.models.threat_rollup import ThreatRollup
+from app.services.rollup import ThreatRollups
+from app.services.search import POSTGRES_FTS_DDL, SQLITE_FTS_DDL, install_search_index
+
+# Generated columns added to threats after it first shipped: (name, SQL type, expression)
+THREAT_GENERATED_COLUMNS = [
+  ("effective_threat_level", "INTEGER", "coalesce(human_threat_level, ai_threat_level)"),
+  ("effective_category", "VARCHAR(50)", "coalesce(human_category, ai_category)"),
+]
+
+# Plain columns added to threats later, with the statement that fills them for old rows:
+# (name, SQL type, {dialect: backfill})
+THREAT_ADDED_COLUMNS = [
+  ("created_day", "DATE", {
+    "sqlite": "UPDATE threats SET created_day = date(created_at) WHERE created_day IS NULL",
+    "postgresql": "UPDATE threats SET created_day = (created_at AT TIME ZONE 'UTC')::date WHERE created_day IS NULL",
+  }),
+  ("simhash", "BIGINT", {}),
+  ("related_urls", "JSON", {}),
+]
+
+
+def register_models():
+  import app.models.threat  # noqa: ensure model is registered
+  import app.models.seen_article  # noqa: ensure model is registered
+  import app.models.analysis_cache  # noqa: ensure model is registered
+  import app.models.threat_rollup  # noqa: ensure model is registered
+  import app.models.source_state  # noqa: ensure model is registered
+  import app.models.triage_agreement  # noqa: ensure model is registered
+  import app.models.schema_version  # noqa: ensure model is registered
+  import app.models.analysis_job  # noqa: ensure model is registered
+  import app.models.queue_pause  # noqa: ensure model is registered
+  import app.models.pipeline_checkpoint  # noqa: ensure model is registered
+
+
+def schema_fingerprint():
+  """
+  A hash of everything upgrade creates: every table, column, type and index in the models,
+  plus the added columns and search DDL above. Any change to them changes the fingerprint,
+  so a model change can't be shipped without its upgrade running.
+  :return: A hex sha256 digest.
+  """
+  register_models()
+  parts = []
+  for table in Base.metadata.sorted_tables:
+    parts.append(f"table {table.name}")
+    for column in table.columns:
+      computed = column.computed.sqltext if column.computed is not None else ""
+      parts.append(f"{column.name} {column.type!r} {column.nullable} {column.primary_key} {computed}")
+    for index in sorted(table.indexes, key=lambda index: index.name):
+      parts.append(f"index {index.name} {[column.name for column in index.columns]} {index.unique}")
+  parts.extend(repr(item) for item in (THREAT_GENERATED_COLUMNS, THREAT_ADDED_COLUMNS, SQLITE_FTS_DDL, POSTGRES_FTS_DDL))
+  return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def upgrade(engine):
+  """
+  Brings the database schema up to date: creates missing tables, then applies the
+  pieces create_all can't do on an existing database (new columns, new indexes, the
+  full-text search index). Idempotent, and records the schema fingerprint it produced.
+  :param engine: The engine to upgrade.
+  """
+  register_models()
+
+  Base.metadata.create_all(bind=engine)
+  with engine.begin() as connection:
+    add_missing_columns(connection)
+    create_missing_indexes(connection)
+    install_search_index(connection)
+    backfill_rollups(connection)
+    connection.execute(delete(SchemaVersion))
+    connection.execute(SchemaVersion.__table__.insert().values(fingerprint=schema_fingerprint()))
+
+
+def upgrade_if_needed(engine):
+  """
+  Cold start path: one cheap read when the database already matches the models, the full
+  upgrade only when it doesn't.
+  :param engine: The engine to check.
+  :return: True if an upgrade ran.
+  """
+  fingerprint = schema_fingerprint()
+  with engine.connect() as connection:
+    if inspect(connection).has_table(SchemaVersion.__tablename__):
+      if connection.execute(select(SchemaVersion.fingerprint)).scalar() == fingerprint:
+        return False
+  upgrade(engine)
+  return True
+
+
+def add_missing_columns(connection):
+  """
+  Adds the columns of THREAT_GENERATED_COLUMNS and THREAT_ADDED_COLUMNS to a threats table
+  created before they existed, and backfills the plain ones. SQLite can only add VIRTUAL
+  generated columns with ALTER TABLE; they are still indexable.
+  :param connection: An open SQLAlchemy connection inside a transaction.
+  """
+  existing = {column["name"] for column in inspect(connection).get_columns("threats")}
+  dialect = connection.dialect.name
+  storage = "VIRTUAL" if dialect == "sqlite" else "STORED"
+  for name, sql_type, expression in THREAT_GENERATED_COLUMNS:
+    if name not in existing:
+      connection.execute(text(
+          f"ALTER TABLE threats ADD COLUMN {name} {sql_type} GENERATED ALWAYS AS ({expression}) {storage}"
+      ))
+  for name, sql_type, backfill in THREAT_ADDED_COLUMNS:
+    if name not in existing:
+      connection.execute(text(f"ALTER TABLE threats ADD COLUMN {name} {sql_type}"))
+      if dialect in backfill:
+        connection.execute(text(backfill[dialect]))
+
+
+def create_missing_indexes(connection):
+  """
+  create_all only creates indexes together with their table, so indexes added to an
+  existing model are created here.
+  :param connection: An open SQLAlchemy connection inside a transaction.
+  """
+  for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+      index.create(connection, checkfirst=True)
+
+
+def backfill_rollups(connection):
+  """
+  Fills threat_rollups from existing threats the first time it is created.
+  :param connection: An open SQLAlchemy connection inside a transaction.
+  """
+  rollup_empty = connection.execute(select(ThreatRollup.hour).limit(1)).first() is None
+  if rollup_empty and connection.execute(select(Threat.id).limit(1)).first() is not None:
+    ThreatRollups().rebuild(connection)
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, Float, JSON
+from app.database import Base
+
+class AnalysisCacheEntry(Base):
+  __tablename__ = "analysis_cache"
+
+  # sha256 of the normalized title + description + source
+  key = Column(String(64), primary_key=True)
+
+  # The AIAnalysisResult payload Gemini returned for this content
+  result = Column(JSON, nullable=False)
+
+  # Unix timestamps, used for TTL expiry and LRU eviction
+  created_at = Column(Float, nullable=False)
+  last_used_at = Column(Float, nullable=False, index=True)
+
+  def __repr__(self):
+    """String representation for debugging"""
+    return f"<AnalysisCacheEntry(key='{self.key[:12]}...')>"
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Index, Integer, String, Float, JSON, Text
+from app.database import Base
+
+class AnalysisJob(Base):
+  __tablename__ = "analysis_jobs"
+
+  id = Column(Integer, primary_key=True, index=True)
+
+  # One job per article, enqueueing the same URL twice is a no-op
+  source_url = Column(String(500), nullable=False, unique=True)
+
+  # The ArticleData to analyze, as JSON
+  article = Column(JSON, nullable=False)
+
+  # pending -> leased -> done, or back to pending with a delay until max attempts, then failed
+  status = Column(String(20), nullable=False, default="pending")
+  attempts = Column(Integer, nullable=False, default=0)
+  last_error = Column(Text)
+
+  # Unix timestamps: when the job may next be claimed, and until when its lease holds
+  available_at = Column(Float, nullable=False)
+  lease_owner = Column(String(100))
+  lease_expires_at = Column(Float)
+
+  created_at = Column(Float, nullable=False)
+  finished_at = Column(Float)
+
+  __table_args__ = (
+    # the claim query: the oldest claimable jobs of a status
+    Index("ix_analysis_jobs_status_available", "status", "available_at"),
+  )
+
+  def __repr__(self):
+    """String representation for debugging"""
+    return f"<AnalysisJob(id={self.id}, status='{self.status}', attempts={self.attempts})>"
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, Float, JSON
+from app.database import Base
+
+class PipelineCheckpoint(Base):
+  __tablename__ = "pipeline_checkpoints"
+
+  # Name of the resumable run, e.g. "cron"
+  name = Column(String(50), primary_key=True)
+
+  # Where the current cycle stands (phase, counters), see BudgetedPipeline
+  state = Column(JSON, nullable=False)
+
+  # Unix timestamp of the last saved step
+  updated_at = Column(Float, nullable=False)
+
+  def __repr__(self):
+    """String representation for debugging"""
+    return f"<PipelineCheckpoint(name='{self.name}', phase='{self.state.get('phase')}')>"
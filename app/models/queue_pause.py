@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, Float, Text
+from app.database import Base
+
+class QueuePause(Base):
+  __tablename__ = "queue_pauses"
+
+  # Name of the paused queue, e.g. "analysis"
+  queue = Column(String(50), primary_key=True)
+
+  # Unix timestamp, no worker claims jobs from the queue before it
+  paused_until = Column(Float, nullable=False)
+  reason = Column(Text)
+
+  def __repr__(self):
+    """String representation for debugging"""
+    return f"<QueuePause(queue='{self.queue}', until={self.paused_until})>"
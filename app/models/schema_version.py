@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+class SchemaVersion(Base):
+  __tablename__ = "schema_version"
+
+  # app.migrations.schema_fingerprint() of the schema the last upgrade produced
+  fingerprint = Column(String(64), primary_key=True)
+  applied_at = Column(DateTime(timezone=True), server_default=func.now())
+
+  def __repr__(self):
+    """String representation for debugging"""
+    return f"<SchemaVersion(fingerprint='{self.fingerprint[:12]}...')>"
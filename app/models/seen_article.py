@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+class SeenArticle(Base):
+  __tablename__ = "seen_articles"
+
+  # Every article URL that has already been sent through AI analysis, threat or not.
+  # Lets the fetcher skip articles the AI rejected on an earlier run.
+  url = Column(String(500), primary_key=True)
+  seen_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+  def __repr__(self):
+    """String representation for debugging"""
+    return f"<SeenArticle(url='{self.url[:50]}...')>"
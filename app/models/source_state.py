@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+class SourceState(Base):
+  __tablename__ = "source_states"
+
+  # NewsSource.key, the request URL with its query (never the API key)
+  key = Column(String(500), primary_key=True)
+
+  # Validators from the last 200 response, sent back so an unchanged source costs a 304
+  etag = Column(String(500))
+  last_modified = Column(String(100))
+
+  checked_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+  def __repr__(self):
+    """String representation for debugging"""
+    return f"<SourceState(key='{self.key[:50]}...')>"
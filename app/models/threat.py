@@ -1,7 +1,17 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Text, Boolean, JSON
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, Column, Integer, String, Date, DateTime, Float, Text, Boolean, JSON, Computed, Index
 from sqlalchemy.sql import func
 from app.database import Base
 
+def _created_day(context):
+  """Default for created_day: the UTC date of the row's created_at"""
+  created_at = context.get_current_parameters().get("created_at") or datetime.now(timezone.utc)
+  if created_at.tzinfo is not None:
+    created_at = created_at.astimezone(timezone.utc)
+  return created_at.date()
+
+
 class Threat(Base):
   __tablename__ = "threats"
 
@@ -15,6 +25,10 @@ class Threat(Base):
   source_url = Column(String(500), unique=True, nullable=False)  # Unique prevents duplicate articles
   published_at = Column(DateTime, nullable=True)
 
+  # Near-duplicate copies of the same story (syndicated wire copies, local rewrites)
+  simhash = Column(BigInteger, nullable=True)      # SimHash of title + description
+  related_urls = Column(JSON, nullable=True)       # URLs of the other copies
+
   # AI Analysis Results - REQUIRED fields (nothing gets stored without AI analysis)
   ai_threat_level = Column(Integer, nullable=False)  # 1-10 scale from AI
   ai_category = Column(String(50), nullable=False)   # cyber, environmental, etc.
@@ -30,12 +44,27 @@ class Threat(Base):
   reviewed_by = Column(String(100), nullable=True)        # Username of reviewer
   reviewed_at = Column(DateTime, nullable=True)           # When human reviewed
 
+  # Effective values - generated by the database from the columns above (human override
+  # takes precedence), so filters and aggregates can use an index on them
+  effective_threat_level = Column(Integer, Computed("coalesce(human_threat_level, ai_threat_level)", persisted=True))
+  effective_category = Column(String(50), Computed("coalesce(human_category, ai_category)", persisted=True))
+
   # System metadata
-  created_at = Column(DateTime(timezone=True), server_default=func.now())
+  # set in Python as well so every row carries microseconds, which keeps the
+  # (created_at, id) keyset used for pagination strictly ordered on SQLite
+  created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),
+                      server_default=func.now(), index=True)
   updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+  # UTC day of created_at - retention expires whole days through this index in small batches
+  created_day = Column(Date, default=_created_day, index=True)
 
   # Flags
-  requires_review = Column(Boolean, default=False)    # Flag if AI confidence is low
+  requires_review = Column(Boolean, default=False, index=True)    # Flag if AI confidence is low
+
+  __table_args__ = (
+    Index("ix_threats_level_created", "effective_threat_level", "created_at"),
+    Index("ix_threats_category_created", "effective_category", "created_at"),
+  )
 
   # Computed properties for the API response
   @property
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, DateTime, Integer
+from app.database import Base
+
+class ThreatRollup(Base):
+  __tablename__ = "threat_rollups"
+
+  # One row per (hour, category, level) with how many threats fall into it.
+  # Maintained incrementally by the pipeline, the review endpoint and retention.
+  hour = Column(DateTime, primary_key=True)                # created_at truncated to the hour, UTC
+  category = Column(String(50), primary_key=True)          # effective category
+  threat_level = Column(Integer, primary_key=True)         # effective threat level, 1-10
+  count = Column(Integer, nullable=False, default=0)
+
+  def __repr__(self):
+    """String representation for debugging"""
+    return f"<ThreatRollup(hour={self.hour}, category='{self.category}', level={self.threat_level}, count={self.count})>"
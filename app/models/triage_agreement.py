@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer
+from app.database import Base
+
+class TriageAgreement(Base):
+  __tablename__ = "triage_agreement"
+
+  # Triage safe score of the analyzed articles, in tenths (0 = score below 0.1, 9 = 0.9 and up)
+  bucket = Column(Integer, primary_key=True)
+
+  # What Gemini decided for the articles in that bucket
+  llm_threats = Column(Integer, nullable=False, default=0)
+  llm_safe = Column(Integer, nullable=False, default=0)
+
+  def __repr__(self):
+    """String representation for debugging"""
+    return f"<TriageAgreement(bucket={self.bucket}, threats={self.llm_threats}, safe={self.llm_safe})>"
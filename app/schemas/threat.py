@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 
 # What comes from news sources
 class ArticleData(BaseModel):
@@ -24,6 +24,7 @@ class AIAnalysisResult(BaseModel):
   confidence: float  # 0-1, how sure AI is
   title: str
   reason: str
+  article_id: Optional[str] = None  # echoed back so results can be matched to articles
 
 # What gets stored in database (combination of article and AI analysis)
 class ThreatCreate(BaseModel):
@@ -59,6 +60,7 @@ class ThreatResponse(BaseModel):
   description: Optional[str]
   source: str
   source_url: str
+  related_urls: Optional[List[str]] = None  # other outlets' copies of the same story
 
   # Only show final values (not the AI/human breakdown)
   threat_level: int  # This will be the final value
@@ -74,4 +76,9 @@ class ThreatResponse(BaseModel):
   has_human_review: bool  # Just a boolean, not the details
 
   class Config:
-    from_attributes = True
\ No newline at end of file
+    from_attributes = True
+
+# One page of a list endpoint. Items only hold the fields asked for with ?fields=
+class ThreatPage(BaseModel):
+  items: List[Dict[str, Any]]
+  next_cursor: Optional[str] = None  # pass back as ?cursor= to get the next page
@@ -1,10 +1,16 @@
+import json
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from dotenv import load_dotenv
-from google import genai
-from google.genai.errors import ClientError
-
+from app.core import metrics
+from app.core.clients import gemini_client, gemini_errors
+from app.core.rate_limit import backoff_delay, estimate_tokens, limiter, retry_after
 from app.schemas.threat import ArticleData, ListArticleData, AIAnalysisResult
+from app.services.prompt_encoder import PromptEncoder
+
+logger = logging.getLogger(__name__)
 
 
 class AIAnalyzer:
@@ -12,26 +18,240 @@ class AIAnalyzer:
   Leverages Gemini's API to perform an analysis on article data received via
   NewsAPI. Will be able to assess an article and provide a threat level, category,
   summary, list of keywrods, and how confident it is.
+
+  Large batches are split into chunks that are analyzed concurrently, so the wall time of
+  a batch depends on the concurrency limit rather than on how many articles there are.
   """
 
+  MODEL = "gemini-3.5-flash"
+
+  # rough size of one AIAnalysisResult in the response, reserved against the token quota
+  RESPONSE_TOKENS_PER_ARTICLE = 150
+
+  def __init__(self, client=None, chunk_size=None, max_concurrency=None, max_attempts=None,
+               retry_backoff=1.0, max_prompt_tokens=None, max_retry_wait=None, rate_limiter=None, encoder=None):
+    """
+    :param client: An object exposing client.models.generate_content, defaults to the
+                   process-wide genai.Client, created on first use.
+    :param chunk_size: Max articles per Gemini request (GEMINI_CHUNK_SIZE, default 20).
+    :param max_concurrency: Max requests in flight at once (GEMINI_MAX_CONCURRENCY, default 4).
+    :param max_attempts: Tries per chunk before it is given up on (GEMINI_MAX_ATTEMPTS, default 3).
+    :param retry_backoff: Base delay in seconds, jittered and doubled after every failed attempt.
+    :param max_prompt_tokens: Upper bound of the estimated tokens per request
+                              (GEMINI_MAX_PROMPT_TOKENS, default 30000).
+    :param max_retry_wait: Longest Retry-After worth waiting for after a 429
+                           (GEMINI_MAX_RETRY_WAIT, default 60). Beyond it, or beyond the rest of
+                           time_budget, the chunk is given up on and rate_limited is set.
+    :param rate_limiter: The RateLimiter calls go through, the process-wide Gemini one by default.
+    :param encoder: The PromptEncoder that writes the articles into the prompt.
+    """
+    self._client = client
+    self.chunk_size = chunk_size or int(os.getenv("GEMINI_CHUNK_SIZE", "20"))
+    self.max_concurrency = max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+    self.max_attempts = max_attempts or int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+    self.retry_backoff = retry_backoff
+    self.max_prompt_tokens = max_prompt_tokens or int(os.getenv("GEMINI_MAX_PROMPT_TOKENS", "30000"))
+    self.max_retry_wait = max_retry_wait or float(os.getenv("GEMINI_MAX_RETRY_WAIT", "60"))
+    self.rate_limiter = rate_limiter or limiter("gemini")
+    self.encoder = encoder or PromptEncoder()
+    # number of chunks that still failed after every retry on the last call
+    self.failed_chunks = 0
+    # set when Gemini answered 429 (quota exhausted) during the last call
+    self.rate_limited = False
+    # estimated prompt tokens of every request of the last call, retries not included
+    self.prompt_tokens = 0
+    # seconds the next analyze_articles call may spend, quota and retry waits included, or
+    # None for no limit; set by callers that run under a deadline, like the cron pipeline
+    self.time_budget = None
+    self._deadline = None
+
+  @property
+  def client(self):
+    if self._client is None:
+      self._client = gemini_client()
+    return self._client
+
+  def remaining_time(self):
+    """
+    :return: Seconds left of the time budget of the current call, on the rate limiter's
+             clock, or None without a budget.
+    """
+    if self._deadline is None:
+      return None
+    return max(self._deadline - self.rate_limiter.clock(), 0.0)
+
+  @staticmethod
+  def article_id(index):
+    """
+    The id sent to Gemini for the article at this position of the analyzed batch.
+    :param index: Position of the article in the ListArticleData given to analyze_articles.
+    :return: A short string id.
+    """
+    return str(index)
+
+  def chunk_token_budget(self):
+    """
+    Estimated tokens one request may use. Capped by max_prompt_tokens, and by the token
+    quota's share per request, so a full minute of requests does not run out of tokens
+    before it runs out of requests.
+    :return: Tokens per request.
+    """
+    per_request = self.rate_limiter.tokens_per_request()
+    return min(self.max_prompt_tokens, per_request) if per_request else self.max_prompt_tokens
+
+  def article_tokens(self, article: ArticleData):
+    """
+    :param article: An article to send.
+    :return: Estimated tokens it adds to a request, its part of the prompt and of the response.
+    """
+    return self.encoder.article_tokens(article) + self.RESPONSE_TOKENS_PER_ARTICLE
+
+  def chunk_articles(self, articles: list[ArticleData]):
+    """
+    Splits articles into chunks that stay under chunk_size articles and under the token
+    budget, keeping their order. Short articles make for fuller requests, so the request
+    quota goes further.
+    :param articles: The articles to split.
+    :return: A list of article lists.
+    """
+    budget = self.chunk_token_budget() - self.encoder.instruction_tokens()
+    chunks = []
+    chunk = []
+    used = 0
+    for article in articles:
+      tokens = self.article_tokens(article)
+      if chunk and (len(chunk) == self.chunk_size or used + tokens > budget):
+        chunks.append(chunk)
+        chunk = []
+        used = 0
+      chunk.append(article)
+      used += tokens
+    if chunk:
+      chunks.append(chunk)
+    return chunks
+
   # noinspection PyTypeChecker
+  def analyze_chunk(self, articles: list[ArticleData], article_ids: list[str]):
+    """
+    Leverages GeminiAPI to acquire analysis on one chunk of headlines, written into the
+    prompt by the PromptEncoder. Gemini is prompted to output data in a list of
+    AIAnalysisResult objects, as structured json output.
+    :param articles: The articles in this chunk.
+    :param article_ids: The id of each article, Gemini echoes it back in article_id.
+    :return: a list of dictionaries, one per analyzed article, or None when the quota
+             frees up only after the time budget ends (rate_limited is set).
+    """
+    prompt = self.encoder.encode(articles, article_ids)
+    prompt_tokens = estimate_tokens(prompt)
+    metrics.gemini_tokens.inc(prompt_tokens, kind="prompt_estimated")
+    tokens = prompt_tokens + self.RESPONSE_TOKENS_PER_ARTICLE * len(articles)
+    if self.rate_limiter.acquire(tokens, max_wait=self.remaining_time()) is None:
+      self.rate_limited = True
+      return None
+    with metrics.time_stage("llm_call"):
+      try:
+        response = self.client.models.generate_content(
+            model=self.MODEL,
+            contents=prompt,
+            config={
+              "response_mime_type": "application/json",
+              "response_schema": list[AIAnalysisResult]
+            },
+        )
+      except Exception:
+        metrics.gemini_requests.inc(outcome="error")
+        raise
+    metrics.gemini_requests.inc(outcome="ok")
+    self.record_usage(response)
+
+    with metrics.time_stage("parse"):
+      # a response blocked for safety has no text
+      if response.text is None:
+        raise ValueError("Gemini returned no text")
+      results = json.loads(response.text)
+    if not isinstance(results, list) or not all(isinstance(result, dict) for result in results):
+      raise ValueError(f"Gemini returned {type(results).__name__}, not a list of results")
+    return results
+
+  @staticmethod
+  def record_usage(response):
+    """Adds the prompt and response token counts Gemini reports to the metrics"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+      return
+    metrics.gemini_tokens.inc(getattr(usage, "prompt_token_count", None) or 0, kind="prompt")
+    metrics.gemini_tokens.inc(getattr(usage, "candidates_token_count", None) or 0, kind="response")
+
+  def analyze_chunk_with_retry(self, articles: list[ArticleData], article_ids: list[str]):
+    """
+    Analyzes one chunk, retrying it on its own when the call or the response parsing fails,
+    after the Retry-After Gemini asked for or else a jittered exponential backoff. A 429
+    holds every chunk through the shared rate limiter; when Gemini asks for more than
+    max_retry_wait or the rest of the time budget, or the attempts run out on a 429,
+    rate_limited is set instead. A backoff that would outlast the budget gives up the chunk.
+    :param articles: The articles in this chunk.
+    :param article_ids: The id of each article in the chunk.
+    :return: a list of dictionaries, or None if every attempt failed.
+    """
+    for attempt in range(1, self.max_attempts + 1):
+      try:
+        return self.analyze_chunk(articles, article_ids)
+      except Exception as e:
+        # google.genai is only imported once a call has failed
+        if not isinstance(e, ValueError) and not isinstance(e, gemini_errors()):
+          raise
+        quota = getattr(e, "code", None) == 429
+        delay = retry_after(e)
+        if delay is None:
+          delay = backoff_delay(attempt, self.retry_backoff)
+        logger.warning("Gemini chunk of %d articles failed (attempt %d/%d): %s",
+                       len(articles), attempt, self.max_attempts, e)
+        remaining = self.remaining_time()
+        if quota:
+          # the next acquire of every chunk waits this out
+          self.rate_limiter.back_off(delay)
+          if delay > self.max_retry_wait or (remaining is not None and delay > remaining) \
+              or attempt == self.max_attempts:
+            self.rate_limited = True
+            return None
+        elif remaining is not None and delay > remaining:
+          return None
+        if attempt < self.max_attempts:
+          metrics.api_retries.inc(provider="gemini", reason="rate_limited" if quota else "error")
+          if not quota:
+            time.sleep(delay)
+    return None
+
   def analyze_articles(self, articles: ListArticleData):
     """
-    Leverages GeminiAPI to acquire analysis on the current headlines. Gemini is prompted to output data
-    in a list of AIAnalysisResult objects, as structured json output.
+    Leverages GeminiAPI to acquire analysis on the current headlines. The articles are split
+    into chunks that are analyzed concurrently, and the results are merged back in article
+    order. A chunk that keeps failing is dropped without losing the rest of the batch.
+    Every article is sent with an id (see article_id) that Gemini echoes back.
     :param articles: ListArticleData object that Gemini can read once it is converted to a dictionary
-    :return: structured json data with analysis of each article.
-    """
-    load_dotenv()
-    apikey = os.getenv("GEMINI_API_KEY")
-    client = genai.Client(api_key=apikey)
-    input_dict = articles.model_dump()
-    response = client.models.generate_content(
-        model="gemini-3.5-flash",
-        contents=f"Read through these articles. Provide the following for EACH article: a boolean if it represents a threat or not, a threat-level from 1-10, a 1-2 word category representing the article, a brief summary of the article, a list of keywords, a float from 0.0-1.0 of how confident you are in your assessment, the original title of the article, and provide a brief statement explaining why or why not this article is a threat. Here are the articles: {str(input_dict)}",
-        config={
-          "response_mime_type": "application/json",
-          "response_schema": list[AIAnalysisResult]
-        },
-    )
-    return response.text
\ No newline at end of file
+    :return: a list of dictionaries with analysis of each article.
+    """
+    self.rate_limited = False
+    self.prompt_tokens = 0
+    self._deadline = self.rate_limiter.clock() + self.time_budget if self.time_budget is not None else None
+    chunks = self.chunk_articles(articles.articles)
+    if not chunks:
+      return []
+    id_chunks = []
+    offset = 0
+    for chunk in chunks:
+      id_chunks.append([self.article_id(offset + i) for i in range(len(chunk))])
+      offset += len(chunk)
+    self.prompt_tokens = sum(estimate_tokens(self.encoder.encode(chunk, ids)) for chunk, ids in zip(chunks, id_chunks))
+
+    if len(chunks) == 1:
+      chunk_results = [self.analyze_chunk_with_retry(chunks[0], id_chunks[0])]
+    else:
+      with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(chunks))) as pool:
+        # map keeps the chunk order regardless of which one finishes first
+        chunk_results = list(pool.map(self.analyze_chunk_with_retry, chunks, id_chunks))
+
+    self.failed_chunks = sum(1 for result in chunk_results if result is None)
+    results = [result for chunk_result in chunk_results if chunk_result for result in chunk_result]
+    metrics.count_articles("llm_call", len(articles.articles), len(results))
+    return results
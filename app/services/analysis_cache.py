@@ -0,0 +1,118 @@
+import os
+import time
+
+from sqlalchemy import select, update, delete
+
+from app.core import metrics
+from app.database import dialect_insert
+from app.models.analysis_cache import AnalysisCacheEntry
+from app.schemas.threat import ArticleData
+from app.utils.text import content_hash
+
+
+class AnalysisCache:
+  """
+  Persistent cache of AI analysis results keyed on the normalized content of an article.
+  The same wire story keeps coming back under new URLs with small title edits; a cache hit
+  reuses the earlier analysis instead of paying for another Gemini call. Backed by the
+  analysis_cache table so it survives restarts and serverless cold starts.
+  """
+
+  def __init__(self, ttl_seconds=None, max_entries=None, chunk_size=500):
+    """
+    :param ttl_seconds: How long a result stays valid (SHIELD_ANALYSIS_CACHE_TTL, default 3 days).
+                        0 turns the cache off.
+    :param max_entries: Size bound, least recently used entries are evicted beyond it
+                        (SHIELD_ANALYSIS_CACHE_MAX_ENTRIES, default 10000). 0 turns the cache off.
+    :param chunk_size: How many keys go into a single IN (...) query.
+    """
+    self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.getenv("SHIELD_ANALYSIS_CACHE_TTL", str(3 * 24 * 3600)))
+    self.max_entries = max_entries if max_entries is not None else int(os.getenv("SHIELD_ANALYSIS_CACHE_MAX_ENTRIES", "10000"))
+    self.chunk_size = chunk_size
+    self.hits = 0
+    self.misses = 0
+
+  @property
+  def enabled(self):
+    return self.ttl_seconds > 0 and self.max_entries > 0
+
+  def key_for(self, article: ArticleData):
+    return content_hash(article.title, article.description, article.source)
+
+  def get_many(self, db, articles: list[ArticleData]):
+    """
+    Looks up cached results for a batch of articles and refreshes their LRU timestamp.
+    :param db: Database session used for the lookup.
+    :param articles: The articles about to be analyzed.
+    :return: A dictionary of cache key -> cached result dictionary, only for hits.
+    """
+    if not self.enabled:
+      self.misses += len(articles)
+      metrics.analysis_cache_requests.inc(len(articles), result="miss")
+      return {}
+    keys = list({self.key_for(article) for article in articles})
+    now = time.time()
+    found = {}
+    for start in range(0, len(keys), self.chunk_size):
+      chunk = keys[start:start + self.chunk_size]
+      rows = db.execute(
+          select(AnalysisCacheEntry.key, AnalysisCacheEntry.result)
+          .where(AnalysisCacheEntry.key.in_(chunk))
+          .where(AnalysisCacheEntry.created_at >= now - self.ttl_seconds)
+      )
+      found.update({key: result for key, result in rows})
+
+    if found:
+      db.execute(
+          update(AnalysisCacheEntry)
+          .where(AnalysisCacheEntry.key.in_(list(found)))
+          .values(last_used_at=now)
+      )
+
+    hits = sum(1 for article in articles if self.key_for(article) in found)
+    self.hits += hits
+    self.misses += len(articles) - hits
+    metrics.analysis_cache_requests.inc(hits, result="hit")
+    metrics.analysis_cache_requests.inc(len(articles) - hits, result="miss")
+    return found
+
+  def put_many(self, db, entries):
+    """
+    Stores fresh analysis results, replacing any expired entry for the same content, then
+    evicts what no longer fits. Does not commit, the caller owns the transaction.
+    :param db: Database session to write to.
+    :param entries: Iterable of (ArticleData, result dictionary) pairs.
+    """
+    if not self.enabled:
+      return
+    now = time.time()
+    rows = {self.key_for(article): result for article, result in entries}
+    if not rows:
+      return
+
+    stmt = dialect_insert(db, AnalysisCacheEntry)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["key"],
+        set_={"result": stmt.excluded.result, "created_at": stmt.excluded.created_at,
+              "last_used_at": stmt.excluded.last_used_at}
+    )
+    db.execute(stmt, [
+        {"key": key, "result": result, "created_at": now, "last_used_at": now}
+        for key, result in rows.items()
+    ])
+    self.evict(db)
+
+  def evict(self, db):
+    """
+    Removes expired entries, then the least recently used ones beyond max_entries.
+    :param db: Database session to write to.
+    """
+    db.execute(delete(AnalysisCacheEntry).where(
+        AnalysisCacheEntry.created_at < time.time() - self.ttl_seconds
+    ))
+    overflow = (
+        select(AnalysisCacheEntry.key)
+        .order_by(AnalysisCacheEntry.last_used_at.desc())
+        .offset(self.max_entries)
+    )
+    db.execute(delete(AnalysisCacheEntry).where(AnalysisCacheEntry.key.in_(overflow)))
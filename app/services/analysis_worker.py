@@ -0,0 +1,114 @@
+import logging
+import os
+import socket
+import time
+from collections import Counter
+
+from app.schemas.threat import ArticleData, ListArticleData
+from app.services.job_queue import AnalysisQueue
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisWorker:
+  """
+  Drains the analysis queue: claims a batch of jobs, runs their articles through the
+  ThreatProcessor and settles every job by whether its article got an analysis. Articles
+  of a chunk Gemini failed on are retried with backoff. When Gemini reports its quota
+  exhausted, the whole queue is paused and the untried jobs are handed back, so every
+  worker backs off instead of burning retries.
+
+  Any number of workers, in any number of processes or machines, can share one queue.
+  """
+
+  def __init__(self, queue=None, processor=None, batch_size=None, owner=None, quota_pause_seconds=None):
+    """
+    :param queue: The AnalysisQueue to drain.
+    :param processor: The ThreatProcessor that analyzes and stores a batch, created on first use.
+    :param batch_size: Jobs claimed at once, SHIELD_WORKER_BATCH_SIZE, default 40.
+    :param owner: Name written into the leases, host:pid by default.
+    :param quota_pause_seconds: How long the queue is paused after Gemini answered 429,
+                                SHIELD_QUEUE_QUOTA_PAUSE_SECONDS, default 60.
+    """
+    self.queue = queue or AnalysisQueue()
+    self._processor = processor
+    self.batch_size = batch_size or int(os.getenv("SHIELD_WORKER_BATCH_SIZE", "40"))
+    self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    self.quota_pause_seconds = quota_pause_seconds or float(os.getenv("SHIELD_QUEUE_QUOTA_PAUSE_SECONDS", "60"))
+    # totals since the worker started
+    self.stats = {"claimed": 0, "completed": 0, "retried": 0, "failed": 0, "released": 0, "new_threats": 0}
+    # the ThreatProcessor's per batch counters (cache hits, prompt tokens, ...), summed
+    self.processor_stats = Counter()
+
+  @property
+  def processor(self):
+    if self._processor is None:
+      from app.services.threat_processor import ThreatProcessor
+      self._processor = ThreatProcessor()
+    return self._processor
+
+  def run_once(self, db, time_budget=None):
+    """
+    Claims and processes one batch.
+    :param db: Database session.
+    :param time_budget: Seconds the Gemini calls of the batch may take, waits for the quota
+                        included, or None for no limit. Articles that don't fit are handed
+                        back with the queue paused, as when the quota runs out.
+    :return: How many jobs were claimed, 0 when nothing is due or the queue is paused.
+    """
+    jobs = self.queue.claim(db, self.owner, self.batch_size)
+    if not jobs:
+      return 0
+    self.stats["claimed"] += len(jobs)
+    self.processor.ai_analyzer.time_budget = time_budget
+
+    articles = [ArticleData(**job.article) for job in jobs]
+    try:
+      saved = self.processor.process_articles(ListArticleData(articles=articles), db)
+    except Exception as e:
+      db.rollback()
+      logger.exception("Analysis of %d queued articles failed", len(jobs))
+      self._retry(db, jobs, repr(e))
+      return len(jobs)
+
+    self.stats["new_threats"] += len(saved)
+    self.processor_stats.update(self.processor.stats)
+    analyzed = self.processor.analyzed_urls
+    done = [job for job in jobs if job.source_url in analyzed]
+    rest = [job for job in jobs if job.source_url not in analyzed]
+    self.queue.complete(db, self.owner, done)
+    self.stats["completed"] += len(done)
+    if rest and self.processor.ai_analyzer.rate_limited:
+      until = self.queue.pause(db, self.quota_pause_seconds, "Gemini quota exhausted")
+      self.queue.release(db, self.owner, rest, until)
+      self.stats["released"] += len(rest)
+      logger.warning("Gemini quota exhausted, analysis queue paused for %.0fs", until - time.time())
+    elif rest:
+      self._retry(db, rest, "no analysis returned")
+    return len(jobs)
+
+  def run(self, session_factory, poll_seconds=5.0, drain=False, should_stop=None):
+    """
+    Processes batches until stopped, sleeping while the queue is empty or paused.
+    :param session_factory: Callable returning a new database session.
+    :param poll_seconds: How long to sleep when there is nothing to claim.
+    :param drain: Return as soon as nothing is due instead of waiting for more work.
+    :param should_stop: Callable, checked between batches, that returns True to stop.
+    """
+    while not (should_stop and should_stop()):
+      db = session_factory()
+      try:
+        claimed = self.run_once(db)
+        paused_until = None if claimed else self.queue.paused_until(db)
+      finally:
+        db.close()
+      if claimed:
+        continue
+      if drain and not paused_until:
+        return
+      time.sleep(max(paused_until - time.time(), 0) if paused_until else poll_seconds)
+
+  def _retry(self, db, jobs, error):
+    failed = self.queue.retry(db, self.owner, jobs, error)
+    self.stats["failed"] += failed
+    self.stats["retried"] += len(jobs) - failed
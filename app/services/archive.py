@@ -0,0 +1,176 @@
+import json
+import mmap
+import os
+import zlib
+from collections import defaultdict
+from datetime import date, datetime
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+# the day bucket is the file name, it is not repeated in every record
+SKIPPED_COLUMNS = {"created_day"}
+
+
+def _json_value(value):
+  if isinstance(value, (datetime, date)):
+    return value.isoformat()
+  return value
+
+
+class ThreatArchive:
+  """
+  Append-only archive of expired threats, one segment per UTC day. A segment is a run of
+  independently zlib-compressed JSONL blocks, and its sidecar index holds one line per
+  block with the block's offset, length, level range and categories. A query memory-maps
+  the segments of the requested days and only decompresses the blocks whose index entry
+  can match, so it never loads a whole segment.
+
+  A block is written and synced before its index line, so a crash mid-write leaves at most
+  an unindexed tail that readers never look at.
+  """
+
+  def __init__(self, directory=None, block_rows=None, compress_level=6):
+    """
+    :param directory: SHIELD_ARCHIVE_DIR. The archive is off unless it is set, it needs a
+                      directory that outlives the process, which a serverless filesystem is not.
+    :param block_rows: Rows per compressed block, SHIELD_ARCHIVE_BLOCK_ROWS, default 500.
+    :param compress_level: zlib level for new blocks.
+    """
+    self.directory = directory if directory is not None else os.getenv("SHIELD_ARCHIVE_DIR", "")
+    self.block_rows = block_rows or int(os.getenv("SHIELD_ARCHIVE_BLOCK_ROWS", "500"))
+    self.compress_level = compress_level
+
+  @property
+  def enabled(self):
+    return bool(self.directory)
+
+  def segment_paths(self, day):
+    """
+    :param day: The UTC day of the segment.
+    :return: The (segment, index) file paths for that day.
+    """
+    base = os.path.join(self.directory, f"threats-{day.isoformat()}")
+    return base + SEGMENT_SUFFIX, base + INDEX_SUFFIX
+
+  def days(self):
+    """
+    :return: Every day that has an archive segment, oldest first.
+    """
+    if not os.path.isdir(self.directory):
+      return []
+    days = []
+    for name in os.listdir(self.directory):
+      if name.startswith("threats-") and name.endswith(INDEX_SUFFIX):
+        try:
+          days.append(date.fromisoformat(name[len("threats-"):-len(INDEX_SUFFIX)]))
+        except ValueError:
+          continue
+    return sorted(days)
+
+  def append(self, rows):
+    """
+    Archives threat rows into the segments of their created_day.
+    :param rows: SQLAlchemy rows (or mappings) holding every threats column.
+    :return: How many rows were written.
+    """
+    by_day = defaultdict(list)
+    for row in rows:
+      mapping = getattr(row, "_mapping", row)
+      record = {key: _json_value(value) for key, value in mapping.items() if key not in SKIPPED_COLUMNS}
+      by_day[mapping["created_day"]].append(record)
+
+    if by_day:
+      os.makedirs(self.directory, exist_ok=True)
+    for day, records in by_day.items():
+      for start in range(0, len(records), self.block_rows):
+        self._write_block(day, records[start:start + self.block_rows])
+    return sum(len(records) for records in by_day.values())
+
+  def query(self, start=None, end=None, min_level=None, max_level=None, category=None):
+    """
+    Scans the archive, oldest day first.
+    :param start: First day to include, or None.
+    :param end: Last day to include, or None.
+    :param min_level: Only threats with an effective level at or above this.
+    :param max_level: Only threats with an effective level at or below this.
+    :param category: Only threats in this effective category.
+    :return: A generator of archived threat dictionaries.
+    """
+    for day in self.days():
+      if (start and day < start) or (end and day > end):
+        continue
+      segment, index = self.segment_paths(day)
+      blocks = [block for block in self._read_index(index)
+                if self._block_may_match(block, min_level, max_level, category)]
+      if not blocks:
+        continue
+
+      # the same row may be archived twice if a retention batch was retried
+      seen_ids = set()
+      try:
+        f = open(segment, "rb")
+      except FileNotFoundError:
+        # an index without its segment, e.g. a half copied or cleaned up archive
+        continue
+      with f:
+        try:
+          view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+          # an empty segment can't be mapped, and holds no block either
+          continue
+        with view:
+          for block in blocks:
+            end_offset = block["offset"] + block["length"]
+            if end_offset > len(view):
+              continue
+            for line in zlib.decompress(view[block["offset"]:end_offset]).splitlines():
+              record = json.loads(line)
+              if record["id"] in seen_ids or not self._record_matches(record, min_level, max_level, category):
+                continue
+              seen_ids.add(record["id"])
+              yield record
+
+  def _write_block(self, day, records):
+    segment, index = self.segment_paths(day)
+    body = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+    payload = zlib.compress(body.encode("utf-8"), self.compress_level)
+    with open(segment, "ab") as f:
+      offset = f.seek(0, os.SEEK_END)
+      f.write(payload)
+      f.flush()
+      os.fsync(f.fileno())
+
+    levels = [record["effective_threat_level"] for record in records if record.get("effective_threat_level") is not None]
+    entry = {
+      "offset": offset,
+      "length": len(payload),
+      "rows": len(records),
+      "min_level": min(levels) if levels else None,
+      "max_level": max(levels) if levels else None,
+      "categories": sorted({record["effective_category"] for record in records if record.get("effective_category")}),
+    }
+    with open(index, "a", encoding="utf-8") as f:
+      f.write(json.dumps(entry) + "\n")
+
+  @staticmethod
+  def _read_index(path):
+    with open(path, encoding="utf-8") as f:
+      # a line without its newline was cut short by a crash
+      return [json.loads(line) for line in f if line.endswith("\n")]
+
+  @staticmethod
+  def _block_may_match(block, min_level, max_level, category):
+    if min_level is not None and (block["max_level"] is None or block["max_level"] < min_level):
+      return False
+    if max_level is not None and (block["min_level"] is None or block["min_level"] > max_level):
+      return False
+    return category is None or category in block["categories"]
+
+  @staticmethod
+  def _record_matches(record, min_level, max_level, category):
+    level = record.get("effective_threat_level")
+    if min_level is not None and (level is None or level < min_level):
+      return False
+    if max_level is not None and (level is None or level > max_level):
+      return False
+    return category is None or record.get("effective_category") == category
@@ -0,0 +1,117 @@
+import os
+
+from sqlalchemy import delete, select, union
+
+from app.core import metrics
+from app.database import dialect_insert
+from app.models.seen_article import SeenArticle
+from app.models.threat import Threat
+from app.schemas.threat import ArticleData
+
+
+class Deduplicator:
+  """
+  Batched duplicate detection for fetched articles. Resolves a whole page of candidate
+  URLs against saved threats (and previously analyzed articles) with a few set-based
+  queries, instead of one query per article.
+  """
+
+  # shared by every instance in this process, so a long running scheduler or a warm
+  # serverless function does not need to ask the database about URLs it already knows
+  _seen_urls = set()
+  MAX_SEEN_URLS = 100_000
+
+  def __init__(self, persist=None, chunk_size=500):
+    """
+    :param persist: Whether analyzed URLs are also stored in the seen_articles table so
+                    they survive restarts. Defaults to the SHIELD_PERSIST_SEEN_URLS env
+                    variable (on unless set to "0").
+    :param chunk_size: How many URLs go into a single IN (...) query. Keeps us under
+                       SQLite's bound parameter limit.
+    """
+    if persist is None:
+      persist = os.getenv("SHIELD_PERSIST_SEEN_URLS", "1") != "0"
+    self.persist = persist
+    self.chunk_size = chunk_size
+
+  def filter_new(self, db, articles: list[ArticleData]):
+    """
+    Removes every article that has been saved as a threat, analyzed on an earlier run,
+    or appears earlier in the same batch.
+    :param db: Database session used to look up known URLs.
+    :param articles: The freshly fetched articles.
+    :return: A list of the articles that still need analysis, in their original order.
+    """
+    with metrics.time_stage("dedupe"):
+      candidates = []
+      batch_urls = set()
+      for article in articles:
+        if article.url in batch_urls or article.url in self._seen_urls:
+          continue
+        batch_urls.add(article.url)
+        candidates.append(article)
+
+      known = self.find_known_urls(db, batch_urls)
+      new_articles = [article for article in candidates if article.url not in known]
+    metrics.count_articles("dedupe", len(articles), len(new_articles))
+    return new_articles
+
+  def find_known_urls(self, db, urls):
+    """
+    Looks up which of the given URLs the database already knows about.
+    :param db: Database session used for the lookup.
+    :param urls: Iterable of article URLs.
+    :return: The subset of URLs that are already stored.
+    """
+    urls = list(urls)
+    known = set()
+    for start in range(0, len(urls), self.chunk_size):
+      chunk = urls[start:start + self.chunk_size]
+      stmt = select(Threat.source_url).where(Threat.source_url.in_(chunk))
+      if self.persist:
+        stmt = union(stmt, select(SeenArticle.url).where(SeenArticle.url.in_(chunk)))
+      known.update(db.execute(stmt).scalars())
+
+    self._remember(known)
+    return known
+
+  def mark_seen(self, db, urls):
+    """
+    Records URLs that have gone through AI analysis so later runs skip them, whether or
+    not they turned out to be threats. Does not commit, the caller owns the transaction.
+    :param db: Database session to write to.
+    :param urls: Iterable of article URLs.
+    """
+    urls = set(urls)
+    if not urls:
+      return
+    self._remember(urls)
+
+    if self.persist:
+      stmt = dialect_insert(db, SeenArticle).on_conflict_do_nothing(index_elements=["url"])
+      db.execute(stmt, [{"url": url} for url in urls])
+
+  def prune(self, db, cutoff, limit=None):
+    """
+    Deletes seen URLs older than the cutoff, mirroring the threat retention window.
+    :param db: Database session to write to.
+    :param cutoff: datetime, anything seen before it is forgotten.
+    :param limit: Max rows to remove in this call (oldest first), or None for all of them.
+    :return: How many rows were removed.
+    """
+    if limit is None:
+      return db.query(SeenArticle).filter(SeenArticle.seen_at < cutoff).delete()
+    expired = (
+        select(SeenArticle.url).where(SeenArticle.seen_at < cutoff)
+        .order_by(SeenArticle.seen_at).limit(limit)
+    )
+    urls = list(db.scalars(expired))
+    if not urls:
+      return 0
+    return db.execute(delete(SeenArticle).where(SeenArticle.url.in_(urls))).rowcount
+
+  def _remember(self, urls):
+    # a crude bound, the database is the source of truth so forgetting is always safe
+    if len(self._seen_urls) + len(urls) > self.MAX_SEEN_URLS:
+      self._seen_urls.clear()
+    self._seen_urls.update(urls)
@@ -0,0 +1,239 @@
+import os
+import time
+from collections import defaultdict
+
+from sqlalchemy import and_, delete, func, or_, select, update
+
+from app.database import dialect_insert
+from app.models.analysis_job import AnalysisJob
+from app.models.queue_pause import QueuePause
+
+JOBS = AnalysisJob.__table__
+
+
+class AnalysisQueue:
+  """
+  Durable queue of articles waiting for AI analysis, kept in the analysis_jobs table so it
+  works the same on SQLite and Postgres and survives restarts.
+
+  Workers claim jobs under a lease: a claimed job is invisible to other workers until the
+  lease runs out, so a worker that dies mid-batch only delays its jobs. On Postgres the
+  claim skips rows another worker is claiming (FOR UPDATE SKIP LOCKED); SQLite serializes
+  writers, so its single UPDATE ... RETURNING is atomic on its own.
+
+  A failed job goes back to pending with an exponential delay, and is marked failed after
+  max_attempts. The whole queue can be paused, which is how workers back off together when
+  the Gemini quota runs out.
+  """
+
+  def __init__(self, name="analysis", lease_seconds=None, max_attempts=None, backoff_seconds=None,
+               max_backoff_seconds=3600):
+    """
+    :param name: Name of the queue in queue_pauses.
+    :param lease_seconds: How long a claim holds, SHIELD_QUEUE_LEASE_SECONDS, default 300.
+    :param max_attempts: Claims before a job is given up on, SHIELD_QUEUE_MAX_ATTEMPTS, default 5.
+    :param backoff_seconds: Delay after the first failure, doubled after every further one,
+                            SHIELD_QUEUE_BACKOFF_SECONDS, default 30.
+    :param max_backoff_seconds: Upper bound of the delay.
+    """
+    self.name = name
+    self.lease_seconds = lease_seconds or float(os.getenv("SHIELD_QUEUE_LEASE_SECONDS", "300"))
+    self.max_attempts = max_attempts or int(os.getenv("SHIELD_QUEUE_MAX_ATTEMPTS", "5"))
+    self.backoff_seconds = backoff_seconds if backoff_seconds is not None else float(os.getenv("SHIELD_QUEUE_BACKOFF_SECONDS", "30"))
+    self.max_backoff_seconds = max_backoff_seconds
+
+  def enqueue(self, db, articles, now=None, commit=True):
+    """
+    Adds articles to the queue, skipping any URL that is already queued. Commits unless
+    told not to.
+    :param db: Database session.
+    :param articles: ArticleData objects.
+    :param now: Unix time, defaults to now.
+    :param commit: False to leave the commit to the caller.
+    :return: How many jobs were added.
+    """
+    now = now or time.time()
+    rows = {}
+    for article in articles:
+      rows.setdefault(article.url, {
+        "source_url": article.url, "article": article.model_dump(mode="json"), "status": "pending",
+        "attempts": 0, "available_at": now, "created_at": now,
+      })
+    if not rows:
+      return 0
+    stmt = dialect_insert(db, AnalysisJob).on_conflict_do_nothing(index_elements=["source_url"])
+    added = len(db.execute(stmt.returning(JOBS.c.id), list(rows.values())).all())
+    if commit:
+      db.commit()
+    return added
+
+  def claim(self, db, owner, limit, now=None):
+    """
+    Leases up to limit jobs that are due, oldest first, including jobs whose lease expired.
+    Commits.
+    :param db: Database session.
+    :param owner: Name of the claiming worker, only it can settle the jobs.
+    :param limit: Max jobs to claim.
+    :param now: Unix time, defaults to now.
+    :return: The claimed job rows (id, source_url, article, attempts, ...), empty while the
+             queue is paused.
+    """
+    now = now or time.time()
+    if self.paused_until(db, now):
+      return []
+
+    # a job whose worker keeps dying with it is not handed out forever
+    db.execute(
+        update(JOBS)
+        .where(JOBS.c.status == "leased", JOBS.c.lease_expires_at < now, JOBS.c.attempts >= self.max_attempts)
+        .values(status="failed", lease_owner=None, lease_expires_at=None, finished_at=now,
+                last_error="lease expired")
+    )
+    due = (
+        select(JOBS.c.id)
+        .where(or_(
+            and_(JOBS.c.status == "pending", JOBS.c.available_at <= now),
+            and_(JOBS.c.status == "leased", JOBS.c.lease_expires_at < now),
+        ))
+        .order_by(JOBS.c.available_at, JOBS.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    jobs = db.execute(
+        update(JOBS)
+        .where(JOBS.c.id.in_(due.scalar_subquery()))
+        .values(status="leased", lease_owner=owner, lease_expires_at=now + self.lease_seconds,
+                attempts=JOBS.c.attempts + 1)
+        .returning(JOBS)
+    ).all()
+    db.commit()
+    return sorted(jobs, key=lambda job: (job.available_at, job.id))
+
+  def complete(self, db, owner, jobs, now=None):
+    """
+    Marks jobs done. A job whose lease was taken over by another worker is left alone.
+    Commits.
+    :param db: Database session.
+    :param owner: The worker that claimed the jobs.
+    :param jobs: Job rows returned by claim.
+    :param now: Unix time, defaults to now.
+    """
+    self._settle(db, owner, jobs, status="done", finished_at=now or time.time(), last_error=None)
+
+  def retry(self, db, owner, jobs, error, now=None):
+    """
+    Puts jobs back with an exponential delay, or marks them failed once they used up their
+    attempts. Commits.
+    :param db: Database session.
+    :param owner: The worker that claimed the jobs.
+    :param jobs: Job rows returned by claim.
+    :param error: Why the jobs failed, kept in last_error.
+    :param now: Unix time, defaults to now.
+    :return: How many of the jobs were marked failed.
+    """
+    now = now or time.time()
+    by_attempts = defaultdict(list)
+    for job in jobs:
+      by_attempts[job.attempts].append(job)
+    failed = 0
+    for attempts, group in by_attempts.items():
+      if attempts >= self.max_attempts:
+        self._settle(db, owner, group, commit=False, status="failed", finished_at=now, last_error=error)
+        failed += len(group)
+      else:
+        self._settle(db, owner, group, commit=False, status="pending",
+                     available_at=now + self.backoff(attempts), last_error=error)
+    db.commit()
+    return failed
+
+  def release(self, db, owner, jobs, available_at):
+    """
+    Hands jobs back without counting the attempt, for work that was never tried (e.g.
+    while the quota is exhausted). Commits.
+    :param db: Database session.
+    :param owner: The worker that claimed the jobs.
+    :param jobs: Job rows returned by claim.
+    :param available_at: Unix time at which the jobs may be claimed again.
+    """
+    self._settle(db, owner, jobs, status="pending", available_at=available_at,
+                 attempts=JOBS.c.attempts - 1)
+
+  def backoff(self, attempts):
+    """
+    :param attempts: How many times the job has been claimed.
+    :return: Seconds to wait before the next attempt.
+    """
+    return min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+
+  def pause(self, db, seconds, reason=None, now=None):
+    """
+    Stops every worker from claiming jobs for a while. Extends, never shortens, a pause
+    that is already in place. Commits.
+    :param db: Database session.
+    :param seconds: How long the pause lasts.
+    :param reason: Shown in the queue stats.
+    :param now: Unix time, defaults to now.
+    :return: The Unix time the queue is paused until.
+    """
+    until = (now or time.time()) + seconds
+    # SQLite's two-argument max() is Postgres' greatest()
+    greatest = func.max if db.get_bind().dialect.name == "sqlite" else func.greatest
+    stmt = dialect_insert(db, QueuePause)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["queue"],
+        set_={"paused_until": greatest(QueuePause.paused_until, stmt.excluded.paused_until),
+              "reason": stmt.excluded.reason}
+    )
+    db.execute(stmt, {"queue": self.name, "paused_until": until, "reason": reason})
+    db.commit()
+    return self.paused_until(db, now) or until
+
+  def paused_until(self, db, now=None):
+    """
+    :param db: Database session.
+    :param now: Unix time, defaults to now.
+    :return: The Unix time the queue is paused until, or None if it is not paused.
+    """
+    until = db.execute(select(QueuePause.paused_until).where(QueuePause.queue == self.name)).scalar()
+    if until is not None and until > (now or time.time()):
+      return until
+    return None
+
+  def stats(self, db, now=None):
+    """
+    :param db: Database session.
+    :param now: Unix time, defaults to now.
+    :return: A dictionary with the job count per status and the pause, if any.
+    """
+    counts = dict(db.execute(select(JOBS.c.status, func.count()).group_by(JOBS.c.status)).all())
+    pause = db.execute(select(QueuePause).where(QueuePause.queue == self.name)).scalar()
+    paused = pause is not None and pause.paused_until > (now or time.time())
+    return {
+      "jobs": {status: counts.get(status, 0) for status in ("pending", "leased", "done", "failed")},
+      "paused_until": pause.paused_until if paused else None,
+      "pause_reason": pause.reason if paused else None,
+    }
+
+  def prune(self, db, before, limit=None):
+    """
+    Deletes finished (done or failed) jobs. Does not commit.
+    :param db: Database session.
+    :param before: Unix time, jobs finished before it are removed.
+    :param limit: Max jobs to remove, or None for all of them.
+    :return: How many jobs were removed.
+    """
+    finished = select(JOBS.c.id).where(JOBS.c.status.in_(["done", "failed"]), JOBS.c.finished_at < before)
+    if limit:
+      finished = finished.limit(limit)
+    return db.execute(delete(JOBS).where(JOBS.c.id.in_(finished.scalar_subquery()))).rowcount
+
+  def _settle(self, db, owner, jobs, commit=True, **values):
+    ids = [job.id for job in jobs]
+    if ids:
+      db.execute(
+          update(JOBS)
+          .where(JOBS.c.id.in_(ids), JOBS.c.status == "leased", JOBS.c.lease_owner == owner)
+          .values(lease_owner=None, lease_expires_at=None, **values)
+      )
+    if commit:
+      db.commit()
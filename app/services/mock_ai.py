@@ -1,60 +1,119 @@
+import re
+
 from app.schemas.threat import ArticleData, AIAnalysisResult
 
+# set of good words - if article contains these words, it is not a threat.
+SAFE_WORDS = {
+  "support", "help", "community", "guide", "safe", "protect", "wellness",
+  "education", "success", "innovation", "clean", "peaceful", "relief",
+  "improve", "solution", "health", "care", "growth", "inspire",
+  "collaboration", "discovery", "progress", "celebration", "joy",
+  "resilience", "unity", "trust", "transparency", "empowerment", "kindness"
+}
+
+# set of bad words - results in a high level threat.
+THREAT_WORDS = {
+  "attack", "bomb", "threat", "murder", "war", "gun", "kill", "shoot",
+  "assault", "crisis", "panic", "danger", "virus", "hack", "breach", "scam",
+  "fraud", "explosion", "terror", "hostage", "toxic", "disaster", "arrest",
+  "criminal", "abuse", "violence", "hate", "ransomware", "stalk", "exploit",
+  "extremist"
+}
+
+
+# Derived words that say as much as the listed word they come from.
+DERIVED_THREAT_WORDS = {
+  "terror": ["terrorist", "terrorists", "terrorism"],
+  "threat": ["threaten", "threatens", "threatened", "threatening"],
+  "danger": ["dangerous"],
+  "violence": ["violent"],
+  "explosion": ["explosive", "explosives"],
+}
+
+
+def _inflections(word, agent_nouns=False):
+  """
+  :param word: A word of one of the lists.
+  :param agent_nouns: Also add the -er / -ers forms ("hacker", "bomber").
+  :return: The word and its regular inflections. Forms that are not real words are
+           harmless, they never match.
+  """
+  stem = word[:-1] if word.endswith("e") else word
+  # short consonant-vowel-consonant words double their last letter: "gunned", "warring"
+  if len(word) <= 4 and re.fullmatch(r".*[^aeiou][aeiou][^aeiouwxy]", word):
+    stem += word[-1]
+  forms = {word, word + "s", word + "es", stem + "ed", stem + "ing"}
+  if agent_nouns:
+    forms |= {stem + "er", stem + "ers"}
+  return forms
+
+
+def _alternation(forms):
+  # longest first, so "attacks" is not cut short by "attack"
+  return "|".join(re.escape(form) for form in sorted(forms, key=len, reverse=True))
+
+
+THREAT_FORMS = set().union(*(_inflections(word, agent_nouns=True) for word in THREAT_WORDS),
+                           *DERIVED_THREAT_WORDS.values())
+SAFE_FORMS = set().union(*(_inflections(word) for word in SAFE_WORDS))
+
+# One pass over the text finds both kinds of words. Only whole words count, in one of their
+# inflected forms: "attacks" and "hacked" do, "Warner", "Bombay", "career" and "helper" don't.
+_MATCHER = re.compile(
+    rf"\b(?:(?P<threat>{_alternation(THREAT_FORMS)})|(?P<safe>{_alternation(SAFE_FORMS)}))\b",
+    re.IGNORECASE
+)
+
 
 class MockAI:
   """
   Simple "AI" Service to test pipeline functionality. Will take in sample article data and provide 
   output data that will be simulate the real AI's output data. 
+
+  Its word lists also make a cheap triage score, used to keep obviously harmless articles
+  away from Gemini.
   """
 
+  def count_words(self, article: ArticleData):
+    """
+    :param article: The article to scan.
+    :return: The number of threat words and of safe words in its title and description.
+    """
+    threat_hits = safe_hits = 0
+    for match in _MATCHER.finditer(f"{article.title}\n{article.description or ''}"):
+      if match.lastgroup == "threat":
+        threat_hits += 1
+      else:
+        safe_hits += 1
+    return threat_hits, safe_hits
+
+  def score_articles(self, articles):
+    """
+    Scores a whole batch of articles on how clearly harmless they look.
+    :param articles: The ArticleData to score.
+    :return: One safe score per article: 0 when it has any threat word (or no signal at all),
+             else towards 1 with more safe words: safe / (safe + 1). Safe words never
+             outweigh a threat word, so a triage cutoff can't skip an article that has one.
+    """
+    scores = []
+    for article in articles:
+      threat_hits, safe_hits = self.count_words(article)
+      scores.append(0.0 if threat_hits else safe_hits / (safe_hits + 1))
+    return scores
+
   def analyze_article(self, article: ArticleData):
-    title = article.title.lower()
-    description = ""
-    if article.description:
-      description = article.description.lower()
-
-    # set of good words - if article contains these words, it is not a threat.
-    safe_words = {
-      "support", "help", "community", "guide", "safe", "protect", "wellness",
-      "education", "success", "innovation", "clean", "peaceful", "relief",
-      "improve", "solution", "health", "care", "growth", "inspire",
-      "collaboration", "discovery", "progress", "celebration", "joy",
-      "resilience", "unity", "trust", "transparency", "empowerment", "kindness"
-    }
-
-    # set of bad words - results in a high level threat.
-    threat_words = {
-      "attack", "bomb", "threat", "murder", "war", "gun", "kill", "shoot",
-      "assault", "crisis", "panic", "danger", "virus", "hack", "breach", "scam",
-      "fraud", "explosion", "terror", "hostage", "toxic", "disaster", "arrest",
-      "criminal", "abuse", "violence", "hate", "ransomware", "stalk", "exploit",
-      "extremist"
-    }
-
-    # if threat word is found, break and set to true
-    threat_found = False
-    for tword in threat_words:
-      if tword in title or tword in description:
-        threat_found = True
-        break
-
-    # if safe word is found, break and set to true
-    safe_found = False
-    for sword in safe_words:
-      if sword in title or sword in description:
-        safe_found = True
-        break
-
-    print(f"Article: {title} - {description}. Here is threat_found: {threat_found}, and here is safe_found: {safe_found}")
+    threat_found, safe_found = self.count_words(article)
 
     if threat_found:
       return AIAnalysisResult(
-          is_threat=True, threat_level=10, category="Any threat", summary="this is a threat", keywords=[], confidence=1.0)
+          is_threat=True, threat_level=10, category="Any threat", summary="this is a threat", keywords=[],
+          confidence=1.0, title=article.title, reason="contains threat words")
 
     if safe_found:
       return AIAnalysisResult(
-          is_threat=False, threat_level=1, category="", summary="", keywords=[], confidence=1.0)
+          is_threat=False, threat_level=1, category="", summary="", keywords=[], confidence=1.0,
+          title=article.title, reason="contains safe words only")
 
     return AIAnalysisResult(
-        is_threat=True, threat_level=6, category="Mild threat", summary="don't know for sure, but letting it be a threat for more data.", keywords=[], confidence=0.5)
-
+        is_threat=True, threat_level=6, category="Mild threat", summary="don't know for sure, but letting it be a threat for more data.",
+        keywords=[], confidence=0.5, title=article.title, reason="no known words")
@@ -0,0 +1,164 @@
+import hashlib
+import os
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app.models.threat import Threat
+from app.utils.text import normalize_text
+
+FINGERPRINT_BITS = 64
+
+# One story in a batch: the article sent for analysis, its fingerprint, and the URLs of the
+# near-identical copies that ride along with it
+Cluster = namedtuple("Cluster", ["article", "fingerprint", "member_urls"])
+
+
+def _feature_hash(feature):
+  return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text):
+  """
+  64 bit SimHash of the normalized text over single words and word pairs. Texts that
+  share most of their words get fingerprints a few bits apart.
+  :param text: The text to fingerprint.
+  :return: The fingerprint as a signed 64 bit integer (it is stored in a BIGINT column).
+  """
+  words = normalize_text(text).split()
+  features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+  # a bit is set where most feature hashes have it; counting the columns of their binary
+  # strings keeps the per-bit loop out of Python
+  columns = zip(*(format(_feature_hash(feature), f"0{FINGERPRINT_BITS}b") for feature in features))
+  fingerprint = 0
+  for column in columns:
+    fingerprint = fingerprint << 1 | (2 * column.count("1") > len(features))
+  return fingerprint - (1 << FINGERPRINT_BITS) if fingerprint >= 1 << (FINGERPRINT_BITS - 1) else fingerprint
+
+
+def hamming_distance(first, second):
+  """Number of differing bits between two fingerprints"""
+  return ((first ^ second) & ((1 << FINGERPRINT_BITS) - 1)).bit_count()
+
+
+class SimHashIndex:
+  """
+  LSH index over fingerprints. The 64 bits are cut into max_distance // 2 + 1 bands; two
+  fingerprints within max_distance bits then differ in at most one bit on some band
+  (pigeonhole), so a lookup only probes each band's own key and its one-bit neighbours,
+  and verifies the Hamming distance of the entries found there.
+
+  Few wide bands keep the buckets small: at the default distance of 10 a band is 10 or 11
+  bits, so a lookup compares against a few percent of the index instead of the third that
+  eleven 5-bit bands would touch.
+  """
+
+  def __init__(self, max_distance):
+    self.max_distance = max_distance
+    self.bands = max_distance // 2 + 1
+    # bits a band can differ in and still be the one that differs least, 0 or 1
+    self.radius = max_distance // self.bands
+    # the bits left over go to the first bands, one each
+    widths = [FINGERPRINT_BITS // self.bands + (band < FINGERPRINT_BITS % self.bands) for band in range(self.bands)]
+    self._bands = [(sum(widths[:band]), width) for band, width in enumerate(widths)]
+    self._buckets = defaultdict(list)
+
+  def _band_keys(self, fingerprint):
+    unsigned = fingerprint & ((1 << FINGERPRINT_BITS) - 1)
+    return [(band, unsigned >> shift & ((1 << width) - 1)) for band, (shift, width) in enumerate(self._bands)]
+
+  def _probe_keys(self, fingerprint):
+    for (band, key), (_, width) in zip(self._band_keys(fingerprint), self._bands):
+      yield band, key
+      if self.radius:
+        for bit in range(width):
+          yield band, key ^ (1 << bit)
+
+  def add(self, fingerprint, value):
+    for key in self._band_keys(fingerprint):
+      self._buckets[key].append((fingerprint, value))
+
+  def nearest(self, fingerprint):
+    """
+    :param fingerprint: The fingerprint to look up.
+    :return: The value of the closest indexed fingerprint within max_distance, or None.
+    """
+    best = None
+    for key in self._probe_keys(fingerprint):
+      for candidate, value in self._buckets.get(key, ()):
+        distance = hamming_distance(fingerprint, candidate)
+        if distance <= self.max_distance and (best is None or distance < best[0]):
+          best = (distance, value)
+    return best[1] if best else None
+
+
+class NearDuplicateDetector:
+  """
+  Groups syndicated copies of one story (AP, Reuters, local rewrites) by the SimHash of
+  their title and description, so only one copy per story is analyzed and stored. Copies
+  of a story already stored within the window are attached to that threat instead.
+  """
+
+  def __init__(self, max_distance=None, window_hours=None):
+    """
+    :param max_distance: Max differing bits for two articles to count as the same story,
+                         SHIELD_SIMHASH_MAX_DISTANCE, default 10.
+    :param window_hours: How far back stored threats are matched against,
+                         SHIELD_SIMHASH_WINDOW_HOURS, default 48.
+    """
+    self.max_distance = max_distance if max_distance is not None else int(os.getenv("SHIELD_SIMHASH_MAX_DISTANCE", "10"))
+    self.window_hours = window_hours if window_hours is not None else float(os.getenv("SHIELD_SIMHASH_WINDOW_HOURS", "48"))
+
+  @staticmethod
+  def fingerprint(article):
+    return simhash(f"{article.title} {article.description or ''}")
+
+  def cluster(self, db, articles):
+    """
+    :param db: Database session used to read the fingerprints of recent threats.
+    :param articles: The articles of one batch.
+    :return: The clusters to analyze (one representative each, in batch order), and a
+             dictionary of stored threat id -> URLs of new copies of that threat.
+    """
+    index = SimHashIndex(self.max_distance)
+    since = datetime.now(timezone.utc) - timedelta(hours=self.window_hours)
+    recent = db.execute(
+        select(Threat.id, Threat.simhash)
+        .where(Threat.created_at >= since, Threat.simhash.is_not(None))
+    )
+    for threat_id, fingerprint in recent:
+      index.add(fingerprint, ("threat", threat_id))
+
+    clusters = []
+    attached = defaultdict(list)
+    for article in articles:
+      fingerprint = self.fingerprint(article)
+      match = index.nearest(fingerprint)
+      if match is None:
+        index.add(fingerprint, ("cluster", len(clusters)))
+        clusters.append(Cluster(article, fingerprint, []))
+      elif match[0] == "threat":
+        attached[match[1]].append(article.url)
+      else:
+        clusters[match[1]].member_urls.append(article.url)
+    return clusters, dict(attached)
+
+  def attach(self, db, attached):
+    """
+    Adds new copies of stored stories to their threats' related_urls. Does not commit.
+    :param db: Database session to write to.
+    :param attached: Threat id -> URLs, as returned by cluster.
+    :return: How many threats changed.
+    """
+    changed = 0
+    if not attached:
+      return changed
+    for threat in db.scalars(select(Threat).where(Threat.id.in_(list(attached)))):
+      urls = list(threat.related_urls or [])
+      new_urls = [url for url in dict.fromkeys(attached[threat.id]) if url not in urls and url != threat.source_url]
+      if new_urls:
+        threat.related_urls = urls + new_urls
+        changed += 1
+    db.flush()
+    return changed
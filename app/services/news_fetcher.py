@@ -1,15 +1,61 @@
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from dotenv import load_dotenv
-from datetime import datetime
-import requests
+from sqlalchemy import select
 
+from app.core import metrics
+from app.core.clients import http_session
+from app.core.rate_limit import backoff_delay, limiter, parse_retry_after
+from app.database import dialect_insert
+from app.models.source_state import SourceState
 from app.models.threat import Threat
 from app.schemas.threat import ArticleData, ListArticleData
+from app.services.deduplicator import Deduplicator
+from app.services.news_sources import configured_sources, parse_newsapi_articles
+
+logger = logging.getLogger(__name__)
 
 
 class NewsFetcher:
 
+  def __init__(self, session=None, max_workers=None, timeout=None, max_attempts=None, retry_backoff=1.0,
+               max_retry_wait=None, rate_limiter=None, clock=time.monotonic):
+    """
+    :param session: requests.Session to fetch with, the process-wide pooled one by default.
+    :param max_workers: Sources fetched at once, SHIELD_FETCH_CONCURRENCY, default 8.
+    :param timeout: Seconds per request, SHIELD_FETCH_TIMEOUT, default 10.
+    :param max_attempts: Tries per source, SHIELD_FETCH_MAX_ATTEMPTS, default 3.
+    :param retry_backoff: Base delay in seconds between tries, jittered and doubled after every one.
+    :param max_retry_wait: Longest Retry-After worth waiting for, SHIELD_FETCH_MAX_RETRY_WAIT,
+                           default 30. A source asking for longer is skipped this run.
+    :param rate_limiter: A RateLimiter for every source, instead of the process-wide one of
+                         each source's provider.
+    :param clock: Monotonic clock the time budget of fetch_sources is measured on, in seconds.
+    """
+    # resolves a whole page of URLs against the database at once
+    self.deduplicator = Deduplicator()
+    self.max_workers = max_workers or int(os.getenv("SHIELD_FETCH_CONCURRENCY", "8"))
+    self.timeout = timeout or float(os.getenv("SHIELD_FETCH_TIMEOUT", "10"))
+    self.max_attempts = max_attempts or int(os.getenv("SHIELD_FETCH_MAX_ATTEMPTS", "3"))
+    self.retry_backoff = retry_backoff
+    self.max_retry_wait = max_retry_wait or float(os.getenv("SHIELD_FETCH_MAX_RETRY_WAIT", "30"))
+    self.rate_limiter = rate_limiter
+    self.clock = clock
+    self._session = session
+    # counters from the last fetch_sources call
+    self.stats = {}
+    # ETag / Last-Modified of the sources the last fetch_sources call got a response from,
+    # written by save_source_states once their articles are stored
+    self.source_states = []
+
+  @property
+  def session(self):
+    if self._session is None:
+      self._session = http_session(self.max_workers)
+    return self._session
+
   def fetch_article_data(self, key):
     """
     Performs a request to get the real article data via NewsAPI. Returns a json of the top headlines
@@ -18,7 +64,133 @@ class NewsFetcher:
     :return: A json of all the articles that are top headlines right now.
     """
 
-    return requests.get(f"https://newsapi.org/v2/top-headlines?country=us&pageSize=100&apiKey={key}").json()
+    return self.session.get(
+        "https://newsapi.org/v2/top-headlines", params={"country": "us", "pageSize": 100},
+        headers={"X-Api-Key": key or ""}, timeout=self.timeout
+    ).json()
+
+  def fetch_sources(self, db, sources, time_budget=None):
+    """
+    Fetches every source concurrently over the pooled session. Each request carries the
+    ETag / Last-Modified of the source's last response, so a source that has not changed
+    answers 304 and costs no parsing at all. A source that fails is logged and skipped.
+
+    The new validators are kept in source_states, not written: once they are stored, the
+    source answers 304 and its articles are never sent again, so the caller stores them
+    with save_source_states in the transaction that stores the articles.
+    :param db: Database session holding the source_states.
+    :param sources: The NewsSource objects to poll.
+    :param time_budget: Seconds the whole fetch may take, or None for no limit. Request
+                        timeouts, quota and retry waits are cut to what is left of it, and a
+                        source that can't be fetched in time counts as failed.
+    :return: Every article found, in source order, not yet deduplicated.
+    """
+    keys = [source.key for source in sources]
+    states = {state.key: state for state in db.scalars(select(SourceState).where(SourceState.key.in_(keys)))}
+    deadline = self.clock() + time_budget if time_budget is not None else None
+
+    def fetch(source):
+      headers = dict(source.headers)
+      state = states.get(source.key)
+      if state is not None and state.etag:
+        headers["If-None-Match"] = state.etag
+      if state is not None and state.last_modified:
+        headers["If-Modified-Since"] = state.last_modified
+      try:
+        response = self.get_with_retry(source, headers, deadline)
+        if response.status_code == 304:
+          return "not_modified", [], None
+        response.raise_for_status()
+        validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return "fetched", source.parse(response), validators
+      except Exception as e:
+        logger.warning("Fetching %s failed: %s", source.key, e)
+        return "failed", [], None
+
+    with metrics.time_stage("fetch"):
+      if len(sources) > 1:
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(sources))) as executor:
+          results = list(executor.map(fetch, sources))
+      else:
+        results = [fetch(source) for source in sources]
+
+    # the database session is not thread safe, states are written back from this thread only
+    articles = []
+    updates = []
+    self.stats = {"sources": len(sources), "not_modified": 0, "failed": 0}
+    for source, (outcome, source_articles, validators) in zip(sources, results):
+      if outcome != "fetched":
+        self.stats[outcome] += 1
+      articles.extend(source_articles)
+      if validators and any(validators):
+        updates.append({"key": source.key, "etag": validators[0], "last_modified": validators[1]})
+    self.source_states = updates
+    metrics.count_articles("fetch", articles_out=len(articles))
+    return articles
+
+  def save_source_states(self, db):
+    """
+    Writes the validators of the last fetch_sources call. Does not commit, the caller owns
+    the transaction: the one that queues or stores the fetched articles.
+    :param db: Database session to write to.
+    """
+    if not self.source_states:
+      return
+    stmt = dialect_insert(db, SourceState)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["key"],
+        set_={"etag": stmt.excluded.etag, "last_modified": stmt.excluded.last_modified}
+    )
+    db.execute(stmt, self.source_states)
+
+  def get_with_retry(self, source, headers, deadline=None):
+    """
+    Requests a source under its provider's rate limit. Connection errors, timeouts, 429 and
+    5xx answers are retried with jittered exponential backoff, or after the Retry-After the
+    server asked for. A 429 holds every request to the same provider, not just this one.
+    :param source: The NewsSource to request.
+    :param headers: Request headers, conditional ones included.
+    :param deadline: Time on self.clock by which the last attempt has to be done, or None.
+    :return: The last response, which can still be an error status.
+    :raises requests.RequestException: if the last attempt could not connect.
+    :raises TimeoutError: if the deadline leaves no time for a request.
+    """
+    from requests import RequestException
+
+    rate_limiter = self.rate_limiter or limiter(source.provider)
+    for attempt in range(1, self.max_attempts + 1):
+      remaining = deadline - self.clock() if deadline is not None else None
+      if (remaining is not None and remaining <= 0) or rate_limiter.acquire(max_wait=remaining) is None:
+        raise TimeoutError(f"no time left to request {source.key}")
+      timeout = self.timeout if deadline is None else max(min(self.timeout, deadline - self.clock()), 0.1)
+      try:
+        response = self.session.get(source.url, params=source.params, headers=headers, timeout=timeout)
+      except RequestException:
+        delay = backoff_delay(attempt, self.retry_backoff)
+        if attempt == self.max_attempts or self._past(deadline, delay):
+          raise
+        reason = "error"
+      else:
+        if (response.status_code != 429 and response.status_code < 500) or attempt == self.max_attempts:
+          return response
+        reason = "rate_limited" if response.status_code == 429 else "error"
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        if delay is None:
+          delay = backoff_delay(attempt, self.retry_backoff)
+        if delay > self.max_retry_wait or self._past(deadline, delay):
+          return response
+        if reason == "rate_limited":
+          rate_limiter.back_off(delay)
+
+      metrics.api_retries.inc(provider=source.provider, reason=reason)
+      logger.info("Retrying %s in %.1fs (%s)", source.key, delay, reason)
+      if reason != "rate_limited":
+        # a 429 is waited out by the limiter on the next acquire
+        time.sleep(delay)
+
+  def _past(self, deadline, delay):
+    """Whether waiting delay seconds would go past the deadline"""
+    return deadline is not None and self.clock() + delay >= deadline
 
   def convert_data(self, article_data, db):
     """
@@ -29,21 +201,10 @@ class NewsFetcher:
                 check for duplicates
     :return: a ListArticleData object.
     """
-    res_articles = []
-    for article in article_data["articles"]:
-      date_time = article.get("publishedAt")
-
-      res = ArticleData (
-          title=article.get("title"),
-          description=article.get("description"),
-          url=article.get("url"),
-          source=article.get("source").get("name"),
-          published_at=datetime.fromisoformat(date_time[:19])
-      )
-
-      if not self.check_if_duplicate(db, res):
-        res_articles.append(res)
+    candidates = parse_newsapi_articles(article_data)
 
+    # one batched lookup for the whole page instead of a query per article
+    res_articles = self.deduplicator.filter_new(db, candidates)
     list_articles = ListArticleData(articles=res_articles)
     return list_articles
 
@@ -67,16 +228,24 @@ class NewsFetcher:
     existing = db.query(Threat).filter(Threat.source_url == article.url).first()
     return existing is not None
 
-  def fetch_and_convert(self, db):
+  def fetch_and_convert(self, db, time_budget=None):
     """
-    Calls both helper functions in a clean manner so that main pipeline can easily
-    fetch news effectively.
+    Fetches every configured source (NewsAPI countries / categories / pages and RSS or Atom
+    feeds) and drops the articles we already know, so main pipeline can easily fetch news
+    effectively.
     :param db: The database instance that the information will be stored in. Need it here to
                 check for duplicates
+    :param time_budget: Seconds the fetch may take, see fetch_sources.
     :return: a ListArticleData object.
     """
-    load_dotenv()
-    apikey = os.getenv("NEWS_API_KEY")
+    # app.database loaded .env once when it was imported
+    sources = configured_sources(
+        os.getenv("NEWS_API_KEY"),
+        countries=os.getenv("SHIELD_NEWSAPI_COUNTRIES", "us"),
+        categories=os.getenv("SHIELD_NEWSAPI_CATEGORIES", ""),
+        pages=int(os.getenv("SHIELD_NEWSAPI_PAGES", "1")),
+        feeds=os.getenv("SHIELD_RSS_FEEDS", "")
+    )
 
-    article_data = self.fetch_article_data(apikey)
-    return self.convert_data(article_data, db)
\ No newline at end of file
+    articles = self.fetch_sources(db, sources, time_budget)
+    return ListArticleData(articles=self.deduplicator.filter_new(db, articles))
\ No newline at end of file
@@ -0,0 +1,181 @@
+import email.utils
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlparse
+
+from pydantic import ValidationError
+
+from app.schemas.threat import ArticleData
+
+NEWSAPI_TOP_HEADLINES = "https://newsapi.org/v2/top-headlines"
+ATOM = "{http://www.w3.org/2005/Atom}"
+# NewsAPI keeps a removed article in the results, with these placeholders in its fields
+NEWSAPI_REMOVED = "[Removed]"
+NEWSAPI_REMOVED_HOST = "removed.com"
+
+
+def _naive_utc(value):
+  if value is not None and value.tzinfo is not None:
+    value = value.astimezone(timezone.utc).replace(tzinfo=None)
+  return value
+
+
+def parse_newsapi_articles(article_data):
+  """
+  Turns a NewsAPI response into ArticleData, skipping removed or incomplete articles.
+  :param article_data: The decoded JSON of a NewsAPI response.
+  :return: A list of ArticleData.
+  """
+  articles = []
+  for article in article_data.get("articles", []):
+    url = article.get("url") or ""
+    if NEWSAPI_REMOVED in (article.get("title"), url) or urlparse(url).hostname == NEWSAPI_REMOVED_HOST:
+      continue
+    date_time = article.get("publishedAt")
+    try:
+      articles.append(ArticleData(
+          title=article.get("title"),
+          description=article.get("description"),
+          url=article.get("url"),
+          source=(article.get("source") or {}).get("name") or "NewsAPI",
+          published_at=datetime.fromisoformat(date_time[:19]) if date_time else None
+      ))
+    except (ValidationError, ValueError):
+      continue
+  return articles
+
+
+def parse_feed(body, fallback_source):
+  """
+  Turns an RSS 2.0 or Atom document into ArticleData.
+  :param body: The raw feed bytes.
+  :param fallback_source: Source name to use when the feed has no title.
+  :return: A list of ArticleData.
+  :raises ET.ParseError: if the body is not XML.
+  """
+  root = ET.fromstring(body)
+  articles = []
+  if root.tag == f"{ATOM}feed":
+    source = (root.findtext(f"{ATOM}title") or "").strip() or fallback_source
+    for entry in root.iter(f"{ATOM}entry"):
+      link = entry.find(f"{ATOM}link[@rel='alternate']")
+      if link is None:
+        link = entry.find(f"{ATOM}link")
+      published = entry.findtext(f"{ATOM}published") or entry.findtext(f"{ATOM}updated")
+      articles.append(dict(
+          title=entry.findtext(f"{ATOM}title"),
+          description=entry.findtext(f"{ATOM}summary") or entry.findtext(f"{ATOM}content"),
+          url=link.get("href") if link is not None else None,
+          source=source,
+          published_at=_parse_iso(published)
+      ))
+  else:
+    channel = root.find("channel")
+    source = ((channel.findtext("title") if channel is not None else None) or "").strip() or fallback_source
+    for item in root.iter("item"):
+      articles.append(dict(
+          title=item.findtext("title"),
+          description=item.findtext("description"),
+          url=item.findtext("link") or item.findtext("guid"),
+          source=source,
+          published_at=_parse_rfc822(item.findtext("pubDate"))
+      ))
+
+  parsed = []
+  for article in articles:
+    if not article["title"] or not article["url"]:
+      continue
+    article["title"] = article["title"].strip()
+    article["url"] = article["url"].strip()
+    parsed.append(ArticleData(**article))
+  return parsed
+
+
+def _parse_iso(value):
+  if not value:
+    return None
+  try:
+    return _naive_utc(datetime.fromisoformat(value.strip().replace("Z", "+00:00")))
+  except ValueError:
+    return None
+
+
+def _parse_rfc822(value):
+  if not value:
+    return None
+  try:
+    return _naive_utc(email.utils.parsedate_to_datetime(value.strip()))
+  except (TypeError, ValueError):
+    return None
+
+
+class NewsSource:
+  """
+  One URL the fetcher polls. Subclasses say how to request it and how to read the body.
+  """
+
+  # which rate limiter (app.core.rate_limit.PROVIDER_LIMITS) requests to this source go through
+  provider = "feeds"
+
+  def __init__(self, url, params=None, headers=None):
+    self.url = url
+    self.params = params or {}
+    self.headers = headers or {}
+
+  @property
+  def key(self):
+    """Identifies the source in source_states, without any credentials"""
+    return f"{self.url}?{urlencode(sorted(self.params.items()))}" if self.params else self.url
+
+  def parse(self, response):
+    """
+    :param response: The successful requests.Response.
+    :return: A list of ArticleData.
+    """
+    raise NotImplementedError
+
+
+class NewsAPISource(NewsSource):
+  """One page of NewsAPI top headlines for a country and optional category"""
+
+  provider = "newsapi"
+
+  def __init__(self, api_key, country="us", category=None, page=1, page_size=100, url=NEWSAPI_TOP_HEADLINES):
+    params = {"country": country, "pageSize": page_size, "page": page}
+    if category:
+      params["category"] = category
+    # the key goes in a header so it never ends up in source_states or logs
+    super().__init__(url, params, {"X-Api-Key": api_key or ""})
+
+  def parse(self, response):
+    return parse_newsapi_articles(response.json())
+
+
+class FeedSource(NewsSource):
+  """An RSS 2.0 or Atom feed"""
+
+  def parse(self, response):
+    return parse_feed(response.content, urlparse(self.url).netloc)
+
+
+def configured_sources(api_key, countries="us", categories="", pages=1, feeds=""):
+  """
+  Builds the list of sources to poll.
+  :param api_key: NewsAPI key, NewsAPI is skipped without one.
+  :param countries: Comma separated NewsAPI countries.
+  :param categories: Comma separated NewsAPI categories, empty for all of them.
+  :param pages: How many pages of 100 to fetch per country and category.
+  :param feeds: Comma separated RSS/Atom feed URLs.
+  :return: A list of NewsSource.
+  """
+  sources = []
+  if api_key:
+    category_list = [category.strip() for category in categories.split(",") if category.strip()] or [None]
+    for country in (country.strip() for country in countries.split(",")):
+      if not country:
+        continue
+      for category in category_list:
+        for page in range(1, pages + 1):
+          sources.append(NewsAPISource(api_key, country, category, page))
+  sources.extend(FeedSource(url.strip()) for url in feeds.split(",") if url.strip())
+  return sources
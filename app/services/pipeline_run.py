@@ -0,0 +1,172 @@
+import logging
+import os
+import time
+
+from app.database import dialect_insert
+from app.models.pipeline_checkpoint import PipelineCheckpoint
+from app.services.analysis_worker import AnalysisWorker
+from app.services.job_queue import AnalysisQueue
+from app.services.retention import ThreatRetention
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetedPipeline:
+  """
+  The pipeline cut into small steps that each commit, run for at most a time budget per
+  invocation, so a serverless cron finishes inside the platform's execution limit.
+
+  A cycle goes through three phases: retention (one batch of expired threats per step),
+  fetch (new articles become jobs in the analysis queue) and analyze (one queue batch per
+  step). Where the cycle stands is saved in pipeline_checkpoints after every step, and the
+  pending articles live in the queue, so the next invocation picks up where the last one
+  stopped and never redoes a finished step. A new cycle starts once the previous one is done,
+  or once it is older than cycle_seconds: its unfinished jobs stay in the queue and are
+  analyzed by the new cycle, which fetches the news first, so invocations that come rarely
+  (a daily cron) never skip a day's fetch to finish an old cycle.
+  """
+
+  def __init__(self, name="cron", budget_seconds=None, retention=None, fetcher=None, queue=None,
+               worker=None, analyze=None, cycle_seconds=None, first_batch_seconds=None, clock=time.monotonic):
+    """
+    :param name: Name of the checkpoint row.
+    :param budget_seconds: Time one invocation may spend, SHIELD_CRON_BUDGET_SECONDS, default 50.
+    :param retention: The ThreatRetention for the retention phase.
+    :param fetcher: The NewsFetcher for the fetch phase, created on first use.
+    :param queue: The AnalysisQueue fetched articles go to.
+    :param worker: The AnalysisWorker that drains the queue in the analyze phase.
+    :param analyze: Whether invocations analyze the queue themselves. Off when worker
+                    processes do it (SHIELD_ANALYSIS_QUEUE=1).
+    :param cycle_seconds: Age at which an unfinished cycle is left for a new one,
+                          SHIELD_CRON_CYCLE_SECONDS, default 3600.
+    :param first_batch_seconds: Time an analyze batch is expected to take until one has been
+                                timed in the invocation, SHIELD_CRON_FIRST_BATCH_SECONDS,
+                                default 15. No batch starts with less than that left.
+    :param clock: Monotonic clock, in seconds.
+    """
+    self.name = name
+    self.budget_seconds = budget_seconds or float(os.getenv("SHIELD_CRON_BUDGET_SECONDS", "50"))
+    self.retention = retention or ThreatRetention(days=5)
+    self._fetcher = fetcher
+    self.queue = queue or AnalysisQueue()
+    self.worker = worker or AnalysisWorker(queue=self.queue)
+    self.analyze = analyze if analyze is not None else os.getenv("SHIELD_ANALYSIS_QUEUE", "0") != "1"
+    self.cycle_seconds = cycle_seconds or float(os.getenv("SHIELD_CRON_CYCLE_SECONDS", "3600"))
+    self.first_batch_seconds = first_batch_seconds or float(os.getenv("SHIELD_CRON_FIRST_BATCH_SECONDS", "15"))
+    self.clock = clock
+
+  @property
+  def fetcher(self):
+    if self._fetcher is None:
+      from app.services.news_fetcher import NewsFetcher
+      self._fetcher = NewsFetcher()
+    return self._fetcher
+
+  def run(self, db):
+    """
+    Runs steps until the cycle is done or the budget is spent, checkpointing after each.
+    A step is only started while it is expected to fit: a fetch needs at least one request
+    timeout left, and is cut to what is left; an analyze step is given at least as long as
+    the slowest one so far in this invocation, or first_batch_seconds before the first one.
+    :param db: Database session.
+    :return: A dictionary with the status ("ok" when the cycle finished, "partial" when the
+             budget ran out, "paused" while the Gemini quota is exhausted), the checkpoint
+             state the next invocation resumes from, with the ThreatProcessor counters
+             (cache hits, prompt tokens, ...) summed over the cycle, and the time spent.
+    """
+    started = self.clock()
+    deadline = started + self.budget_seconds
+    state = self.load(db)
+    if state is None or state["phase"] == "done" or time.time() - state["started_at"] > self.cycle_seconds:
+      if state is not None and state["phase"] != "done":
+        logger.info("Pipeline cycle %d left unfinished in phase %s, starting a new one", state["cycle"], state["phase"])
+      state = self.new_cycle(state)
+      self.save(db, state)
+
+    status = "ok"
+    slowest_batch = None
+    while state["phase"] != "done":
+      step_started = self.clock()
+      if state["phase"] == "fetch":
+        expected = self.fetcher.timeout
+      elif state["phase"] == "analyze":
+        expected = self.first_batch_seconds if slowest_batch is None else slowest_batch
+      else:
+        expected = 0
+      if step_started >= deadline or deadline - step_started < expected:
+        status = "partial"
+        break
+      if state["phase"] == "retention":
+        self.retention_step(db, state)
+      elif state["phase"] == "fetch":
+        self.fetch_step(db, state, deadline - step_started)
+      elif self.analyze_step(db, state, deadline - step_started):
+        slowest_batch = max(slowest_batch or 0.0, self.clock() - step_started)
+      else:
+        status = "paused"
+        break
+      self.save(db, state)
+
+    if status != "ok":
+      logger.info("Pipeline cycle %d stopped in phase %s (%s)", state["cycle"], state["phase"], status)
+    return {"status": status, **state, "elapsed_seconds": round(self.clock() - started, 3)}
+
+  def retention_step(self, db, state):
+    state["deleted_old"] += self.retention.expire(db, max_batches=1)
+    if self.retention.finished:
+      state["phase"] = "fetch"
+
+  def fetch_step(self, db, state, time_left):
+    articles = self.fetcher.fetch_and_convert(db, time_budget=time_left)
+    # the sources' validators, the jobs and the checkpoint commit together, so a crash in
+    # between refetches the sources instead of getting a 304 for articles never queued
+    self.fetcher.save_source_states(db)
+    state["enqueued"] += self.queue.enqueue(db, articles.articles, commit=False)
+    state["phase"] = "analyze" if self.analyze else "done"
+
+  def analyze_step(self, db, state, time_left):
+    """
+    :param time_left: Seconds left of the budget, the most the batch may wait for the quota.
+    :return: False if nothing could be claimed because the queue is paused.
+    """
+    before = dict(self.worker.stats)
+    processor_before = dict(self.worker.processor_stats)
+    if not self.worker.run_once(db, time_budget=time_left):
+      if self.queue.paused_until(db):
+        return False
+      state["phase"] = "done"
+      return True
+    state["analyzed"] += self.worker.stats["completed"] - before["completed"]
+    state["new_threats"] += self.worker.stats["new_threats"] - before["new_threats"]
+    for key, value in self.worker.processor_stats.items():
+      state[key] = state.get(key, 0) + value - processor_before.get(key, 0)
+    return True
+
+  @staticmethod
+  def new_cycle(previous):
+    """
+    :param previous: The state of the finished cycle, or None.
+    :return: The state a new cycle starts from.
+    """
+    return {
+      "cycle": (previous or {}).get("cycle", 0) + 1, "phase": "retention", "started_at": time.time(),
+      "deleted_old": 0, "enqueued": 0, "analyzed": 0, "new_threats": 0,
+    }
+
+  def load(self, db):
+    """
+    :param db: Database session.
+    :return: The saved state, or None before the first run.
+    """
+    checkpoint = db.get(PipelineCheckpoint, self.name)
+    return dict(checkpoint.state) if checkpoint else None
+
+  def save(self, db, state):
+    """Stores the state and commits"""
+    stmt = dialect_insert(db, PipelineCheckpoint)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"state": stmt.excluded.state, "updated_at": stmt.excluded.updated_at}
+    )
+    db.execute(stmt, {"name": self.name, "state": state, "updated_at": time.time()})
+    db.commit()
@@ -0,0 +1,79 @@
+import json
+import os
+import re
+
+from app.core.rate_limit import estimate_tokens
+from app.schemas.threat import ArticleData
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class PromptEncoder:
+  """
+  Writes a batch of articles into a compact Gemini prompt: the instructions once, then one
+  JSON array per article holding only what the model reads (id, title, source and a
+  trimmed description). URLs, publish dates, null values and repeated key names never
+  reach the prompt, they cost tokens and latency without changing the verdict.
+  """
+
+  INSTRUCTIONS = (
+    "Assess each news article below as a possible security threat. Each line is one article as a JSON "
+    "array: [id, title, source, description]. Return one result for EVERY line with: article_id (the id "
+    "exactly as given), title (as given), is_threat (boolean), threat_level (1-10), category (1-2 words), "
+    "summary (brief), keywords (list), confidence (0.0-1.0) and reason (a brief statement of why or why "
+    "not it is a threat).\n"
+  )
+
+  def __init__(self, max_description_chars=None):
+    """
+    :param max_description_chars: Descriptions are cut to this many characters, at a word
+                                  boundary, SHIELD_PROMPT_DESCRIPTION_CHARS, default 300.
+                                  0 leaves descriptions out.
+    """
+    self.max_description_chars = (max_description_chars if max_description_chars is not None
+                                  else int(os.getenv("SHIELD_PROMPT_DESCRIPTION_CHARS", "300")))
+
+  def truncate(self, text):
+    """
+    :param text: A description, possibly None.
+    :return: The text with its whitespace collapsed, cut to max_description_chars.
+    """
+    text = _WHITESPACE.sub(" ", text or "").strip()
+    if len(text) <= self.max_description_chars:
+      return text
+    cut = text[:self.max_description_chars]
+    if " " in cut:
+      cut = cut.rsplit(" ", 1)[0]
+    return cut + "…"
+
+  def encode_article(self, article: ArticleData, article_id):
+    """
+    :param article: The article to write.
+    :param article_id: The id Gemini echoes back.
+    :return: One prompt line.
+    """
+    fields = [article_id, _WHITESPACE.sub(" ", article.title).strip(), article.source]
+    description = self.truncate(article.description) if self.max_description_chars else ""
+    if description:
+      fields.append(description)
+    return json.dumps(fields, ensure_ascii=False, separators=(",", ":"))
+
+  def encode(self, articles: list[ArticleData], article_ids: list[str]):
+    """
+    :param articles: The articles of one request.
+    :param article_ids: The id of each article.
+    :return: The full prompt.
+    """
+    return self.INSTRUCTIONS + "\n".join(
+        self.encode_article(article, article_id) for article, article_id in zip(articles, article_ids))
+
+  def article_tokens(self, article: ArticleData, article_id="000"):
+    """
+    :param article: An article.
+    :param article_id: The id it is sent with, a typical one is enough for sizing.
+    :return: Estimated prompt tokens of its line.
+    """
+    return estimate_tokens(self.encode_article(article, article_id)) + 1
+
+  def instruction_tokens(self):
+    return estimate_tokens(self.INSTRUCTIONS)
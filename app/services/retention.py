@@ -0,0 +1,125 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+from app.core import metrics
+from app.core.response_cache import bump_write_generation
+from app.models.threat import Threat
+from app.services.archive import ThreatArchive
+from app.services.deduplicator import Deduplicator
+from app.services.job_queue import AnalysisQueue
+from app.services.rollup import ThreatRollups
+
+logger = logging.getLogger(__name__)
+
+
+class ThreatRetention:
+  """
+  Expires threats a whole UTC day at a time. Every threat carries its created_day, and a
+  day is removed through the created_day index in small batches, each in its own short
+  transaction, so the cost of a cleanup depends on how much expired, not on the size of
+  the table, and a pipeline write never waits behind one large DELETE.
+
+  When SHIELD_ARCHIVE_DIR is set, each batch is written to the compressed archive before it
+  is deleted, so expired threats stay available for trend analysis outside the table the
+  API reads from.
+  """
+
+  def __init__(self, days=5, batch_size=None, archive=None):
+    """
+    :param days: How many full days of threats to keep, besides today.
+    :param batch_size: Rows removed per transaction, SHIELD_RETENTION_BATCH_SIZE, default 500.
+    :param archive: Where expired threats are kept, a ThreatArchive from the environment by default.
+    """
+    self.days = days
+    self.batch_size = batch_size or int(os.getenv("SHIELD_RETENTION_BATCH_SIZE", "500"))
+    self.archive = archive if archive is not None else ThreatArchive()
+    self.rollups = ThreatRollups()
+    self.deduplicator = Deduplicator()
+    self.queue = AnalysisQueue()
+    # whether the last expire call removed everything that was due
+    self.finished = False
+
+  def cutoff_day(self, now=None):
+    """
+    :param now: The current time, defaults to now in UTC.
+    :return: The oldest day that is kept, every day before it is expired.
+    """
+    now = now or datetime.now(timezone.utc)
+    return (now.astimezone(timezone.utc) - timedelta(days=self.days)).date()
+
+  def expire(self, db, now=None, max_batches=None):
+    """
+    Removes the threats of every expired day, along with the remembered URLs of articles
+    seen and the analysis jobs finished before the cutoff. Commits after each batch.
+    :param db: Database session to write to.
+    :param now: The current time, defaults to now in UTC.
+    :param max_batches: Stop after this many batches of threats, and as many of seen URLs
+                        and of jobs (the rest is left for the next run, see finished), or
+                        None to expire everything that is due.
+    :return: How many threats were removed.
+    """
+    with metrics.time_stage("retention"):
+      deleted = self._expire(db, now, max_batches)
+    metrics.count_articles("retention", articles_out=deleted)
+    return deleted
+
+  def _expire(self, db, now, max_batches):
+    cutoff_day = self.cutoff_day(now)
+    deleted = 0
+    batches = 0
+    threats_finished = False
+    while max_batches is None or batches < max_batches:
+      expired = db.execute(
+          select(Threat.__table__)
+          .where(Threat.created_day < cutoff_day)
+          .order_by(Threat.created_day)
+          .limit(self.batch_size)
+      ).all()
+      if not expired:
+        threats_finished = True
+        break
+      if self.archive.enabled:
+        try:
+          self.archive.append(expired)
+        except OSError as e:
+          # a full or read-only disk must not keep expired threats in the table forever
+          logger.error("Archiving %d expired threats failed, deleting them unarchived: %s", len(expired), e)
+      self.rollups.record_removed(db, expired)
+      db.execute(delete(Threat).where(Threat.id.in_([row.id for row in expired])))
+      db.commit()
+      deleted += len(expired)
+      batches += 1
+      if len(expired) < self.batch_size:
+        threats_finished = True
+        break
+
+    # the same window for seen URLs, from midnight UTC of the cutoff day
+    cutoff = datetime.combine(cutoff_day, datetime.min.time())
+    seen_finished = self._prune(db, lambda limit: self.deduplicator.prune(db, cutoff, limit=limit), max_batches)
+    # finished analysis jobs, on the same window
+    before = cutoff.replace(tzinfo=timezone.utc).timestamp()
+    jobs_finished = self._prune(db, lambda limit: self.queue.prune(db, before, limit=limit), max_batches)
+    self.finished = threats_finished and seen_finished and jobs_finished
+
+    if deleted:
+      bump_write_generation()
+    return deleted
+
+  def _prune(self, db, prune, max_batches):
+    """
+    :param db: Database session, committed after each batch.
+    :param prune: Callable removing up to the given number of rows, returning how many it removed.
+    :param max_batches: Most batches to run, or None for as many as it takes.
+    :return: True once nothing is left to remove, False if max_batches ran out first.
+    """
+    batches = 0
+    while max_batches is None or batches < max_batches:
+      removed = prune(self.batch_size)
+      db.commit()
+      batches += 1
+      if removed < self.batch_size:
+        return True
+    return False
@@ -0,0 +1,125 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+from app.database import dialect_insert
+from app.models.threat import Threat
+from app.models.threat_rollup import ThreatRollup
+
+HIGH_THREAT_LEVEL = 7
+
+
+def hour_bucket(value):
+  """
+  Truncates a timestamp to its hour, as a naive UTC datetime.
+  :param value: A naive (assumed UTC) or aware datetime.
+  :return: The start of the hour it falls in.
+  """
+  if value.tzinfo is not None:
+    value = value.astimezone(timezone.utc).replace(tzinfo=None)
+  return value.replace(minute=0, second=0, microsecond=0)
+
+
+class ThreatRollups:
+  """
+  Keeps the threat_rollups table (threat counts per hour, category and level) in step with
+  the threats table, so overview and stats endpoints read a few hundred small rows instead
+  of scanning every threat.
+  """
+
+  def record_added(self, db, threats):
+    """
+    Counts newly stored threats in. Does not commit.
+    :param db: Database session or connection.
+    :param threats: Rows with created_at, effective_threat_level and effective_category.
+    """
+    self._apply(db, self._count(threats))
+
+  def record_removed(self, db, threats):
+    """
+    Counts threats out right before they are deleted. Does not commit.
+    :param db: Database session or connection.
+    :param threats: Rows with created_at, effective_threat_level and effective_category.
+    """
+    self._apply(db, {key: -count for key, count in self._count(threats).items()})
+
+  def record_review(self, db, created_at, old_level, old_category, new_level, new_category):
+    """
+    Moves one threat between buckets after a human override. Does not commit.
+    :param db: Database session or connection.
+    :param created_at: When the threat was stored.
+    :param old_level: Effective threat level before the review.
+    :param old_category: Effective category before the review.
+    :param new_level: Effective threat level after the review.
+    :param new_category: Effective category after the review.
+    """
+    if (old_level, old_category) == (new_level, new_category):
+      return
+    hour = hour_bucket(created_at)
+    self._apply(db, {(hour, old_category, old_level): -1, (hour, new_category, new_level): 1})
+
+  def rebuild(self, db):
+    """
+    Recomputes the whole rollup from the threats table, used to backfill it once.
+    :param db: Database session or connection.
+    """
+    db.execute(delete(ThreatRollup))
+    rows = db.execute(select(Threat.created_at, Threat.effective_threat_level, Threat.effective_category))
+    self._apply(db, self._count(rows))
+
+  def summary(self, db, days=3):
+    """
+    Aggregates the rollup in a single read.
+    :param db: Database session.
+    :param days: Size of the "recent" window.
+    :return: A dictionary of totals, plus per category, per level and per hour counts for
+             the recent window.
+    """
+    since = hour_bucket(datetime.now(timezone.utc) - timedelta(days=days))
+    total = high = recent = 0
+    by_category = Counter()
+    by_level = Counter()
+    by_hour = Counter()
+    for row in db.execute(select(ThreatRollup)).scalars():
+      total += row.count
+      if row.threat_level >= HIGH_THREAT_LEVEL:
+        high += row.count
+      if row.hour >= since:
+        recent += row.count
+        by_category[row.category] += row.count
+        by_level[row.threat_level] += row.count
+        by_hour[row.hour] += row.count
+
+    return {
+      "total_threats": total,
+      "high_threats": high,
+      "window_days": days,
+      "recent_threats": recent,
+      "by_category": dict(by_category.most_common()),
+      "by_level": {level: by_level[level] for level in sorted(by_level)},
+      "by_hour": [{"hour": hour, "count": by_hour[hour]} for hour in sorted(by_hour)],
+    }
+
+  def _count(self, threats):
+    counts = Counter()
+    for threat in threats:
+      if threat.created_at is None:
+        continue
+      counts[(hour_bucket(threat.created_at), threat.effective_category, threat.effective_threat_level)] += 1
+    return counts
+
+  def _apply(self, db, deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+      return
+    stmt = dialect_insert(db, ThreatRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["hour", "category", "threat_level"],
+        set_={"count": ThreatRollup.count + stmt.excluded.count}
+    )
+    db.execute(stmt, [
+        {"hour": hour, "category": category, "threat_level": level, "count": delta}
+        for (hour, category, level), delta in deltas.items()
+    ])
+    db.execute(delete(ThreatRollup).where(ThreatRollup.count <= 0))
@@ -0,0 +1,188 @@
+import re
+
+from sqlalchemy import false, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import load_only
+
+from app.models.threat import Threat
+from app.utils.pagination import (THREAT_FIELD_COLUMNS, decode_offset_cursor, encode_offset_cursor,
+                                  parse_fields, serialize_threat)
+
+# SQLite: a standalone FTS5 table kept in sync with threats by triggers, so every write
+# path (ORM, bulk upsert, review, retention delete) updates it without extra code.
+SQLITE_FTS_DDL = [
+  """
+  CREATE VIRTUAL TABLE IF NOT EXISTS threats_fts USING fts5(
+    title, description, summary, reason, keywords, notes, tokenize='porter unicode61'
+  )
+  """,
+  """
+  CREATE TRIGGER IF NOT EXISTS threats_fts_insert AFTER INSERT ON threats BEGIN
+    INSERT INTO threats_fts(rowid, title, description, summary, reason, keywords, notes)
+    VALUES (new.id, new.title, new.description, new.ai_summary, new.ai_reason, new.ai_keywords, new.human_notes);
+  END
+  """,
+  """
+  CREATE TRIGGER IF NOT EXISTS threats_fts_update
+  AFTER UPDATE OF title, description, ai_summary, ai_reason, ai_keywords, human_notes ON threats BEGIN
+    DELETE FROM threats_fts WHERE rowid = old.id;
+    INSERT INTO threats_fts(rowid, title, description, summary, reason, keywords, notes)
+    VALUES (new.id, new.title, new.description, new.ai_summary, new.ai_reason, new.ai_keywords, new.human_notes);
+  END
+  """,
+  """
+  CREATE TRIGGER IF NOT EXISTS threats_fts_delete AFTER DELETE ON threats BEGIN
+    DELETE FROM threats_fts WHERE rowid = old.id;
+  END
+  """,
+]
+
+SQLITE_FTS_BACKFILL = """
+  INSERT INTO threats_fts(rowid, title, description, summary, reason, keywords, notes)
+  SELECT id, title, description, ai_summary, ai_reason, ai_keywords, human_notes FROM threats
+"""
+
+# bm25 weights per FTS column, title and keywords count the most
+SQLITE_SEARCH = """
+  SELECT rowid AS id, bm25(threats_fts, 10.0, 2.0, 4.0, 1.0, 8.0, 1.0) AS rank
+  FROM threats_fts WHERE threats_fts MATCH :query
+  ORDER BY rank, rowid DESC LIMIT :limit OFFSET :offset
+"""
+
+# Postgres: a generated tsvector column, weighted the same way, behind a GIN index
+POSTGRES_FTS_DDL = [
+  """
+  ALTER TABLE threats ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(ai_keywords::text, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(ai_summary, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(ai_reason, '') || ' ' || coalesce(human_notes, '')), 'D')
+  ) STORED
+  """,
+  "CREATE INDEX IF NOT EXISTS ix_threats_search_vector ON threats USING GIN (search_vector)",
+]
+
+POSTGRES_SEARCH = """
+  SELECT id, ts_rank_cd(search_vector, query) AS rank
+  FROM threats, websearch_to_tsquery('english', :query) AS query
+  WHERE search_vector @@ query
+  ORDER BY rank DESC, id DESC LIMIT :limit OFFSET :offset
+"""
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def install_search_index(connection):
+  """
+  Creates the full-text index for the connection's backend if it is missing. Idempotent,
+  run by app.migrations on startup.
+  :param connection: An open SQLAlchemy connection inside a transaction.
+  """
+  dialect = connection.dialect.name
+  if dialect == "sqlite":
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'threats_fts'"
+    )).first()
+    for statement in SQLITE_FTS_DDL:
+      connection.execute(text(statement))
+    if not exists:
+      connection.execute(text(SQLITE_FTS_BACKFILL))
+  elif dialect == "postgresql":
+    for statement in POSTGRES_FTS_DDL:
+      connection.execute(text(statement))
+
+
+def fts_query(q):
+  """
+  Turns free user input into a safe FTS5 query: every word quoted, all of them required.
+  :param q: The raw search string.
+  :return: An FTS5 MATCH expression, or an empty string if q holds no words.
+  """
+  return " ".join(f'"{word}"' for word in _WORD.findall(q))
+
+
+def search_condition(dialect, q):
+  """
+  The full-text match as a WHERE condition on threats, for queries that filter rather than
+  rank (e.g. exports).
+  :param dialect: Name of the database dialect.
+  :param q: The raw search string.
+  :return: A SQL expression usable in select(Threat).where(...).
+  """
+  if dialect == "postgresql":
+    return text("threats.search_vector @@ websearch_to_tsquery('english', :search_q)").bindparams(search_q=q)
+  if dialect == "sqlite":
+    query = fts_query(q)
+    if not query:
+      return false()
+    matches = text("SELECT rowid FROM threats_fts WHERE threats_fts MATCH :search_q").bindparams(search_q=query)
+    return Threat.id.in_(matches.columns(rowid=Threat.id.type))
+  pattern = f"%{q}%"
+  return Threat.title.ilike(pattern) | Threat.ai_summary.ilike(pattern)
+
+
+def search_threat_ids(db, q, limit, offset=0):
+  """
+  Runs a ranked full-text search.
+  :param db: Database session.
+  :param q: The raw search string.
+  :param limit: Max ids to return.
+  :param offset: How many of the best matches to skip.
+  :return: Matching threat ids, best match first.
+  """
+  dialect = db.get_bind().dialect.name
+  params = {"limit": limit, "offset": offset}
+  if dialect == "postgresql":
+    return [row.id for row in db.execute(text(POSTGRES_SEARCH), {**params, "query": q})]
+
+  if dialect == "sqlite":
+    query = fts_query(q)
+    if not query:
+      return []
+    try:
+      return [row.id for row in db.execute(text(SQLITE_SEARCH), {**params, "query": query})]
+    except OperationalError:
+      # SQLite built without FTS5, or the index has not been installed yet
+      db.rollback()
+
+  pattern = f"%{q}%"
+  rows = (
+      db.query(Threat.id)
+      .filter(Threat.title.ilike(pattern) | Threat.ai_summary.ilike(pattern))
+      .order_by(Threat.created_at.desc(), Threat.id.desc())
+      .limit(limit).offset(offset)
+  )
+  return [row.id for row in rows]
+
+
+def search_threats_page(db, q, limit, cursor=None, fields=None):
+  """
+  One page of ranked search results, shaped like the other list endpoints.
+  :param db: Database session.
+  :param q: The raw search string.
+  :param limit: Max rows in the page.
+  :param cursor: The next_cursor of the previous page, or None for the first page.
+  :param fields: Comma separated field names to return, or None for all of them.
+  :return: A dictionary with the page items and the next_cursor (None on the last page).
+  :raises ValueError: for an invalid cursor or unknown fields.
+  """
+  field_names = parse_fields(fields)
+  offset = decode_offset_cursor(cursor) if cursor else 0
+
+  ids = search_threat_ids(db, q, limit + 1, offset)
+  next_cursor = None
+  if len(ids) > limit:
+    ids = ids[:limit]
+    next_cursor = encode_offset_cursor(offset + limit)
+
+  columns = {Threat.id}
+  for field in field_names:
+    columns.update(THREAT_FIELD_COLUMNS[field])
+  rows = {threat.id: threat for threat in
+          db.query(Threat).options(load_only(*columns)).filter(Threat.id.in_(ids))}
+
+  return {
+    "items": [serialize_threat(rows[threat_id], field_names) for threat_id in ids if threat_id in rows],
+    "next_cursor": next_cursor,
+  }
@@ -1,9 +1,20 @@
-import json
+import logging
 
+from app.core import metrics
+from app.core.response_cache import bump_write_generation
+from app.database import dialect_insert
 from app.models.threat import Threat
 from app.schemas.threat import ListArticleData
 from app.services.ai_analyzer import AIAnalyzer
+from app.services.analysis_cache import AnalysisCache
+from app.services.deduplicator import Deduplicator
 from app.services.mock_ai import MockAI
+from app.services.near_duplicates import NearDuplicateDetector
+from app.services.rollup import ThreatRollups
+from app.services.triage import TriageFilter
+from app.utils.text import normalize_text
+
+logger = logging.getLogger(__name__)
 
 
 class ThreatProcessor:
@@ -16,30 +27,75 @@ class ThreatProcessor:
       # creating AI analyzer to analyze articles.
       self.mock_ai = MockAI()
       self.ai_analyzer = AIAnalyzer()
+      # keeps articles the word lists find clearly harmless away from Gemini
+      self.triage = TriageFilter()
+      # remembers every analyzed article so rejected ones are not paid for again
+      self.deduplicator = Deduplicator()
+      # folds syndicated copies of one story into a single analysis and threat
+      self.near_duplicates = NearDuplicateDetector()
+      # reuses earlier analysis of the same story, skipping the Gemini call
+      self.analysis_cache = AnalysisCache()
+      # keeps the per hour/category/level counts behind the stats endpoints current
+      self.rollups = ThreatRollups()
+      # counters from the last process_articles call, reported by the cron endpoint
+      self.stats = {}
+      # URLs of the articles the last process_articles call got an analysis for
+      self.analyzed_urls = set()
 
-
-    def find_matching_dictionary(self, title, ai_results):
+    def match_results(self, articles, ai_results):
       """
-      Searches for a dictionary within a list of dictionaries that matches the specified
-      title. The `ai_results` parameter must be an iterable of dictionaries, each containing
-      a "title" key. This function iterates through the list looking for a dictionary whose
-      "title" key matches the value of the `title` parameter. If such a dictionary is found,
-      it is returned; otherwise, the function returns None.
-
-      :param title: The title to be matched against the "title" key in the dictionaries
-                    from the list.
-      :type title: str
-      :param ai_results: A list of dictionaries, where each dictionary must include a
-                         "title" key.
+      Pairs every article with its AI result in one pass. An index of the results is built
+      once per batch, keyed on the article_id Gemini echoes back, with the normalized title
+      as a fallback for results that come back without a usable id. That way a result is
+      not dropped because Gemini changed the whitespace, quotes or casing of a title.
+
+      :param articles: The articles that were sent to the analyzer, in the same order.
+      :type articles: list[ArticleData]
+      :param ai_results: The list of result dictionaries returned by the analyzer.
       :type ai_results: list[dict]
-      :return: The first dictionary from the list where the value of the "title" key
-               matches the provided `title`, or None if no match is found.
-      :rtype: dict | None
+      :return: A list with the matching result dictionary (or None) for each article, and
+               the number of results that did not match any article.
+      :rtype: tuple[list[dict | None], int]
+      """
+      by_id = {}
+      by_title = {}
+      for position, result in enumerate(ai_results):
+        if result.get("article_id") is not None:
+          by_id.setdefault(str(result["article_id"]).strip(), position)
+        by_title.setdefault(normalize_text(result.get("title")), position)
+
+      matches = []
+      used = set()
+      for index, article in enumerate(articles):
+        position = by_id.get(AIAnalyzer.article_id(index))
+        if position is None or position in used:
+          position = by_title.get(normalize_text(article.title))
+        if position is None or position in used:
+          matches.append(None)
+          continue
+        used.add(position)
+        matches.append(ai_results[position])
+
+      unmatched = len(ai_results) - len(used)
+      if unmatched:
+        logger.warning("%d of %d AI results did not match any article", unmatched, len(ai_results))
+      return matches, unmatched
+
+    def save_threats(self, rows, db):
+      """
+      Inserts a batch of threats with a single multi-row INSERT ... ON CONFLICT statement on
+      source_url, which works on both SQLite and Postgres. An article that is already stored
+      (e.g. by an overlapping pipeline run) is skipped instead of aborting the batch. Does not
+      commit, the caller owns the transaction.
+      :param rows: A list of dictionaries of Threat column values.
+      :param db: The database session to write to.
+      :return: The Threat rows that were inserted, in no particular order.
       """
-      for result in ai_results:
-        if result["title"] == title:
-          return result
-      return None
+      if not rows:
+        return []
+
+      stmt = dialect_insert(db, Threat).on_conflict_do_nothing(index_elements=["source_url"])
+      return list(db.scalars(stmt.returning(Threat), rows))
 
     def process_articles(self, listArticleData: ListArticleData, db):
       """
@@ -53,19 +109,73 @@ class ThreatProcessor:
           implementation and may be data, a status, or some transformation outcome.
       """
 
-      res = []
-      ai_result_json = self.ai_analyzer.analyze_articles(listArticleData)
-      ai_result_dict = json.loads(ai_result_json)
+      analyzed_urls = []
+      self.analysis_cache.hits = self.analysis_cache.misses = 0
+
+      # near-identical copies of a story ride along with one representative, and copies of a
+      # story stored earlier are attached to that threat without being analyzed again
+      with metrics.time_stage("cluster"):
+        clusters, attached = self.near_duplicates.cluster(db, listArticleData.articles)
+      metrics.count_articles("cluster", len(listArticleData.articles), len(clusters))
+      attached_urls = [url for urls in attached.values() for url in urls]
+      updated = self.near_duplicates.attach(db, attached)
+      analyzed_urls.extend(attached_urls)
+      articles = [cluster.article for cluster in clusters]
+
+      # only articles whose content we have not analyzed recently go to Gemini, once per story
+      keys = [self.analysis_cache.key_for(article) for article in articles]
+      results_by_key = self.analysis_cache.get_many(db, articles)
+      misses = {}
+      for key, article in zip(keys, articles):
+        if key not in results_by_key:
+          misses.setdefault(key, article)
+
+      # triage: confidently harmless articles skip Gemini and count as analyzed non-threats
+      send = []
+      skipped = 0
+      with metrics.time_stage("triage"):
+        scores = self.mock_ai.score_articles(list(misses.values()))
+        for (key, article), score in zip(misses.items(), scores):
+          if self.triage.should_skip(score):
+            results_by_key[key] = self.triage.skipped_result(article, score)
+            skipped += 1
+          else:
+            send.append((key, article, score))
+      metrics.count_articles("triage", len(misses), len(send))
 
-      for article in listArticleData.articles:
-        match_dict = self.find_matching_dictionary(article.title, ai_result_dict)
+      fresh = []
+      verdicts = []
+      unmatched = 0
+      prompt_tokens = 0
+      if send:
+        send_articles = [article for _, article, _ in send]
+        ai_result_dict = self.ai_analyzer.analyze_articles(ListArticleData(articles=send_articles))
+        prompt_tokens = self.ai_analyzer.prompt_tokens
+        matches, unmatched = self.match_results(send_articles, ai_result_dict)
+        for (key, article, score), match_dict in zip(send, matches):
+          if match_dict:
+            fresh.append((article, match_dict))
+            verdicts.append((score, match_dict.get("is_threat")))
+            results_by_key[key] = match_dict
+      self.analysis_cache.put_many(db, fresh)
+      self.triage.record_agreement(db, verdicts)
+
+      rows = {}
+      for key, cluster in zip(keys, clusters):
+        article = cluster.article
+        match_dict = results_by_key.get(key)
+        if match_dict:
+          analyzed_urls.append(article.url)
+          analyzed_urls.extend(cluster.member_urls)
         if match_dict and match_dict.get("is_threat"):
-          threat = Threat(
+          rows.setdefault(article.url, dict(
               title=article.title,
               description=article.description,
               source=article.source,
               source_url=article.url,
               published_at=article.published_at,
+              simhash=cluster.fingerprint,
+              related_urls=list(dict.fromkeys(cluster.member_urls)) or None,
 
               ai_threat_level=match_dict.get("threat_level"),
               ai_category=match_dict.get("category"),
@@ -73,11 +183,31 @@ class ThreatProcessor:
               ai_confidence=match_dict.get("confidence"),
               ai_keywords=match_dict.get("keywords"),
               ai_reason=match_dict.get("reason")
-          )
-          res.append(threat)
-          db.add(threat)
-          db.commit()
+          ))
+
+      # the whole batch lands in one transaction: threats, cache entries and seen URLs
+      with metrics.time_stage("persist"):
+        res = self.save_threats(list(rows.values()), db)
+        self.rollups.record_added(db, res)
+
+        # non-threats count as seen too, so the next run does not send them to Gemini again.
+        # articles from a chunk that failed are left out so they get another try.
+        self.deduplicator.mark_seen(db, analyzed_urls)
+        db.commit()
+      metrics.count_articles("persist", len(rows), len(res))
+      self.analyzed_urls = set(analyzed_urls)
+      if res or updated:
+        bump_write_generation()
 
+      self.stats = {
+        "cache_hits": self.analysis_cache.hits,
+        "cache_misses": self.analysis_cache.misses,
+        "unmatched_results": unmatched,
+        "unanswered_articles": len(send) - len(fresh),
+        "triage_skipped": skipped,
+        "near_duplicates": len(attached_urls) + sum(len(cluster.member_urls) for cluster in clusters),
+        "prompt_tokens_estimated": prompt_tokens,
+      }
       return res
 
     # def process_article(self, article: ArticleData, database):
@@ -0,0 +1,85 @@
+import os
+import random
+from collections import Counter
+
+from sqlalchemy import select
+
+from app.database import dialect_insert
+from app.models.triage_agreement import TriageAgreement
+
+
+class TriageFilter:
+  """
+  Decides which articles are harmless enough to skip Gemini, from the MockAI safe score.
+  A small random sample of those is analyzed anyway, and Gemini's verdict on every analyzed
+  article is counted per score bucket in triage_agreement, which shows how many real
+  threats a given cutoff would have skipped.
+  """
+
+  def __init__(self, cutoff=None, sample_rate=None, rng=None):
+    """
+    :param cutoff: Safe score at or above which an article skips Gemini,
+                   SHIELD_TRIAGE_SAFE_CUTOFF, default 0.75. Above 1 disables triage.
+    :param sample_rate: Share of skippable articles sent to Gemini anyway,
+                        SHIELD_TRIAGE_SAMPLE_RATE, default 0.05.
+    :param rng: random.Random used for sampling.
+    """
+    self.cutoff = cutoff if cutoff is not None else float(os.getenv("SHIELD_TRIAGE_SAFE_CUTOFF", "0.75"))
+    self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("SHIELD_TRIAGE_SAMPLE_RATE", "0.05"))
+    self.rng = rng or random.Random()
+
+  def should_skip(self, score):
+    return score >= self.cutoff and self.rng.random() >= self.sample_rate
+
+  @staticmethod
+  def skipped_result(article, score):
+    """The analysis result recorded for an article that skipped Gemini"""
+    return {
+      "is_threat": False, "threat_level": 1, "category": "none", "summary": "", "keywords": [],
+      "confidence": round(score, 3), "title": article.title,
+      "reason": "Skipped by triage: only safe words",
+    }
+
+  @staticmethod
+  def bucket(score):
+    return min(int(score * 10), 9)
+
+  def record_agreement(self, db, verdicts):
+    """
+    Counts Gemini's verdicts into the score buckets. Does not commit.
+    :param db: Database session or connection.
+    :param verdicts: (safe score, is_threat) pairs for articles Gemini analyzed.
+    """
+    counts = Counter((self.bucket(score), bool(is_threat)) for score, is_threat in verdicts)
+    if not counts:
+      return
+    rows = {}
+    for (bucket, is_threat), count in counts.items():
+      row = rows.setdefault(bucket, {"bucket": bucket, "llm_threats": 0, "llm_safe": 0})
+      row["llm_threats" if is_threat else "llm_safe"] += count
+
+    stmt = dialect_insert(db, TriageAgreement)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["bucket"],
+        set_={
+          "llm_threats": TriageAgreement.llm_threats + stmt.excluded.llm_threats,
+          "llm_safe": TriageAgreement.llm_safe + stmt.excluded.llm_safe,
+        }
+    )
+    db.execute(stmt, list(rows.values()))
+
+  def agreement(self, db):
+    """
+    :param db: Database session.
+    :return: Per bucket counts, plus how often Gemini agreed that articles at or above the
+             current cutoff are not threats.
+    """
+    buckets = list(db.scalars(select(TriageAgreement).order_by(TriageAgreement.bucket)))
+    above = [row for row in buckets if row.bucket >= self.bucket(self.cutoff)]
+    analyzed = sum(row.llm_threats + row.llm_safe for row in above)
+    return {
+      "cutoff": self.cutoff,
+      "buckets": [{"min_score": row.bucket / 10, "llm_threats": row.llm_threats, "llm_safe": row.llm_safe}
+                  for row in buckets],
+      "agreement_at_cutoff": sum(row.llm_safe for row in above) / analyzed if analyzed else None,
+    }
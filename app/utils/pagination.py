@@ -0,0 +1,156 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+
+from app.models.threat import Threat
+
+# Public ThreatResponse fields -> the columns needed to serialize them.
+# Used for ?fields= projection so only the requested columns are loaded.
+THREAT_FIELD_COLUMNS = {
+  "id": [Threat.id],
+  "title": [Threat.title],
+  "description": [Threat.description],
+  "source": [Threat.source],
+  "source_url": [Threat.source_url],
+  "related_urls": [Threat.related_urls],
+  "threat_level": [Threat.ai_threat_level, Threat.human_threat_level],
+  "category": [Threat.ai_category, Threat.human_category],
+  "summary": [Threat.ai_summary],
+  "location": [],
+  "created_at": [Threat.created_at],
+  "confidence": [Threat.ai_confidence],
+  "has_human_review": [Threat.reviewed_by],
+}
+
+
+def encode_cursor(created_at, threat_id):
+  """
+  Builds the opaque cursor pointing just after the given row.
+  :param created_at: created_at of the last row on the page.
+  :param threat_id: id of the last row on the page.
+  :return: A url-safe string.
+  """
+  raw = json.dumps([created_at.isoformat() if created_at else None, threat_id])
+  return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+  """
+  Reverses encode_cursor.
+  :param cursor: The string given back by a client.
+  :return: A (created_at, id) tuple.
+  :raises ValueError: if the cursor was not produced by encode_cursor.
+  """
+  try:
+    created_at, threat_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return datetime.fromisoformat(created_at), int(threat_id)
+  except (TypeError, ValueError, UnicodeError) as e:
+    raise ValueError("Invalid cursor") from e
+
+
+def encode_offset_cursor(offset):
+  """
+  Cursor for result sets that are ordered by relevance rather than by (created_at, id).
+  :param offset: How many rows the next page skips.
+  :return: A url-safe string.
+  """
+  raw = json.dumps({"offset": offset})
+  return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_offset_cursor(cursor):
+  """
+  Reverses encode_offset_cursor.
+  :param cursor: The string given back by a client.
+  :return: The offset.
+  :raises ValueError: if the cursor was not produced by encode_offset_cursor.
+  """
+  try:
+    offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["offset"])
+  except (TypeError, ValueError, KeyError, UnicodeError) as e:
+    raise ValueError("Invalid cursor") from e
+  if offset < 0:
+    raise ValueError("Invalid cursor")
+  return offset
+
+
+def parse_fields(fields):
+  """
+  Parses the ?fields= query parameter.
+  :param fields: Comma separated field names, or None for every field.
+  :return: The list of requested field names.
+  :raises ValueError: if an unknown field is requested.
+  """
+  if not fields:
+    return list(THREAT_FIELD_COLUMNS)
+  requested = [field.strip() for field in fields.split(",") if field.strip()]
+  unknown = [field for field in requested if field not in THREAT_FIELD_COLUMNS]
+  if unknown:
+    raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+  return requested
+
+
+def serialize_threat(threat, fields):
+  """
+  Turns a Threat into a dictionary with only the requested fields.
+  :param threat: The Threat row.
+  :param fields: The field names to include.
+  :return: A dictionary of field -> value.
+  """
+  return {field: getattr(threat, field, None) for field in fields}
+
+
+def page_statement(stmt, limit, cursor=None, fields=None):
+  """
+  Keyset pagination over a select(Threat) statement, newest first. Rows are ordered on
+  (created_at, id) and a page starts right after the cursor, so the cost of a page does
+  not depend on how deep into the results it is. Only the columns behind the requested
+  fields are loaded.
+  :param stmt: A select(Threat) with any filters already applied.
+  :param limit: Max rows in the page.
+  :param cursor: The next_cursor of the previous page, or None for the first page.
+  :param fields: Comma separated field names to return, or None for all of them.
+  :return: The statement to execute (it fetches one extra row to detect a next page) and
+           the parsed field names to hand to build_page.
+  :raises ValueError: for an invalid cursor or unknown fields.
+  """
+  field_names = parse_fields(fields)
+  columns = {Threat.id, Threat.created_at}
+  for field in field_names:
+    columns.update(THREAT_FIELD_COLUMNS[field])
+
+  if cursor:
+    created_at, threat_id = decode_cursor(cursor)
+    stmt = stmt.where(or_(
+        Threat.created_at < created_at,
+        and_(Threat.created_at == created_at, Threat.id < threat_id)
+    ))
+
+  stmt = (
+      stmt.options(load_only(*columns))
+      .order_by(Threat.created_at.desc(), Threat.id.desc())
+      .limit(limit + 1)
+  )
+  return stmt, field_names
+
+
+def build_page(threats, limit, field_names):
+  """
+  Shapes the rows fetched with page_statement into a page.
+  :param threats: The Threat rows, up to limit + 1 of them.
+  :param limit: Max rows in the page.
+  :param field_names: The field names returned by page_statement.
+  :return: A dictionary with the page items and the next_cursor (None on the last page).
+  """
+  next_cursor = None
+  if len(threats) > limit:
+    threats = threats[:limit]
+    next_cursor = encode_cursor(threats[-1].created_at, threats[-1].id)
+
+  return {
+    "items": [serialize_threat(threat, field_names) for threat in threats],
+    "next_cursor": next_cursor,
+  }
@@ -0,0 +1,28 @@
+import hashlib
+import re
+import unicodedata
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_text(value):
+  """
+  Normalizes free text so that cosmetic edits (casing, quotes, punctuation, extra
+  whitespace) don't change its identity.
+  :param value: The text to normalize, None is treated as empty.
+  :return: A lowercase string of words separated by single spaces.
+  """
+  if not value:
+    return ""
+  value = unicodedata.normalize("NFKC", value).casefold()
+  return _NON_WORD.sub(" ", value).strip()
+
+
+def content_hash(*parts):
+  """
+  Stable hash of the normalized parts, used to recognize the same story again.
+  :param parts: Strings (or None) that make up the content.
+  :return: A hex sha256 digest.
+  """
+  joined = "\x1f".join(normalize_text(part) for part in parts)
+  return hashlib.sha256(joined.encode("utf-8")).hexdigest()
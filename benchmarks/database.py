@@ -0,0 +1,25 @@
+import os
+import time
+
+from sqlalchemy import create_engine
+
+from app.database import Base
+from app.migrations import upgrade
+
+
+def make_engine(database_url, workdir):
+  """
+  A freshly migrated, empty database for one benchmark run.
+  :param database_url: A scratch database (every table in it is dropped), or None for a new
+                       SQLite file in workdir.
+  :param workdir: Directory for the SQLite file.
+  :return: The sync engine.
+  """
+  if database_url:
+    engine = create_engine(database_url.replace("postgresql://", "postgresql+psycopg2://", 1))
+    Base.metadata.drop_all(engine)
+  else:
+    path = os.path.join(workdir, f"bench-{time.time_ns()}.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+  upgrade(engine)
+  return engine
@@ -0,0 +1,198 @@
+"""
+Concurrent read load on the API, fully offline: the app is driven in process through
+httpx's ASGI transport against a database seeded with synthetic threats.
+
+  python -m benchmarks.load_test --rows 100000 --clients 32 --requests 4000 --output load.json
+  python -m benchmarks.load_test --mix threats=1,search=3 --no-cache
+
+Reports throughput and p50/p95/p99 latency per route. BENCH_DATABASE_URL (or
+--database-url) seeds that database instead of a throwaway SQLite file; every table in it
+is dropped first.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import async_database_url, get_async_db, get_async_session_factory, get_db
+from app.main import app, response_cache
+from app.services.mock_ai import THREAT_WORDS
+from benchmarks.database import make_engine
+from benchmarks.synthetic import seed_threats
+
+ROUTES = {
+  "threats": lambda rng: "/api/threats",
+  "recent": lambda rng: f"/api/threats/recent?days={rng.randint(1, 5)}",
+  "search": lambda rng: f"/api/threats/search?q={rng.choice(sorted(THREAT_WORDS))}",
+  "level": lambda rng: f"/api/threats/level/{rng.randint(1, 10)}",
+  "fury_overview": lambda rng: "/api/threats/fury-overview",
+  "pending_review": lambda rng: "/api/threats/pending_review",
+}
+DEFAULT_MIX = "threats=3,recent=2,search=2,level=2,fury_overview=1,pending_review=1"
+
+
+def parse_mix(mix):
+  """
+  :param mix: "route=weight,..." with routes from ROUTES.
+  :return: (routes, weights) lists.
+  :raises ValueError: for an unknown route or a bad weight.
+  """
+  routes, weights = [], []
+  for part in mix.split(","):
+    name, _, weight = part.partition("=")
+    if name.strip() not in ROUTES:
+      raise ValueError(f"Unknown route {name.strip()!r}, pick from {', '.join(ROUTES)}")
+    routes.append(name.strip())
+    weights.append(float(weight or 1))
+  return routes, weights
+
+
+def percentile(sorted_values, share):
+  """Nearest-rank percentile of an already sorted list"""
+  if not sorted_values:
+    return None
+  rank = max(1, round(share * len(sorted_values) + 0.5))
+  return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def drive(client, requests, clients, routes, weights, seed):
+  """
+  Sends requests GETs from clients concurrent workers.
+  :return: Route -> list of (seconds, status code), and the wall time of the whole run.
+  """
+  samples = {route: [] for route in routes}
+  remaining = iter(range(requests))
+
+  async def worker(number):
+    rng = random.Random(seed * 1000 + number)
+    for _ in remaining:
+      route = rng.choices(routes, weights)[0]
+      started = time.perf_counter()
+      response = await client.get(ROUTES[route](rng))
+      samples[route].append((time.perf_counter() - started, response.status_code))
+
+  started = time.perf_counter()
+  await asyncio.gather(*(worker(number) for number in range(clients)))
+  return samples, time.perf_counter() - started
+
+
+def report(samples, wall_seconds):
+  routes = {}
+  for route, route_samples in samples.items():
+    latencies = sorted(seconds for seconds, _ in route_samples)
+    routes[route] = {
+      "requests": len(route_samples),
+      "errors": sum(1 for _, status in route_samples if status >= 400),
+      "throughput_rps": round(len(route_samples) / wall_seconds, 2) if wall_seconds else None,
+      **{f"p{int(share * 100)}_ms": round(percentile(latencies, share) * 1000, 3) if latencies else None
+         for share in (0.5, 0.95, 0.99)},
+    }
+  total = sum(len(route_samples) for route_samples in samples.values())
+  return {
+    "requests": total,
+    "wall_seconds": round(wall_seconds, 3),
+    "throughput_rps": round(total / wall_seconds, 2) if wall_seconds else None,
+    "routes": routes,
+  }
+
+
+async def run(args, engine):
+  async_engine = create_async_engine(async_database_url(engine.url))
+  session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+  sync_sessions = sessionmaker(autoflush=False, bind=engine)
+
+  async def get_bench_async_db():
+    async with session_factory() as session:
+      yield session
+
+  def get_bench_db():
+    db = sync_sessions()
+    try:
+      yield db
+    finally:
+      db.close()
+
+  app.dependency_overrides[get_db] = get_bench_db
+  app.dependency_overrides[get_async_db] = get_bench_async_db
+  app.dependency_overrides[get_async_session_factory] = lambda: session_factory
+  response_cache.clear()
+  cache_ttl = response_cache.ttl_seconds
+  if args.no_cache:
+    response_cache.ttl_seconds = 0
+
+  routes, weights = parse_mix(args.mix)
+  try:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+      if args.warmup:
+        await drive(client, args.warmup, args.clients, routes, weights, args.seed + 1)
+      samples, wall_seconds = await drive(client, args.requests, args.clients, routes, weights, args.seed)
+  finally:
+    app.dependency_overrides.clear()
+    response_cache.ttl_seconds = cache_ttl
+    response_cache.clear()
+    await async_engine.dispose()
+  return report(samples, wall_seconds)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Load test the read API offline.")
+  parser.add_argument("--rows", type=int, default=10000, help="threats to seed")
+  parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+  parser.add_argument("--requests", type=int, default=2000, help="measured requests in total")
+  parser.add_argument("--warmup", type=int, default=100, help="requests sent before measuring")
+  parser.add_argument("--mix", default=DEFAULT_MIX, help=f"route weights, default {DEFAULT_MIX}")
+  parser.add_argument("--no-cache", action="store_true", help="disable the response cache")
+  parser.add_argument("--seed", type=int, default=1)
+  parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                      help="scratch database to seed, a temporary SQLite file by default")
+  parser.add_argument("--output", help="write the JSON results here instead of stdout")
+  args = parser.parse_args(argv)
+  parse_mix(args.mix)
+
+  with tempfile.TemporaryDirectory() as workdir:
+    engine = make_engine(args.database_url, workdir)
+    try:
+      started = time.perf_counter()
+      with sessionmaker(autoflush=False, bind=engine)() as db:
+        seed_threats(db, args.rows, seed=args.seed)
+      seed_seconds = time.perf_counter() - started
+      result = asyncio.run(run(args, engine))
+    finally:
+      engine.dispose()
+
+  results = {
+    "benchmark": "load",
+    "started_at": datetime.now(timezone.utc).isoformat(),
+    "python": platform.python_version(),
+    "database": args.database_url.split(":", 1)[0].split("+", 1)[0] if args.database_url else "sqlite",
+    "config": {key: value for key, value in vars(args).items() if key not in ("database_url", "output")},
+    "seed_seconds": round(seed_seconds, 3),
+    **result,
+  }
+  for route, stats in result["routes"].items():
+    print(f"{route:>15}: {stats['requests']:>6} req  p50={stats['p50_ms']}ms  p95={stats['p95_ms']}ms  "
+          f"p99={stats['p99_ms']}ms  errors={stats['errors']}", file=sys.stderr)
+  print(f"{'total':>15}: {result['throughput_rps']} req/s", file=sys.stderr)
+
+  output = json.dumps(results, indent=2)
+  if args.output:
+    with open(args.output, "w", encoding="utf-8") as f:
+      f.write(output + "\n")
+  else:
+    print(output)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
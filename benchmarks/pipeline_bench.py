@@ -0,0 +1,199 @@
+"""
+Times every stage of the threat pipeline (fetch, dedupe, cluster, analyze, match, persist,
+retention) on synthetic news, offline: NewsAPI is a local stub server and Gemini a
+deterministic fake with a fixed latency.
+
+  python -m benchmarks.pipeline_bench --sizes 100,1000,10000,100000 --output results.json
+  BENCH_DATABASE_URL=postgresql://... python -m benchmarks.pipeline_bench
+
+BENCH_DATABASE_URL (or --database-url) runs against that database instead of a throwaway
+SQLite file. Every table in it is dropped and recreated, so point it at a scratch database.
+With --baseline, stages more than --tolerance slower than the baseline file are reported
+and the exit status is 1.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import sessionmaker
+
+from app.core.rate_limit import RateLimiter
+from app.schemas.threat import ListArticleData
+from app.services.ai_analyzer import AIAnalyzer
+from app.services.archive import ThreatArchive
+from app.services.deduplicator import Deduplicator
+from app.services.news_fetcher import NewsFetcher
+from app.services.news_sources import NewsAPISource
+from app.services.retention import ThreatRetention
+from app.services.threat_processor import ThreatProcessor
+from benchmarks.database import make_engine
+from benchmarks.stubs import StubNewsAPI, fake_gemini_client
+from benchmarks.synthetic import generate_articles
+
+STAGES = ["fetch", "dedupe", "cluster", "analyze", "match", "persist", "retention"]
+PAGE_SIZE = 100
+# stages faster than this are too noisy to flag as regressions
+MIN_COMPARABLE_SECONDS = 0.01
+
+
+class StageTimer:
+  """Accumulates wall time per stage, also for methods called deep inside the pipeline"""
+
+  def __init__(self):
+    self.seconds = {}
+
+  def add(self, stage, seconds):
+    self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+  def wrap(self, obj, method, stage):
+    original = getattr(obj, method)
+
+    def timed(*args, **kwargs):
+      started = time.perf_counter()
+      try:
+        return original(*args, **kwargs)
+      finally:
+        self.add(stage, time.perf_counter() - started)
+
+    setattr(obj, method, timed)
+
+
+def run_once(size, args, database_url):
+  """Runs the whole pipeline once over size synthetic articles and returns the timings"""
+  with tempfile.TemporaryDirectory() as workdir:
+    engine = make_engine(database_url, workdir)
+    db = sessionmaker(autoflush=False, bind=engine)()
+    Deduplicator._seen_urls.clear()
+    timer = StageTimer()
+    articles = generate_articles(size, args.duplicate_rate, args.near_duplicate_rate, seed=args.seed)
+    client = fake_gemini_client(args.gemini_latency)
+
+    try:
+      with StubNewsAPI(articles, latency=args.newsapi_latency) as stub:
+        # the stubs have no quota, an unlimited limiter keeps the real ones out of the timings
+        fetcher = NewsFetcher(rate_limiter=RateLimiter("newsapi"))
+        pages = max(1, math.ceil(size / PAGE_SIZE))
+        sources = [NewsAPISource("bench", page=page, page_size=PAGE_SIZE, url=stub.url) for page in range(1, pages + 1)]
+
+        started = time.perf_counter()
+        fetched = fetcher.fetch_sources(db, sources)
+        timer.add("fetch", time.perf_counter() - started)
+
+        started = time.perf_counter()
+        new_articles = fetcher.deduplicator.filter_new(db, fetched)
+        timer.add("dedupe", time.perf_counter() - started)
+
+      processor = ThreatProcessor()
+      processor.ai_analyzer = AIAnalyzer(client=client, rate_limiter=RateLimiter("gemini"))
+      processor.triage.rng = random.Random(args.seed)
+      timer.wrap(processor.near_duplicates, "cluster", "cluster")
+      timer.wrap(processor.ai_analyzer, "analyze_articles", "analyze")
+      timer.wrap(processor, "match_results", "match")
+
+      started = time.perf_counter()
+      saved = processor.process_articles(ListArticleData(articles=new_articles), db)
+      total = time.perf_counter() - started
+      # everything process_articles does besides the timed stages: cache, inserts, commit
+      timer.add("persist", total - sum(timer.seconds.get(stage, 0.0) for stage in ("cluster", "analyze", "match")))
+
+      retention = ThreatRetention(days=5, archive=ThreatArchive(directory=os.path.join(workdir, "archive")))
+      started = time.perf_counter()
+      deleted = retention.expire(db, now=datetime.now(timezone.utc) + timedelta(days=30))
+      timer.add("retention", time.perf_counter() - started)
+    finally:
+      db.close()
+      engine.dispose()
+
+  return {
+    "articles": size,
+    "stages": {stage: round(timer.seconds.get(stage, 0.0), 6) for stage in STAGES},
+    "total_seconds": round(sum(timer.seconds.values()), 6),
+    "counts": {
+      "fetched": len(fetched),
+      "new_articles": len(new_articles),
+      "gemini_calls": client.models.calls,
+      "prompt_chars": client.models.prompt_chars,
+      "saved_threats": len(saved),
+      "expired": deleted,
+      **processor.stats,
+    },
+  }
+
+
+def compare(results, baseline, tolerance):
+  """
+  :return: One message per stage that got slower than the baseline by more than tolerance.
+  """
+  previous = {(run["database"], run["articles"]): run for run in baseline.get("runs", [])}
+  regressions = []
+  for run in results["runs"]:
+    before = previous.get((run["database"], run["articles"]))
+    if before is None:
+      continue
+    for stage, seconds in run["stages"].items():
+      old = before["stages"].get(stage)
+      if old is None or max(old, seconds) < MIN_COMPARABLE_SECONDS:
+        continue
+      if seconds > old * (1 + tolerance):
+        regressions.append(f"{run['database']} n={run['articles']} {stage}: {old:.3f}s -> {seconds:.3f}s")
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmark the threat pipeline offline.")
+  parser.add_argument("--sizes", default="100,1000,10000,100000", help="comma separated article counts")
+  parser.add_argument("--duplicate-rate", type=float, default=0.1)
+  parser.add_argument("--near-duplicate-rate", type=float, default=0.1)
+  parser.add_argument("--gemini-latency", type=float, default=0.02, help="seconds per fake Gemini call")
+  parser.add_argument("--newsapi-latency", type=float, default=0.0, help="seconds per stub NewsAPI page")
+  parser.add_argument("--seed", type=int, default=1)
+  parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                      help="scratch database to run on, a temporary SQLite file by default")
+  parser.add_argument("--output", help="write the JSON results here instead of stdout")
+  parser.add_argument("--baseline", help="earlier results to compare against")
+  parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown per stage, 0.25 = 25%%")
+  args = parser.parse_args(argv)
+
+  # the same articles must take the same path through triage on every run
+  os.environ["SHIELD_TRIAGE_SAMPLE_RATE"] = "0"
+
+  database = args.database_url.split(":", 1)[0].split("+", 1)[0] if args.database_url else "sqlite"
+  results = {
+    "benchmark": "pipeline",
+    "started_at": datetime.now(timezone.utc).isoformat(),
+    "python": platform.python_version(),
+    "config": {key: value for key, value in vars(args).items() if key not in ("database_url", "output", "baseline")},
+    "runs": [],
+  }
+  for size in (int(size) for size in args.sizes.split(",")):
+    run = run_once(size, args, args.database_url)
+    run["database"] = database
+    results["runs"].append(run)
+    stages = " ".join(f"{stage}={seconds:.3f}s" for stage, seconds in run["stages"].items())
+    print(f"[{database}] n={size}: {stages}", file=sys.stderr)
+
+  output = json.dumps(results, indent=2)
+  if args.output:
+    with open(args.output, "w", encoding="utf-8") as f:
+      f.write(output + "\n")
+  else:
+    print(output)
+
+  if args.baseline:
+    with open(args.baseline, encoding="utf-8") as f:
+      regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+      print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Local stand-ins for NewsAPI and Gemini, so benchmarks run offline and repeatably.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from app.services.mock_ai import THREAT_WORDS
+
+_THREAT = re.compile(r"\b(?:" + "|".join(sorted(THREAT_WORDS)) + r")\b")
+
+
+class StubNewsAPI:
+  """
+  Serves the given articles as NewsAPI top-headlines pages on a local port, with ETags so
+  conditional requests get a 304. Use as a context manager.
+  """
+
+  def __init__(self, articles, latency=0.0):
+    """
+    :param articles: NewsAPI article dictionaries, served in order.
+    :param latency: Seconds every request waits before answering.
+    """
+    self.articles = articles
+    self.latency = latency
+    self.requests = 0
+    stub = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        stub.requests += 1
+        time.sleep(stub.latency)
+        query = parse_qs(urlparse(self.path).query)
+        page = int(query.get("page", ["1"])[0])
+        page_size = int(query.get("pageSize", ["100"])[0])
+        items = stub.articles[(page - 1) * page_size:page * page_size]
+        body = json.dumps({"status": "ok", "totalResults": len(stub.articles), "articles": items}).encode()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+          self.send_response(304)
+          self.send_header("ETag", etag)
+          self.end_headers()
+          return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        pass
+
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    self.url = f"http://127.0.0.1:{self.server.server_port}/v2/top-headlines"
+    self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+  def __enter__(self):
+    self._thread.start()
+    return self
+
+  def __exit__(self, *exc):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+class FakeGeminiModels:
+  """
+  Deterministic stand-in for genai's client.models: reads the articles back out of the
+  prompt and answers each one after a fixed latency. An article is a threat when its
+  title holds one of MockAI's threat words, with a level derived from a hash of the title.
+  """
+
+  def __init__(self, latency=0.0):
+    self.latency = latency
+    self.calls = 0
+    self.prompt_chars = 0
+    self._lock = threading.Lock()
+
+  def generate_content(self, model, contents, config):
+    with self._lock:
+      self.calls += 1
+      self.prompt_chars += len(contents)
+    time.sleep(self.latency)
+    results = []
+    # PromptEncoder writes one [id, title, source, description] JSON array per line
+    for line in contents.splitlines():
+      if not line.startswith("["):
+        continue
+      article_id, title = json.loads(line)[:2]
+      digest = int(hashlib.sha256(title.encode()).hexdigest(), 16)
+      is_threat = bool(_THREAT.search(title.lower()))
+      results.append({
+        "is_threat": is_threat, "threat_level": 3 + digest % 8 if is_threat else 1,
+        "category": "cyber" if is_threat else "none", "summary": f"Summary of {title}",
+        "keywords": title.split()[:3], "confidence": 0.5 + (digest % 50) / 100,
+        "title": title, "reason": "synthetic", "article_id": article_id,
+      })
+    text = json.dumps(results)
+    usage = SimpleNamespace(prompt_token_count=len(contents) // 4, candidates_token_count=len(text) // 4)
+    return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+def fake_gemini_client(latency=0.0):
+  """An object usable as AIAnalyzer(client=...)"""
+  return SimpleNamespace(models=FakeGeminiModels(latency))
@@ -0,0 +1,114 @@
+"""
+Deterministic synthetic news, shaped like NewsAPI responses, for the benchmarks.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+from app.models.threat import Threat
+from app.services.mock_ai import SAFE_WORDS, THREAT_WORDS
+from app.services.rollup import ThreatRollups
+
+CATEGORIES = ["cyber", "terrorism", "environmental", "political", "health", "crime"]
+OUTLETS = ["Wire", "Daily Courier", "Metro Times", "Valley News", "Coast Herald", "Capital Post"]
+SYLLABLES = ["ka", "lo", "mi", "ter", "an", "vo", "rul", "sen", "di", "pra", "mon", "el", "tu", "gra", "fen"]
+
+
+def _vocabulary(rng, size=3000):
+  words = set()
+  while len(words) < size:
+    words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+  return sorted(words)
+
+
+def generate_articles(count, duplicate_rate=0.1, near_duplicate_rate=0.1, threat_rate=0.4, safe_rate=0.2, seed=1):
+  """
+  Builds count NewsAPI article dictionaries.
+  :param count: Total number of articles.
+  :param duplicate_rate: Share of articles that repeat an earlier article's URL exactly.
+  :param near_duplicate_rate: Share of articles that are another outlet's lightly edited copy
+                              of an earlier story, under a new URL.
+  :param threat_rate: Share of distinct stories that carry a threat word.
+  :param safe_rate: Share of distinct stories that only carry safe words (triage skips them).
+  :param seed: Seed for the random generator, the same seed gives the same articles.
+  :return: A list of dictionaries in NewsAPI's article format.
+  """
+  rng = random.Random(seed)
+  vocabulary = _vocabulary(rng)
+  threat_words = sorted(THREAT_WORDS)
+  safe_words = sorted(SAFE_WORDS)
+  start = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+  articles = []
+  for index in range(count):
+    roll = rng.random()
+    if articles and roll < duplicate_rate:
+      articles.append(dict(rng.choice(articles)))
+      continue
+    if articles and roll < duplicate_rate + near_duplicate_rate:
+      original = rng.choice(articles)
+      outlet = rng.choice(OUTLETS)
+      articles.append({
+        **original,
+        "title": f"{original['title']} - {outlet}",
+        "url": f"https://{outlet.lower().replace(' ', '')}.example/{index}",
+        "source": {"name": outlet},
+      })
+      continue
+
+    kind = rng.random()
+    words = rng.sample(vocabulary, 8)
+    if kind < threat_rate:
+      words[rng.randrange(4)] = rng.choice(threat_words)
+    elif kind < threat_rate + safe_rate:
+      for position in range(3):
+        words[position] = rng.choice(safe_words)
+    outlet = rng.choice(OUTLETS)
+    articles.append({
+      "title": " ".join(words).capitalize(),
+      "description": " ".join(rng.sample(vocabulary, 20)) + ".",
+      "url": f"https://{outlet.lower().replace(' ', '')}.example/{index}",
+      "source": {"name": outlet},
+      "publishedAt": (start + timedelta(minutes=index)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    })
+  return articles
+
+
+def seed_threats(db, count, days=5, review_rate=0.1, seed=1, batch_size=5000):
+  """
+  Fills the threats table with count realistic rows spread over the last days, for read
+  benchmarks. Commits per batch, then rebuilds the rollup.
+  :param db: Database session to write to.
+  :param count: How many threats to add.
+  :param days: The rows' created_at is spread over this many days back from now.
+  :param review_rate: Share of rows flagged as requiring review.
+  :param seed: Seed for the random generator.
+  :param batch_size: Rows per INSERT.
+  """
+  rng = random.Random(seed)
+  vocabulary = _vocabulary(rng)
+  threat_words = sorted(THREAT_WORDS)
+  now = datetime.now(timezone.utc)
+  for start in range(0, count, batch_size):
+    rows = []
+    for index in range(start, min(start + batch_size, count)):
+      words = rng.sample(vocabulary, 7) + [rng.choice(threat_words)]
+      rng.shuffle(words)
+      rows.append(dict(
+          title=" ".join(words).capitalize(),
+          description=" ".join(rng.sample(vocabulary, 20)) + ".",
+          source=rng.choice(OUTLETS),
+          source_url=f"https://seed.example/{seed}/{index}",
+          ai_threat_level=rng.randint(1, 10),
+          ai_category=rng.choice(CATEGORIES),
+          ai_summary=" ".join(rng.sample(vocabulary, 12)) + ".",
+          ai_confidence=round(rng.uniform(0.3, 1.0), 2),
+          ai_keywords=rng.sample(vocabulary, 3),
+          ai_reason=" ".join(rng.sample(vocabulary, 8)) + ".",
+          requires_review=rng.random() < review_rate,
+          created_at=now - timedelta(seconds=rng.uniform(0, days * 86400)),
+      ))
+    db.execute(Threat.__table__.insert(), rows)
+    db.commit()
+  # the rows bypass the pipeline, so the rollup behind stats and fury-overview is rebuilt
+  ThreatRollups().rebuild(db)
+  db.commit()
@@ -2,8 +2,8 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.database import engine, Base
-from app.models.threat import Threat
+from app.database import engine
+from app.migrations import upgrade
 
-Base.metadata.create_all(bind=engine)
-print("Database tables created successfully!")
\ No newline at end of file
+upgrade(engine)
+print("Database tables created successfully!")
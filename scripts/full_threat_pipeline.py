@@ -1,10 +1,12 @@
-from datetime import datetime, timedelta
+import os
+from datetime import datetime
 
 from apscheduler.schedulers.blocking import BlockingScheduler
 
 from app.database import get_db
-from app.models.threat import Threat
+from app.services.job_queue import AnalysisQueue
 from app.services.news_fetcher import NewsFetcher
+from app.services.retention import ThreatRetention
 from app.services.threat_processor import ThreatProcessor
 
 def main():
@@ -80,17 +82,44 @@ AAAA BAAAAA EAAAAAAA   AAAAAAAAA   AAAAAA MAAAAAAD AAAA
 
     # prevent extra processing by returning early if there is no new data
     if not articles.articles:
+      fetcher.save_source_states(db)
+      db.commit()
       print("No new articles found, no threats as of now.")
       return
 
     print(
       f"Found {len(articles.articles)} articles to process for threats.")
 
+    # with worker processes running (scripts/run_workers.py) the scheduler only feeds the queue
+    if os.getenv("SHIELD_ANALYSIS_QUEUE", "0") == "1":
+      # the sources only answer 304 from now on, so their validators commit with the jobs
+      fetcher.save_source_states(db)
+      enqueued = AnalysisQueue().enqueue(db, articles.articles)
+      print(f"Queued {enqueued} articles for the analysis workers.")
+      return
+
     saved_threats = processor.process_articles(articles, db)
 
+    # articles of a failed chunk are not marked seen, keeping the old validators lets the
+    # next run fetch them again instead of getting a 304
+    if processor.analyzed_urls.issuperset(article.url for article in articles.articles):
+      fetcher.save_source_states(db)
+      db.commit()
+    else:
+      print("Some articles were not analyzed, their sources will be fetched in full next run.")
+
     print(
       f"{len(saved_threats)} articles show situations that pose a threat. Information has been sent to the database.")
 
+    print(
+      f"Analysis cache: {processor.stats['cache_hits']} hits, {processor.stats['cache_misses']} misses.")
+
+    if processor.stats["near_duplicates"]:
+      print(f"{processor.stats['near_duplicates']} near-duplicate copies were folded into existing stories.")
+
+    if processor.stats["unmatched_results"]:
+      print(f"⚠️ {processor.stats['unmatched_results']} AI results could not be matched to an article.")
+
     print(
       f"🛡️ S.H.I.E.L.D. Pipeline completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
@@ -103,13 +132,11 @@ AAAA BAAAAA EAAAAAAA   AAAAAAAAA   AAAAAA MAAAAAAD AAAA
 
 def cleanup_old_threats(db):
   """
-  Removes threats from the database that are more than 5 days old.
+  Removes threats from the database that are more than 5 days old, along with the
+  remembered URLs of articles analyzed in that window.
   """
 
-  cutoff_date = datetime.now() - timedelta(days=5)
-
-  deleted_count = db.query(Threat).filter(Threat.created_at < cutoff_date).delete()
-  db.commit()
+  deleted_count = ThreatRetention(days=5).expire(db)
 
   if deleted_count > 0:
     print(f"Deleted {deleted_count} old threats from the database, more than 5 days have passed.")
@@ -0,0 +1,31 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+from datetime import date
+from itertools import islice
+
+from app.services.archive import ThreatArchive
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Query archived (expired) threats, printed as NDJSON.")
+  parser.add_argument("--start", type=date.fromisoformat, help="first day, YYYY-MM-DD")
+  parser.add_argument("--end", type=date.fromisoformat, help="last day, YYYY-MM-DD")
+  parser.add_argument("--min-level", type=int)
+  parser.add_argument("--max-level", type=int)
+  parser.add_argument("--category")
+  parser.add_argument("--limit", type=int, help="stop after this many threats")
+  parser.add_argument("--dir", help="archive directory, defaults to SHIELD_ARCHIVE_DIR")
+  args = parser.parse_args()
+
+  archive = ThreatArchive(directory=args.dir)
+  records = archive.query(args.start, args.end, args.min_level, args.max_level, args.category)
+  for record in islice(records, args.limit):
+    sys.stdout.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,60 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+import multiprocessing
+import signal
+
+
+def work(index, batch_size, poll_seconds, drain, stop):
+  """Body of one worker process: its own engine and processor, draining the shared queue."""
+  # the parent handles Ctrl+C and tells every worker to finish its batch through stop
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  logging.basicConfig(level=logging.INFO, format=f"%(asctime)s worker-{index} %(levelname)s %(message)s")
+
+  from app.database import SessionLocal
+  from app.services.analysis_worker import AnalysisWorker
+
+  worker = AnalysisWorker(batch_size=batch_size)
+  worker.run(SessionLocal, poll_seconds=poll_seconds, drain=drain, should_stop=stop.is_set)
+  logging.info("stopped: %s", worker.stats)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Run analysis workers that drain the job queue.")
+  parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes, one per core by default")
+  parser.add_argument("--batch-size", type=int, help="jobs claimed at once, SHIELD_WORKER_BATCH_SIZE by default")
+  parser.add_argument("--poll-seconds", type=float, default=5.0, help="sleep between polls of an empty queue")
+  parser.add_argument("--drain", action="store_true", help="exit once nothing is due instead of waiting for work")
+  args = parser.parse_args()
+
+  from app.database import engine
+  from app.migrations import upgrade_if_needed
+  upgrade_if_needed(engine)
+  engine.dispose()
+
+  # spawn, so no worker inherits the parent's database connections
+  context = multiprocessing.get_context("spawn")
+  stop = context.Event()
+  processes = [
+    context.Process(target=work, args=(index, args.batch_size, args.poll_seconds, args.drain, stop))
+    for index in range(args.workers)
+  ]
+  for process in processes:
+    process.start()
+  print(f"🛡️ {args.workers} analysis workers running, Ctrl+C to stop.")
+
+  try:
+    for process in processes:
+      process.join()
+  except KeyboardInterrupt:
+    print("\nStopping workers after their current batch...")
+    stop.set()
+    for process in processes:
+      process.join()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,106 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import subprocess
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules the read endpoints should never have to import
+HEAVY_MODULES = ["google.genai", "requests", "app.services.ai_analyzer", "app.services.news_fetcher",
+                 "app.services.threat_processor"]
+
+# runs in a fresh interpreter, so every number is a real cold start
+COLD_START = """
+import json, sys, time
+started = time.perf_counter()
+import api.index
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(api.index.app) as client:
+  ready = time.perf_counter()
+  status = client.get("/api/threats?limit=10").status_code
+  first_request = time.perf_counter()
+print(json.dumps({
+  "import_seconds": imported - started,
+  "startup_seconds": ready - imported,
+  "first_request_seconds": first_request - ready,
+  "first_request_status": status,
+  "heavy_modules_loaded": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def import_times():
+  """
+  :return: (module, self seconds, cumulative seconds) for every module api.index imports.
+  """
+  result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api.index"],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+  modules = []
+  for line in result.stderr.splitlines():
+    if not line.startswith("import time:") or "self [us]" in line:
+      continue
+    own, cumulative, name = line[len("import time:"):].split("|")
+    modules.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+  return modules
+
+
+def cold_start(env):
+  result = subprocess.run([sys.executable, "-c", COLD_START % HEAVY_MODULES], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+  return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Where does cold start time go?")
+  parser.add_argument("--top", type=int, default=15, help="how many of the slowest modules to list")
+  parser.add_argument("--use-env-database", action="store_true",
+                      help="start against DATABASE_URL instead of a throwaway SQLite file")
+  parser.add_argument("--json", action="store_true", help="print the report as JSON")
+  args = parser.parse_args()
+
+  modules = import_times()
+  by_package = defaultdict(float)
+  for name, own, _ in modules:
+    by_package[name.split(".")[0]] += own
+
+  with tempfile.TemporaryDirectory() as workdir:
+    env = dict(os.environ)
+    if not args.use_env_database:
+      env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+    # the first start migrates an empty database, the second finds the schema current
+    runs = {"migrating": cold_start(env), "schema_current": cold_start(env)}
+
+  report = {
+    "import_total_seconds": next((cumulative for name, _, cumulative in modules if name == "api.index"), None),
+    "slowest_modules": [{"module": name, "self_seconds": own, "cumulative_seconds": cumulative}
+                        for name, own, cumulative in sorted(modules, key=lambda m: m[1], reverse=True)[:args.top]],
+    "by_package": dict(sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:args.top]),
+    "cold_start": runs,
+  }
+  if args.json:
+    print(json.dumps(report, indent=2))
+    return
+
+  print(f"Importing api.index: {report['import_total_seconds']:.3f}s")
+  print("\nSlowest modules (self time):")
+  for module in report["slowest_modules"]:
+    print(f"  {module['self_seconds'] * 1000:8.1f} ms  {module['module']}")
+  print("\nBy top-level package:")
+  for package, seconds in report["by_package"].items():
+    print(f"  {seconds * 1000:8.1f} ms  {package}")
+  for label, run in runs.items():
+    print(f"\nCold start ({label.replace('_', ' ')}): import {run['import_seconds']:.3f}s, "
+          f"startup {run['startup_seconds']:.3f}s, first request {run['first_request_seconds']:.3f}s "
+          f"(status {run['first_request_status']})")
+    loaded = ", ".join(run["heavy_modules_loaded"]) or "none"
+    print(f"  pipeline modules loaded by a read request: {loaded}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import async_database_url
+from app.migrations import upgrade
+from app.services.deduplicator import Deduplicator
+
+
+@pytest.fixture
+def engine(tmp_path):
+  """SQLite engine on a throwaway file with every table created, so tests never touch shield.db"""
+  engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+  upgrade(engine)
+  yield engine
+  engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+  session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+  try:
+    yield session
+  finally:
+    session.close()
+
+
+@pytest.fixture
+def async_engine(engine):
+  """aiosqlite engine on the same file, used by the async endpoints"""
+  async_engine = create_async_engine(async_database_url(engine.url))
+  yield async_engine
+  asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture
+def async_session_factory(async_engine):
+  return async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+@pytest.fixture(autouse=True)
+def reset_seen_urls():
+  """The seen-URL set is process wide, clear it so tests don't leak into each other"""
+  Deduplicator._seen_urls.clear()
+  yield
+  Deduplicator._seen_urls.clear()
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+  """Retention archives expired threats, keep that inside the test's tmp dir"""
+  directory = tmp_path / "archive"
+  monkeypatch.setenv("SHIELD_ARCHIVE_DIR", str(directory))
+  return directory
@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.core.rate_limit import estimate_tokens
+from app.schemas.threat import ArticleData, ListArticleData
+from app.services.ai_analyzer import AIAnalyzer
+from app.services.prompt_encoder import PromptEncoder
+
+
+class FakeModels:
+  """Stands in for genai's client.models, answering every article as a threat"""
+
+  def __init__(self, fail_first=0, delay=0.0, fail_text="not json"):
+    self.fail_first = fail_first
+    self.fail_text = fail_text
+    self.delay = delay
+    self.calls = 0
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self.lock = threading.Lock()
+
+  def generate_content(self, model, contents, config):
+    with self.lock:
+      self.calls += 1
+      call = self.calls
+      self.in_flight += 1
+      self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    time.sleep(self.delay)
+    with self.lock:
+      self.in_flight -= 1
+    if call <= self.fail_first:
+      return SimpleNamespace(text=self.fail_text)
+    titles = [json.loads(line)[1] for line in contents.splitlines() if line.startswith("[")]
+    return SimpleNamespace(text=json.dumps([
+        {"is_threat": True, "threat_level": 5, "category": "cyber", "summary": "s", "keywords": [],
+         "confidence": 0.9, "title": title, "reason": "r"} for title in titles
+    ]))
+
+
+def make_articles(n):
+  return ListArticleData(articles=[
+      ArticleData(title=f"Story {i}", url=f"https://{i}", source="Wire", published_at=datetime(2025, 6, 1))
+      for i in range(n)
+  ])
+
+
+def test_results_are_merged_in_article_order():
+  models = FakeModels(delay=0.01)
+  analyzer = AIAnalyzer(client=SimpleNamespace(models=models), chunk_size=3, max_concurrency=4)
+
+  results = analyzer.analyze_articles(make_articles(10))
+
+  assert [r["title"] for r in results] == [f"Story {i}" for i in range(10)]
+  assert models.calls == 4
+  assert 1 < models.max_in_flight <= 4
+
+
+def test_failed_chunk_is_retried_on_its_own():
+  models = FakeModels(fail_first=1)
+  analyzer = AIAnalyzer(client=SimpleNamespace(models=models), chunk_size=5, max_concurrency=1,
+                        retry_backoff=0)
+
+  results = analyzer.analyze_articles(make_articles(10))
+
+  assert len(results) == 10
+  assert models.calls == 3
+  assert analyzer.failed_chunks == 0
+
+
+def test_chunk_that_keeps_failing_does_not_lose_the_batch():
+  models = FakeModels(fail_first=3)
+  analyzer = AIAnalyzer(client=SimpleNamespace(models=models), chunk_size=5, max_concurrency=1,
+                        max_attempts=3, retry_backoff=0)
+
+  results = analyzer.analyze_articles(make_articles(10))
+
+  assert [r["title"] for r in results] == [f"Story {i}" for i in range(5, 10)]
+  assert analyzer.failed_chunks == 1
+
+
+def test_blocked_or_malformed_responses_only_lose_their_chunk():
+  for fail_text in (None, '{"title": "not a list"}', "[1, 2]"):
+    models = FakeModels(fail_first=3, fail_text=fail_text)
+    analyzer = AIAnalyzer(client=SimpleNamespace(models=models), chunk_size=5, max_concurrency=1,
+                          max_attempts=3, retry_backoff=0)
+
+    results = analyzer.analyze_articles(make_articles(10))
+
+    assert [r["title"] for r in results] == [f"Story {i}" for i in range(5, 10)]
+    assert analyzer.failed_chunks == 1
+
+
+def test_prompt_lines_keep_only_what_the_model_reads():
+  encoder = PromptEncoder(max_description_chars=20)
+  article = ArticleData(title="Port  closed", description="Officials shut the   harbour after a threat was found",
+                        url="https://example.com/a/very/long/path", source="Wire", published_at=datetime(2025, 6, 1))
+
+  line = encoder.encode_article(article, "7")
+
+  assert json.loads(line) == ["7", "Port closed", "Wire", "Officials shut the…"]
+  assert encoder.encode_article(article.model_copy(update={"description": None}), "7") == '["7","Port closed","Wire"]'
+
+
+def test_prompt_tokens_are_estimated_per_batch_and_well_below_the_repr_prompt():
+  analyzer = AIAnalyzer(client=SimpleNamespace(models=FakeModels()), chunk_size=5)
+  articles = make_articles(10)
+
+  analyzer.analyze_articles(articles)
+
+  repr_prompt = str([{"article_id": str(i), **a.model_dump()} for i, a in enumerate(articles.articles)])
+  assert 0 < analyzer.prompt_tokens < estimate_tokens(repr_prompt)
@@ -0,0 +1,197 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import metrics
+from app.core.response_cache import bump_write_generation
+from app.database import get_async_db, get_async_session_factory, get_db
+from app.main import app, response_cache
+from app.models.threat import Threat
+from app.schemas.threat import ListArticleData
+from app.services.retention import ThreatRetention
+
+
+@pytest.fixture
+def client(db, async_session_factory):
+  async def get_test_async_db():
+    async with async_session_factory() as session:
+      yield session
+
+  app.dependency_overrides[get_db] = lambda: db
+  app.dependency_overrides[get_async_db] = get_test_async_db
+  app.dependency_overrides[get_async_session_factory] = lambda: async_session_factory
+  response_cache.clear()
+  yield TestClient(app)
+  app.dependency_overrides.clear()
+
+
+def add_threats(db, count, **overrides):
+  start = datetime.now(timezone.utc) - timedelta(hours=1)
+  for i in range(count):
+    values = dict(
+        title=f"Threat {i}", description="desc", source="Wire", source_url=f"https://{i}",
+        ai_threat_level=i % 10 + 1, ai_category="cyber", ai_summary=f"summary {i}",
+        ai_confidence=0.9, ai_keywords=["k"], ai_reason="r",
+        # a few rows share a timestamp, the id breaks the tie
+        created_at=start + timedelta(seconds=i // 3)
+    )
+    values.update(overrides)
+    db.add(Threat(**values))
+  db.commit()
+
+
+def test_keyset_pagination_walks_every_row_once(client, db):
+  add_threats(db, 25)
+
+  seen = []
+  cursor = None
+  while True:
+    params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+    page = client.get("/api/threats", params=params).json()
+    seen.extend(item["id"] for item in page["items"])
+    cursor = page["next_cursor"]
+    if not cursor:
+      break
+
+  assert len(seen) == 25
+  assert len(set(seen)) == 25
+
+
+def test_fields_projection_only_returns_requested_fields(client, db):
+  add_threats(db, 3)
+
+  page = client.get("/api/threats/level/1", params={"fields": "id,threat_level"}).json()
+
+  assert page["items"][0].keys() == {"id", "threat_level"}
+
+
+def test_bad_cursor_and_unknown_fields_are_rejected(client):
+  assert client.get("/api/threats", params={"cursor": "nope"}).status_code == 400
+  assert client.get("/api/threats", params={"fields": "password"}).status_code == 400
+
+
+def test_search_is_ranked_and_follows_review_and_delete(client, db):
+  add_threats(db, 3)
+  db.query(Threat).filter(Threat.id == 1).update({"title": "Ransomware gang hits hospital"})
+  db.query(Threat).filter(Threat.id == 2).update({"ai_reason": "mentions ransomware once"})
+  db.commit()
+
+  page = client.get("/api/threats/search", params={"q": "RANSOMWARE", "fields": "id"}).json()
+  assert [item["id"] for item in page["items"]] == [1, 2]
+
+  client.put("/api/threats/3/review", json={"human_notes": "actually ransomware", "reviewed_by": "hill"})
+  db.query(Threat).filter(Threat.id == 1).delete()
+  db.commit()
+  bump_write_generation()
+
+  page = client.get("/api/threats/search", params={"q": "ransomware", "fields": "id", "limit": 1}).json()
+  assert len(page["items"]) == 1
+  next_page = client.get("/api/threats/search", params={"q": "ransomware", "fields": "id",
+                                                         "cursor": page["next_cursor"]}).json()
+  assert sorted(item["id"] for item in page["items"] + next_page["items"]) == [2, 3]
+
+
+def test_level_filter_uses_the_human_override(client, db):
+  add_threats(db, 1, ai_threat_level=2)
+
+  assert client.get("/api/threats/level/8").json()["items"] == []
+
+  client.put("/api/threats/1/review", json={"human_threat_level": 9, "reviewed_by": "hill"})
+  items = client.get("/api/threats/level/8", params={"fields": "id,threat_level"}).json()["items"]
+  assert items == [{"id": 1, "threat_level": 9}]
+
+
+def test_stats_rollup_tracks_inserts_reviews_and_deletes(client, db):
+  """The incrementally maintained rollup always equals one rebuilt from scratch"""
+  from app.models.threat_rollup import ThreatRollup
+  from app.services.rollup import ThreatRollups
+  from tests.test_threat_processor import make_article, make_processor
+
+  articles = [make_article(f"Attack {i}", f"https://{i}") for i in range(5)]
+  make_processor().process_articles(ListArticleData(articles=articles), db)
+
+  stats = client.get("/api/threats/stats").json()
+  assert stats["total_threats"] == 5
+  assert stats["high_threats"] == 5
+  assert stats["by_category"] == {"cyber": 5}
+
+  client.put("/api/threats/1/review", json={"human_threat_level": 2, "human_category": "hoax", "reviewed_by": "hill"})
+  expired = db.query(Threat).filter(Threat.id == 2)
+  ThreatRollups().record_removed(db, expired.all())
+  expired.delete()
+  db.commit()
+  bump_write_generation()
+
+  stats = client.get("/api/threats/stats").json()
+  assert stats["total_threats"] == 4
+  assert stats["high_threats"] == 3
+  assert stats["by_category"] == {"cyber": 3, "hoax": 1}
+  assert "Attack 3" in client.get("/api/threats/fury-overview").text
+
+  incremental = sorted((r.hour, r.category, r.threat_level, r.count) for r in db.query(ThreatRollup))
+  ThreatRollups().rebuild(db)
+  rebuilt = sorted((r.hour, r.category, r.threat_level, r.count) for r in db.query(ThreatRollup))
+  assert incremental == rebuilt
+
+
+def test_polling_is_served_from_cache_with_etag_until_a_write(client, db, async_engine):
+  from sqlalchemy import event
+
+  add_threats(db, 2)
+  first = client.get("/api/threats", params={"fields": "id,has_human_review"})
+  etag = first.headers["etag"]
+
+  statements = []
+  event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+  again = client.get("/api/threats", params={"fields": "id,has_human_review"})
+  not_modified = client.get("/api/threats", params={"fields": "id,has_human_review"}, headers={"If-None-Match": etag})
+  assert again.json() == first.json()
+  assert not_modified.status_code == 304
+  assert statements == []
+
+  client.put("/api/threats/1/review", json={"human_notes": "checked", "reviewed_by": "hill"})
+  after_write = client.get("/api/threats", params={"fields": "id,has_human_review"}, headers={"If-None-Match": etag})
+  assert after_write.status_code == 200
+
+
+def test_export_streams_ndjson_and_csv_with_list_filters(client, db):
+  import csv
+  import io
+  import json
+
+  add_threats(db, 12)
+  db.query(Threat).filter(Threat.id == 5).update({"title": "Botnet takedown"})
+  db.commit()
+
+  response = client.get("/api/threats/export", params={"min_level": 6})
+  assert response.headers["content-type"].startswith("application/x-ndjson")
+  items = [json.loads(line) for line in response.text.splitlines()]
+  assert sorted(item["threat_level"] for item in items) == [6, 7, 8, 9, 10]
+
+  response = client.get("/api/threats/export", params={"format": "csv", "fields": "id,title", "q": "botnet"})
+  assert list(csv.reader(io.StringIO(response.text))) == [["id", "title"], ["5", "Botnet takedown"]]
+
+
+def test_archive_endpoint_streams_expired_threats(client, db):
+  add_threats(db, 3, created_at=datetime.now(timezone.utc) - timedelta(days=10))
+  ThreatRetention(days=5).expire(db)
+
+  response = client.get("/api/archive/threats", params={"min_level": 2})
+  assert response.status_code == 200
+  records = [json.loads(line) for line in response.text.splitlines()]
+  assert sorted(record["title"] for record in records) == ["Threat 1", "Threat 2"]
+
+
+def test_metrics_endpoint_reports_route_latency_and_queries(client, db):
+  add_threats(db, 3)
+  before = metrics.http_request_seconds.count(method="GET", route="/api/threats/{threat_id}", status="200")
+  threat_id = db.query(Threat.id).first()[0]
+  client.get(f"/api/threats/{threat_id}")
+  client.get(f"/api/threats/{threat_id}")  # the second one is served from the response cache
+
+  assert metrics.http_request_seconds.count(method="GET", route="/api/threats/{threat_id}", status="200") == before + 2
+  body = client.get("/metrics").text
+  assert 'shield_db_queries_per_request_count{route="/api/threats/{threat_id}"}' in body
+  assert "# TYPE shield_pipeline_stage_seconds histogram" in body
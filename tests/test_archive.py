@@ -0,0 +1,58 @@
+import zlib
+from datetime import date
+
+from app.services.archive import ThreatArchive
+
+
+def make_rows(day, count, category="cyber"):
+  return [
+    {"id": f"{day}-{i}", "title": f"Threat {i}", "created_day": day,
+     "created_at": f"{day}T0{i % 10}:00:00", "effective_threat_level": i % 10 + 1,
+     "effective_category": category}
+    for i in range(count)
+  ]
+
+
+def test_query_filters_by_day_level_and_category(tmp_path):
+  archive = ThreatArchive(directory=str(tmp_path), block_rows=4)
+  archive.append(make_rows(date(2026, 3, 1), 10) + make_rows(date(2026, 3, 2), 5, category="terror"))
+
+  assert archive.days() == [date(2026, 3, 1), date(2026, 3, 2)]
+  assert len(list(archive.query())) == 15
+  assert len(list(archive.query(start=date(2026, 3, 2)))) == 5
+  assert {r["effective_threat_level"] for r in archive.query(min_level=8)} == {8, 9, 10}
+  assert [r["id"] for r in archive.query(category="terror", max_level=2)] == ["2026-03-02-0", "2026-03-02-1"]
+  assert "created_day" not in next(archive.query())
+
+
+def test_query_only_decompresses_blocks_that_can_match(tmp_path, monkeypatch):
+  archive = ThreatArchive(directory=str(tmp_path), block_rows=5)
+  archive.append(make_rows(date(2026, 3, 1), 10))  # levels 1-5, then 6-10
+  archive.append(make_rows(date(2026, 3, 1), 10)[:5])  # a retried batch, archived twice
+
+  decompressed = []
+  original = zlib.decompress
+  monkeypatch.setattr(zlib, "decompress", lambda data: decompressed.append(data) or original(data))
+
+  assert len(list(archive.query(min_level=6))) == 5
+  assert len(decompressed) == 1
+  assert len(list(archive.query(max_level=5))) == 5  # duplicates are dropped
+
+
+def test_query_skips_days_whose_segment_is_missing_or_empty(tmp_path):
+  archive = ThreatArchive(directory=str(tmp_path))
+  archive.append(make_rows(date(2026, 3, 1), 3) + make_rows(date(2026, 3, 2), 3) + make_rows(date(2026, 3, 3), 3))
+  missing, _ = archive.segment_paths(date(2026, 3, 1))
+  empty, _ = archive.segment_paths(date(2026, 3, 2))
+  (tmp_path / missing).unlink()
+  open(empty, "wb").close()
+
+  assert {record["id"] for record in archive.query()} == {f"2026-03-03-{i}" for i in range(3)}
+
+
+def test_archive_is_off_without_a_directory(monkeypatch):
+  monkeypatch.delenv("SHIELD_ARCHIVE_DIR")
+  archive = ThreatArchive()
+
+  assert not archive.enabled
+  assert list(archive.query()) == []
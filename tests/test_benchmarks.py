@@ -0,0 +1,35 @@
+import json
+
+from benchmarks import load_test, pipeline_bench
+
+
+def test_pipeline_bench_runs_offline_and_flags_regressions(tmp_path, monkeypatch):
+  monkeypatch.delenv("BENCH_DATABASE_URL", raising=False)
+  output = tmp_path / "results.json"
+  assert pipeline_bench.main(["--sizes", "60", "--gemini-latency", "0", "--output", str(output)]) == 0
+
+  results = json.loads(output.read_text())
+  run = results["runs"][0]
+  assert set(run["stages"]) == set(pipeline_bench.STAGES)
+  assert run["counts"]["fetched"] == 60
+  assert run["counts"]["gemini_calls"] >= 1
+
+  slower = json.loads(output.read_text())
+  slower["runs"][0]["stages"]["analyze"] = 10.0
+  assert pipeline_bench.compare(slower, results, tolerance=0.25) == [
+    f"sqlite n=60 analyze: {run['stages']['analyze']:.3f}s -> 10.000s"
+  ]
+
+
+def test_load_test_reports_latency_per_route(tmp_path, monkeypatch):
+  monkeypatch.delenv("BENCH_DATABASE_URL", raising=False)
+  output = tmp_path / "load.json"
+  assert load_test.main(["--rows", "200", "--clients", "4", "--requests", "60", "--warmup", "0",
+                         "--mix", "threats=1,search=1,fury_overview=1", "--output", str(output)]) == 0
+
+  results = json.loads(output.read_text())
+  assert results["requests"] == 60
+  assert set(results["routes"]) == {"threats", "search", "fury_overview"}
+  for stats in results["routes"].values():
+    assert stats["errors"] == 0
+    assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
@@ -0,0 +1,114 @@
+from datetime import datetime
+
+from app.models.analysis_job import AnalysisJob
+from app.models.threat import Threat
+from app.schemas.threat import ArticleData, ListArticleData
+from app.services.analysis_worker import AnalysisWorker
+from app.services.job_queue import AnalysisQueue
+from app.services.threat_processor import ThreatProcessor
+
+TITLES = ["Ransomware attack cripples city hospital", "Bridge collapse traps commuters downtown",
+          "Wildfire forces evacuation of mountain towns", "Hackers leak bank customer records"]
+
+
+class FakeAnalyzer:
+  """Calls every article a threat, or answers nothing at all while over quota"""
+
+  def __init__(self, over_quota=False):
+    self.over_quota = over_quota
+    self.rate_limited = False
+    self.prompt_tokens = 0
+
+  def analyze_articles(self, articles: ListArticleData):
+    self.rate_limited = self.over_quota
+    if self.over_quota:
+      return []
+    return [
+      {"is_threat": True, "threat_level": 7, "category": "cyber", "summary": "s", "keywords": ["k"],
+       "confidence": 0.9, "title": article.title, "reason": "r", "article_id": str(index)}
+      for index, article in enumerate(articles.articles)
+    ]
+
+
+def make_articles(count=len(TITLES)):
+  return [ArticleData(title=title, description=None, url=f"https://{index}", source="Wire",
+                      published_at=datetime(2025, 6, 1))
+          for index, title in enumerate(TITLES[:count])]
+
+
+def test_enqueue_skips_urls_already_queued(db):
+  queue = AnalysisQueue()
+  assert queue.enqueue(db, make_articles(2)) == 2
+  assert queue.enqueue(db, make_articles(3)) == 1
+  assert db.query(AnalysisJob).count() == 3
+
+
+def test_claimed_jobs_are_leased_until_the_lease_expires(db):
+  queue = AnalysisQueue(lease_seconds=60)
+  queue.enqueue(db, make_articles(), now=1000)
+
+  first = queue.claim(db, "a", 3, now=1000)
+  second = queue.claim(db, "b", 3, now=1001)
+  assert [job.source_url for job in first] == ["https://0", "https://1", "https://2"]
+  assert [job.source_url for job in second] == ["https://3"]
+  assert queue.claim(db, "b", 3, now=1030) == []
+
+  # worker a died: its jobs come back once the lease is over, and a can no longer settle them
+  reclaimed = queue.claim(db, "b", 3, now=1061)
+  assert [(job.source_url, job.attempts) for job in reclaimed] == [("https://0", 2), ("https://1", 2), ("https://2", 2)]
+  queue.complete(db, "a", first)
+  assert queue.stats(db)["jobs"] == {"pending": 0, "leased": 4, "done": 0, "failed": 0}
+
+
+def test_retry_backs_off_and_gives_up_after_max_attempts(db):
+  queue = AnalysisQueue(max_attempts=2, backoff_seconds=10)
+  queue.enqueue(db, make_articles(1), now=1000)
+
+  assert queue.retry(db, "w", queue.claim(db, "w", 1, now=1000), "boom", now=1000) == 0
+  assert queue.claim(db, "w", 1, now=1009) == []
+  assert queue.retry(db, "w", queue.claim(db, "w", 1, now=1010), "boom", now=1010) == 1
+
+  job = db.query(AnalysisJob).one()
+  assert (job.status, job.attempts, job.last_error) == ("failed", 2, "boom")
+  assert queue.claim(db, "w", 1, now=5000) == []
+
+
+def test_pause_stops_every_worker_from_claiming(db):
+  queue = AnalysisQueue()
+  queue.enqueue(db, make_articles(1), now=1000)
+  assert queue.pause(db, 60, "quota", now=1000) == 1060
+  # a shorter pause does not cut the current one short
+  assert queue.pause(db, 10, "quota", now=1001) == 1060
+
+  assert queue.claim(db, "w", 1, now=1059) == []
+  assert len(queue.claim(db, "w", 1, now=1061)) == 1
+
+
+def test_worker_completes_analyzed_jobs_and_stores_threats(db):
+  queue = AnalysisQueue()
+  queue.enqueue(db, make_articles())
+  processor = ThreatProcessor()
+  processor.ai_analyzer = FakeAnalyzer()
+  worker = AnalysisWorker(queue=queue, processor=processor, batch_size=10, owner="w")
+
+  assert worker.run_once(db) == 4
+  assert worker.run_once(db) == 0
+  assert db.query(Threat).count() == 4
+  assert queue.stats(db)["jobs"]["done"] == 4
+
+
+def test_worker_pauses_the_queue_when_the_quota_runs_out(db):
+  queue = AnalysisQueue()
+  queue.enqueue(db, make_articles())
+  processor = ThreatProcessor()
+  processor.ai_analyzer = FakeAnalyzer(over_quota=True)
+  worker = AnalysisWorker(queue=queue, processor=processor, batch_size=10, owner="w", quota_pause_seconds=60)
+
+  worker.run_once(db)
+
+  stats = queue.stats(db)
+  assert stats["jobs"]["pending"] == 4
+  assert stats["pause_reason"] == "Gemini quota exhausted"
+  # the untried jobs do not lose an attempt
+  assert {job.attempts for job in db.query(AnalysisJob)} == {0}
+  assert worker.run_once(db) == 0
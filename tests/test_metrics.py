@@ -0,0 +1,25 @@
+from app.core.metrics import Registry
+
+
+def test_registry_renders_prometheus_text():
+  registry = Registry()
+  requests = registry.counter("demo_requests", "Requests.", ["route"])
+  latency = registry.histogram("demo_seconds", "Latency.", ["route"], buckets=(0.1, 1.0))
+  requests.inc(route="/a")
+  requests.inc(2, route='/b"')
+  latency.observe(0.1, route="/a")
+  latency.observe(5, route="/a")
+
+  assert registry.render().splitlines() == [
+    "# HELP demo_requests_total Requests.",
+    "# TYPE demo_requests_total counter",
+    'demo_requests_total{route="/a"} 1',
+    'demo_requests_total{route="/b\\""} 2',
+    "# HELP demo_seconds Latency.",
+    "# TYPE demo_seconds histogram",
+    'demo_seconds_bucket{route="/a",le="0.1"} 1',
+    'demo_seconds_bucket{route="/a",le="1.0"} 1',
+    'demo_seconds_bucket{route="/a",le="+Inf"} 2',
+    'demo_seconds_sum{route="/a"} 5.1',
+    'demo_seconds_count{route="/a"} 2',
+  ]
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, inspect, text
+
+from app.migrations import schema_fingerprint, upgrade, upgrade_if_needed
+
+
+def test_upgrade_adds_effective_columns_and_indexes_to_an_old_table(tmp_path):
+  """A threats table from before the effective_* columns existed is brought up to date"""
+  engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+  with engine.begin() as connection:
+    connection.execute(text("""
+      CREATE TABLE threats (
+        id INTEGER PRIMARY KEY, title VARCHAR(500) NOT NULL, description TEXT, source VARCHAR(100) NOT NULL,
+        source_url VARCHAR(500) NOT NULL UNIQUE, published_at DATETIME, ai_threat_level INTEGER NOT NULL,
+        ai_category VARCHAR(50) NOT NULL, ai_summary TEXT NOT NULL, ai_confidence FLOAT NOT NULL,
+        ai_keywords JSON NOT NULL, ai_reason TEXT NOT NULL, human_threat_level INTEGER, human_category VARCHAR(50),
+        human_notes TEXT, reviewed_by VARCHAR(100), reviewed_at DATETIME,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME, requires_review BOOLEAN
+      )
+    """))
+    connection.execute(text("""
+      INSERT INTO threats (title, source, source_url, ai_threat_level, ai_category, ai_summary, ai_confidence,
+                           ai_keywords, ai_reason, human_category)
+      VALUES ('t', 's', 'https://a', 4, 'cyber', 'sum', 0.9, '[]', 'r', 'terror')
+    """))
+
+  upgrade(engine)
+  upgrade(engine)  # running twice is harmless
+
+  inspector = inspect(engine)
+  index_names = {index["name"] for index in inspector.get_indexes("threats")}
+  assert {"ix_threats_created_at", "ix_threats_requires_review", "ix_threats_level_created",
+          "ix_threats_category_created", "ix_threats_created_day"} <= index_names
+  with engine.connect() as connection:
+    row = connection.execute(text("SELECT effective_threat_level, effective_category FROM threats")).one()
+    assert tuple(row) == (4, "terror")
+    assert connection.execute(text("SELECT created_day = date(created_at) FROM threats")).scalar() == 1
+    assert connection.execute(text("SELECT rowid FROM threats_fts WHERE threats_fts MATCH 'sum'")).all()
+  engine.dispose()
+
+
+def test_upgrade_if_needed_only_upgrades_when_the_fingerprint_changed(tmp_path):
+  """A current database costs one read on startup, a stale fingerprint triggers the upgrade"""
+  engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+  assert upgrade_if_needed(engine) is True
+  assert upgrade_if_needed(engine) is False
+
+  with engine.begin() as connection:
+    connection.execute(text("UPDATE schema_version SET fingerprint = 'outdated'"))
+  assert upgrade_if_needed(engine) is True
+  with engine.connect() as connection:
+    assert connection.execute(text("SELECT fingerprint FROM schema_version")).scalars().all() == [schema_fingerprint()]
+  engine.dispose()
+
+
+def test_read_endpoints_do_not_import_the_pipeline_clients(tmp_path):
+  """Importing the entry point and serving a read leaves google.genai and requests unloaded"""
+  code = (
+    "import sys\n"
+    "from fastapi.testclient import TestClient\n"
+    "import api.index\n"
+    "with TestClient(api.index.app) as client:\n"
+    "  assert client.get('/api/threats').status_code == 200\n"
+    "print(sorted(name for name in ('google.genai', 'requests') if name in sys.modules))\n"
+  )
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'cold.db'}"}
+  result = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True, check=True)
+  assert result.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,139 @@
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app.models.seen_article import SeenArticle
+from app.models.threat import Threat
+from app.services.news_fetcher import NewsFetcher
+from app.services.news_sources import configured_sources, parse_newsapi_articles
+
+
+def make_page(urls):
+  """Builds a fake NewsAPI response with one article per URL"""
+  return {"articles": [
+      {
+        "title": f"Story {i}",
+        "description": "desc",
+        "url": url,
+        "source": {"name": "Wire"},
+        "publishedAt": "2025-06-01T12:00:00Z"
+      } for i, url in enumerate(urls)
+  ]}
+
+
+def save_threat(db, url):
+  db.add(Threat(
+      title="Saved", source="Wire", source_url=url, ai_threat_level=5, ai_category="cyber",
+      ai_summary="s", ai_confidence=0.9, ai_keywords=[], ai_reason="r"
+  ))
+  db.commit()
+
+
+def test_convert_data_drops_saved_and_seen_urls(db):
+  """Saved threats, previously rejected articles and in-batch repeats are all filtered"""
+  save_threat(db, "https://a")
+  db.add(SeenArticle(url="https://b"))
+  db.commit()
+
+  fetcher = NewsFetcher()
+  result = fetcher.convert_data(make_page(["https://a", "https://b", "https://c", "https://c", "https://d"]), db)
+
+  assert [article.url for article in result.articles] == ["https://c", "https://d"]
+
+
+def test_convert_data_uses_one_query_per_page(db, engine):
+  """The whole page is resolved with a single set-based lookup"""
+  statements = []
+  event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+  NewsFetcher().convert_data(make_page([f"https://{i}" for i in range(100)]), db)
+
+  assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 1
+
+
+def test_mark_seen_is_remembered_in_process_and_persisted(db):
+  fetcher = NewsFetcher()
+  fetcher.deduplicator.mark_seen(db, ["https://x", "https://y"])
+  fetcher.deduplicator.mark_seen(db, ["https://x"])
+  db.commit()
+
+  assert db.query(SeenArticle).count() == 2
+  assert fetcher.convert_data(make_page(["https://x", "https://z"]), db).articles[0].url == "https://z"
+
+
+RSS = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Wire RSS</title>
+  <item><title> Port closed </title><link>https://rss/1</link><description>d</description>
+        <pubDate>Mon, 02 Jun 2025 10:00:00 +0200</pubDate></item>
+  <item><title>No link</title></item>
+</channel></rss>"""
+
+ATOM = b"""<?xml version="1.0"?>
+<feed xmlns="http://www.w3.org/2005/Atom"><title>Wire Atom</title>
+  <entry><title>Grid outage</title><link rel="alternate" href="https://atom/1"/>
+         <summary>s</summary><updated>2025-06-02T08:00:00Z</updated></entry>
+</feed>"""
+
+
+class FakeResponse:
+  def __init__(self, status_code=200, content=b"", headers=None):
+    self.status_code = status_code
+    self.content = content
+    self.headers = headers or {}
+
+  def raise_for_status(self):
+    if self.status_code >= 400:
+      raise RuntimeError(self.status_code)
+
+
+class FakeSession:
+  """Serves fixed feeds and honours If-None-Match like a real server would"""
+
+  def __init__(self, feeds):
+    self.feeds = feeds
+    self.requests = []
+
+  def get(self, url, params=None, headers=None, timeout=None):
+    self.requests.append((url, dict(headers or {})))
+    if url not in self.feeds:
+      return FakeResponse(500)
+    etag = f'"{url}"'
+    if (headers or {}).get("If-None-Match") == etag:
+      return FakeResponse(304)
+    return FakeResponse(200, self.feeds[url], {"ETag": etag})
+
+
+def test_fetch_sources_parses_feeds_and_sends_conditional_requests(db):
+  sources = configured_sources(None, feeds="https://feeds/rss, https://feeds/atom, https://feeds/down")
+  fetcher = NewsFetcher(session=FakeSession({"https://feeds/rss": RSS, "https://feeds/atom": ATOM}), max_attempts=1)
+
+  articles = fetcher.fetch_sources(db, sources)
+  assert [(a.title, a.url, a.source) for a in articles] == [
+    ("Port closed", "https://rss/1", "Wire RSS"), ("Grid outage", "https://atom/1", "Wire Atom")
+  ]
+  assert articles[0].published_at == datetime(2025, 6, 2, 8, 0)
+  assert fetcher.stats == {"sources": 3, "not_modified": 0, "failed": 1}
+
+  # nothing is conditional until the caller stores the validators with the articles
+  assert len(fetcher.fetch_sources(db, sources)) == 2
+  fetcher.save_source_states(db)
+  db.commit()
+
+  # unchanged feeds answer 304 the next time round
+  assert fetcher.fetch_sources(db, sources) == []
+  assert fetcher.stats == {"sources": 3, "not_modified": 2, "failed": 1}
+  assert fetcher.session.requests[-3][1]["If-None-Match"] == '"https://feeds/rss"'
+
+
+def test_newsapi_removed_placeholders_are_skipped():
+  page = make_page(["https://a", "[Removed]", "https://removed.com", "https://b"])
+  page["articles"][3]["title"] = "[Removed]"
+
+  assert [article.url for article in parse_newsapi_articles(page)] == ["https://a"]
+
+
+def test_configured_sources_fans_out_newsapi_pages_without_leaking_the_key():
+  sources = configured_sources("secret", countries="us,gb", categories="general,technology", pages=2)
+  assert len(sources) == 8
+  assert all("secret" not in source.key for source in sources)
+  assert sources[0].headers == {"X-Api-Key": "secret"}
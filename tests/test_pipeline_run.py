@@ -0,0 +1,142 @@
+import time
+from datetime import datetime
+
+from app.models.threat import Threat
+from app.schemas.threat import ArticleData, ListArticleData
+from app.services.analysis_worker import AnalysisWorker
+from app.services.job_queue import AnalysisQueue
+from app.services.pipeline_run import BudgetedPipeline
+from app.services.retention import ThreatRetention
+from app.services.threat_processor import ThreatProcessor
+
+TITLES = ["Ransomware attack cripples city hospital", "Bridge collapse traps commuters downtown",
+          "Wildfire forces evacuation of mountain towns", "Hackers leak bank customer records"]
+
+
+class Clock:
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+class SlowAnalyzer:
+  """Calls every article a threat, each call taking 10 seconds of the fake clock"""
+
+  def __init__(self, clock):
+    self.clock = clock
+    self.rate_limited = False
+    self.prompt_tokens = 0
+
+  def analyze_articles(self, articles: ListArticleData):
+    self.clock.now += 10
+    return [
+      {"is_threat": True, "threat_level": 7, "category": "cyber", "summary": "s", "keywords": ["k"],
+       "confidence": 0.9, "title": article.title, "reason": "r", "article_id": str(index)}
+      for index, article in enumerate(articles.articles)
+    ]
+
+
+class FakeFetcher:
+  timeout = 10
+
+  def __init__(self):
+    self.calls = 0
+    self.time_budgets = []
+
+  def fetch_and_convert(self, db, time_budget=None):
+    self.calls += 1
+    self.time_budgets.append(time_budget)
+    return ListArticleData(articles=[
+      ArticleData(title=title, url=f"https://{self.calls}/{index}", source="Wire", published_at=datetime(2025, 6, 1))
+      for index, title in enumerate(TITLES)
+    ])
+
+  def save_source_states(self, db):
+    pass
+
+
+def make_pipeline(clock, fetcher, budget):
+  processor = ThreatProcessor()
+  processor.ai_analyzer = SlowAnalyzer(clock)
+  queue = AnalysisQueue()
+  worker = AnalysisWorker(queue=queue, processor=processor, batch_size=1, owner="cron")
+  return BudgetedPipeline(budget_seconds=budget, retention=ThreatRetention(days=5), fetcher=fetcher,
+                          queue=queue, worker=worker, analyze=True, clock=clock)
+
+
+def test_a_run_stops_at_its_budget_and_the_next_one_resumes(db):
+  clock = Clock()
+  fetcher = FakeFetcher()
+
+  pipeline = make_pipeline(clock, fetcher, budget=25)
+  first = pipeline.run(db)
+  # two 10s batches fit, a third would overrun the remaining 5s
+  assert (first["status"], first["phase"], first["enqueued"], first["analyzed"]) == ("partial", "analyze", 4, 2)
+  # the Gemini waits of the last batch were capped at the 15s it started with
+  assert pipeline.worker.processor.ai_analyzer.time_budget == 15
+  assert fetcher.time_budgets == [25]
+  # the processor's counters are summed over the batches of the cycle
+  assert (first["cache_misses"], first["cache_hits"]) == (2, 0)
+
+  # a new invocation (fresh objects, same database) picks up the checkpoint without fetching again
+  second = make_pipeline(clock, fetcher, budget=30).run(db)
+  assert (second["status"], second["cycle"], second["analyzed"], second["new_threats"]) == ("ok", 1, 4, 4)
+  assert second["cache_misses"] == 4
+  assert fetcher.calls == 1
+  assert db.query(Threat).count() == 4
+
+  third = make_pipeline(clock, fetcher, budget=25).run(db)
+  assert (third["cycle"], third["enqueued"]) == (2, 4)
+  assert fetcher.calls == 2
+
+
+def test_no_batch_starts_with_less_left_than_the_first_batch_estimate(db):
+  clock = Clock()
+  pipeline = make_pipeline(clock, FakeFetcher(), budget=12)
+  pipeline.first_batch_seconds = 15
+
+  result = pipeline.run(db)
+
+  assert (result["status"], result["phase"], result["enqueued"], result["analyzed"]) == ("partial", "analyze", 4, 0)
+
+
+def test_no_fetch_starts_with_less_left_than_one_request_timeout(db):
+  clock = Clock()
+  fetcher = FakeFetcher()
+  pipeline = make_pipeline(clock, fetcher, budget=8)
+
+  result = pipeline.run(db)
+
+  assert (result["status"], result["phase"]) == ("partial", "fetch")
+  assert fetcher.calls == 0
+
+
+def test_a_stale_cycle_is_left_for_a_new_one_that_fetches_first(db):
+  clock = Clock()
+  fetcher = FakeFetcher()
+  first = make_pipeline(clock, fetcher, budget=25).run(db)
+  assert (first["status"], first["analyzed"]) == ("partial", 2)
+
+  # the next invocation comes a day later
+  pipeline = make_pipeline(clock, fetcher, budget=100)
+  pipeline.save(db, {**pipeline.load(db), "started_at": time.time() - 24 * 3600})
+  second = pipeline.run(db)
+
+  assert (second["status"], second["cycle"], second["enqueued"]) == ("ok", 2, 4)
+  assert fetcher.calls == 2
+  # the jobs the first cycle left behind were analyzed along with the new ones
+  assert second["analyzed"] == 6
+  assert AnalysisQueue().stats(db)["jobs"]["done"] == 8
+
+
+def test_with_external_workers_a_run_only_feeds_the_queue(db):
+  clock = Clock()
+  pipeline = make_pipeline(clock, FakeFetcher(), budget=25)
+  pipeline.analyze = False
+
+  result = pipeline.run(db)
+
+  assert (result["status"], result["phase"], result["enqueued"], result["analyzed"]) == ("ok", "done", 4, 0)
+  assert AnalysisQueue().stats(db)["jobs"]["pending"] == 4
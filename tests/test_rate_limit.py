@@ -0,0 +1,190 @@
+import json
+from datetime import datetime
+from email.utils import formatdate
+from types import SimpleNamespace
+
+from google.genai.errors import ClientError
+
+from app.core.rate_limit import RateLimiter, TokenBucket, parse_retry_after, retry_after
+from app.schemas.threat import ArticleData, ListArticleData
+from app.services.ai_analyzer import AIAnalyzer
+from app.services.news_fetcher import NewsFetcher
+from app.services.news_sources import FeedSource
+
+
+class Clock:
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.now += seconds
+
+
+def quota_error(delay="2s"):
+  return ClientError(429, {"error": {"code": 429, "message": "quota", "status": "RESOURCE_EXHAUSTED", "details": [
+      {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": delay}]}})
+
+
+def test_token_bucket_queues_callers_behind_each_other():
+  clock = Clock()
+  bucket = TokenBucket(rate=1, capacity=2, clock=clock)
+  assert [bucket.reserve(1) for _ in range(4)] == [0, 0, 1.0, 2.0]
+  clock.now = 10
+  assert bucket.reserve(1) == 0
+
+
+def test_limiter_holds_every_caller_after_back_off():
+  clock = Clock()
+  limiter = RateLimiter("test", requests_per_minute=60, tokens_per_minute=600, clock=clock, sleep=clock.sleep)
+  assert limiter.tokens_per_request() == 10
+  assert limiter.acquire(tokens=600) == 0
+  # the token quota is spent, the next 60 tokens take a minute's tenth to come back
+  assert limiter.acquire(tokens=60) == 6.0
+  limiter.back_off(30)
+  assert limiter.acquire() == 30
+
+
+def test_retry_after_reads_headers_dates_and_google_retry_info():
+  assert parse_retry_after("12") == 12
+  assert 55 <= parse_retry_after(formatdate(1000 + 60, usegmt=True), now=1000) <= 60
+  assert parse_retry_after("soon") is None
+  assert retry_after(quota_error("17s")) == 17
+  assert retry_after(SimpleNamespace(response=SimpleNamespace(headers={"Retry-After": "3"}))) == 3
+  assert retry_after(ValueError("bad json")) is None
+
+
+def make_articles(n, description="desc"):
+  return ListArticleData(articles=[
+      ArticleData(title=f"Story {i}", description=description, url=f"https://{i}", source="Wire",
+                  published_at=datetime(2025, 6, 1))
+      for i in range(n)
+  ])
+
+
+class QuotaModels:
+  """Answers 429 a given number of times, then analyzes every article"""
+
+  def __init__(self, quota_errors, delay="2s"):
+    self.quota_errors = quota_errors
+    self.delay = delay
+    self.calls = 0
+
+  def generate_content(self, model, contents, config):
+    self.calls += 1
+    if self.calls <= self.quota_errors:
+      raise quota_error(self.delay)
+    ids = [json.loads(line)[0] for line in contents.splitlines() if line.startswith("[")]
+    return SimpleNamespace(text=json.dumps([
+        {"is_threat": True, "threat_level": 5, "category": "cyber", "summary": "s", "keywords": [],
+         "confidence": 0.9, "title": "t", "reason": "r", "article_id": article_id} for article_id in ids
+    ]))
+
+
+def test_chunks_are_sized_to_the_token_quota_per_request():
+  limiter = RateLimiter("gemini", requests_per_minute=10, tokens_per_minute=10 * 1500)
+  analyzer = AIAnalyzer(client=SimpleNamespace(models=QuotaModels(0)), chunk_size=50, rate_limiter=limiter)
+
+  short = analyzer.chunk_articles(make_articles(30).articles)
+  long = analyzer.chunk_articles(make_articles(30, description="word " * 400).articles)
+
+  assert len(long) > len(short)
+  budget = analyzer.chunk_token_budget() - analyzer.encoder.instruction_tokens()
+  assert all(sum(analyzer.article_tokens(a) for a in chunk) <= budget for chunk in short + long if len(chunk) > 1)
+  assert [a.url for chunk in long for a in chunk] == [f"https://{i}" for i in range(30)]
+
+
+def test_a_429_waits_out_retry_after_for_every_chunk_then_retries():
+  clock = Clock()
+  limiter = RateLimiter("gemini", clock=clock, sleep=clock.sleep)
+  models = QuotaModels(quota_errors=1, delay="2s")
+  analyzer = AIAnalyzer(client=SimpleNamespace(models=models), chunk_size=5, max_concurrency=1,
+                        retry_backoff=0, rate_limiter=limiter)
+
+  results = analyzer.analyze_articles(make_articles(10))
+
+  assert len(results) == 10
+  assert clock.now == 2
+  assert not analyzer.rate_limited
+
+
+def test_a_long_retry_after_gives_up_and_flags_the_quota():
+  clock = Clock()
+  analyzer = AIAnalyzer(client=SimpleNamespace(models=QuotaModels(quota_errors=99, delay="3600s")),
+                        chunk_size=5, max_concurrency=1, rate_limiter=RateLimiter("gemini", clock=clock, sleep=clock.sleep))
+
+  assert analyzer.analyze_articles(make_articles(5)) == []
+  assert analyzer.rate_limited
+  assert analyzer.client.models.calls == 1
+
+
+def test_acquire_does_not_wait_past_max_wait_and_takes_nothing():
+  clock = Clock()
+  limiter = RateLimiter("test", requests_per_minute=60, tokens_per_minute=600, clock=clock, sleep=clock.sleep)
+  limiter.acquire(tokens=600)
+
+  assert limiter.acquire(tokens=60, max_wait=5) is None
+  assert clock.now == 0
+  # the refused request left the quota as it was
+  assert limiter.acquire(tokens=60, max_wait=6) == 6.0
+
+
+def test_waits_longer_than_the_time_budget_give_up_and_flag_the_quota():
+  clock = Clock()
+  limiter = RateLimiter("gemini", tokens_per_minute=1000, clock=clock, sleep=clock.sleep)
+  analyzer = AIAnalyzer(client=SimpleNamespace(models=QuotaModels(quota_errors=0)), chunk_size=5,
+                        max_concurrency=1, rate_limiter=limiter)
+  analyzer.time_budget = 50
+  limiter.acquire(tokens=1000)  # a drained token quota takes a minute to refill
+
+  assert analyzer.analyze_articles(make_articles(5)) == []
+  assert analyzer.rate_limited
+  assert (clock.now, analyzer.client.models.calls) == (0, 0)
+
+  # a Retry-After within GEMINI_MAX_RETRY_WAIT, but past the budget
+  analyzer = AIAnalyzer(client=SimpleNamespace(models=QuotaModels(quota_errors=1, delay="55s")), chunk_size=5,
+                        max_concurrency=1, rate_limiter=RateLimiter("gemini", clock=clock, sleep=clock.sleep))
+  analyzer.time_budget = 50
+
+  assert analyzer.analyze_articles(make_articles(5)) == []
+  assert analyzer.rate_limited
+  assert (clock.now, analyzer.client.models.calls) == (0, 1)
+
+
+class FlakySession:
+  """Answers 429 with Retry-After once, then 503 once, then 200"""
+
+  def __init__(self):
+    self.statuses = [429, 503, 200]
+    self.timeouts = []
+
+  def get(self, url, params=None, headers=None, timeout=None):
+    self.timeouts.append(timeout)
+    status = self.statuses.pop(0)
+    return SimpleNamespace(status_code=status, headers={"Retry-After": "1"} if status == 429 else {},
+                           content=b"<rss><channel></channel></rss>")
+
+
+def test_fetcher_retries_429_and_5xx_under_the_limiter():
+  clock = Clock()
+  fetcher = NewsFetcher(session=FlakySession(), retry_backoff=0,
+                        rate_limiter=RateLimiter("feeds", clock=clock, sleep=clock.sleep))
+
+  response = fetcher.get_with_retry(FeedSource("https://feeds/rss"), {})
+
+  assert response.status_code == 200
+  assert clock.now == 1
+
+
+def test_fetcher_cuts_timeouts_and_waits_to_its_deadline():
+  clock = Clock()
+  fetcher = NewsFetcher(session=FlakySession(), timeout=10, retry_backoff=0, clock=clock,
+                        rate_limiter=RateLimiter("feeds", clock=clock, sleep=clock.sleep))
+
+  # a Retry-After of 1s does not fit in what is left, the 429 is returned as it is
+  response = fetcher.get_with_retry(FeedSource("https://feeds/rss"), {}, deadline=0.5)
+  assert response.status_code == 429
+  assert fetcher.session.timeouts == [0.5]
+  assert clock.now == 0
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app.models.seen_article import SeenArticle
+from app.models.threat import Threat
+from app.models.threat_rollup import ThreatRollup
+from app.services.archive import ThreatArchive
+from app.services.deduplicator import Deduplicator
+from app.services.retention import ThreatRetention
+from app.services.rollup import ThreatRollups
+from app.services.threat_processor import ThreatProcessor
+
+NOW = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def add_threat(db, url, created_at):
+  db.add(Threat(
+      title=url, source="Wire", source_url=url, ai_threat_level=5, ai_category="cyber",
+      ai_summary="s", ai_confidence=0.9, ai_keywords=[], ai_reason="r", created_at=created_at
+  ))
+
+
+def test_created_day_follows_created_at_on_every_write_path(db):
+  add_threat(db, "https://orm", datetime(2026, 3, 9, 23, 30, tzinfo=timezone.utc))
+  ThreatProcessor().save_threats([dict(
+      title="bulk", source="Wire", source_url="https://bulk", ai_threat_level=5, ai_category="cyber",
+      ai_summary="s", ai_confidence=0.9, ai_keywords=[], ai_reason="r",
+      created_at=datetime(2026, 3, 8, 1, 0, tzinfo=timezone.utc)
+  )], db)
+  db.commit()
+
+  days = dict(db.execute(select(Threat.source_url, Threat.created_day)).all())
+  assert days == {"https://orm": datetime(2026, 3, 9).date(), "https://bulk": datetime(2026, 3, 8).date()}
+
+
+def test_expire_removes_whole_days_in_batches(db):
+  for i in range(7):
+    add_threat(db, f"https://old/{i}", NOW - timedelta(days=6, hours=i))
+  for i in range(3):
+    add_threat(db, f"https://new/{i}", NOW - timedelta(days=5, hours=-1 - i))
+  db.commit()
+  ThreatRollups().rebuild(db)
+  Deduplicator(persist=True).mark_seen(db, ["https://seen"])
+  db.query(SeenArticle).update({SeenArticle.seen_at: NOW - timedelta(days=7)})
+  db.commit()
+
+  retention = ThreatRetention(days=5, batch_size=3)
+  assert retention.expire(db, now=NOW, max_batches=2) == 6  # bounded, the rest waits
+  assert not retention.finished
+  assert retention.expire(db, now=NOW) == 1
+  assert retention.finished
+  assert retention.expire(db, now=NOW) == 0
+
+  remaining = set(db.scalars(select(Threat.source_url)))
+  assert remaining == {f"https://new/{i}" for i in range(3)}
+  assert sum(db.scalars(select(ThreatRollup.count))) == 3
+  assert db.query(SeenArticle).count() == 0
+
+  archived = list(ThreatArchive().query())
+  assert sorted(record["source_url"] for record in archived) == [f"https://old/{i}" for i in range(7)]
+
+
+def test_expire_deletes_when_the_archive_cannot_be_written(db, tmp_path):
+  add_threat(db, "https://old", NOW - timedelta(days=6))
+  db.commit()
+  not_a_directory = tmp_path / "file"
+  not_a_directory.write_text("")
+
+  retention = ThreatRetention(days=5, archive=ThreatArchive(directory=str(not_a_directory / "archive")))
+  assert retention.expire(db, now=NOW) == 1
+  assert db.query(Threat).count() == 0
+
+
+def test_bounded_expire_prunes_seen_urls_one_batch_at_a_time(db):
+  Deduplicator(persist=True).mark_seen(db, [f"https://seen/{i}" for i in range(5)])
+  db.query(SeenArticle).update({SeenArticle.seen_at: NOW - timedelta(days=7)})
+  db.commit()
+
+  retention = ThreatRetention(days=5, batch_size=3)
+  retention.expire(db, now=NOW, max_batches=1)
+  assert (db.query(SeenArticle).count(), retention.finished) == (2, False)
+  retention.expire(db, now=NOW, max_batches=1)
+  assert (db.query(SeenArticle).count(), retention.finished) == (0, True)
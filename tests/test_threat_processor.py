@@ -0,0 +1,226 @@
+import random
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app.core import metrics
+from app.models.analysis_cache import AnalysisCacheEntry
+from app.models.seen_article import SeenArticle
+from app.models.threat import Threat
+from app.schemas.threat import ArticleData, ListArticleData
+from app.services import near_duplicates
+from app.services.analysis_cache import AnalysisCache
+from app.services.mock_ai import MockAI
+from app.services.near_duplicates import SimHashIndex, hamming_distance
+from app.services.threat_processor import ThreatProcessor
+from app.services.triage import TriageFilter
+
+
+class FakeAnalyzer:
+  """Answers every article as a threat unless its title mentions 'weather'"""
+
+  def __init__(self):
+    self.analyzed = []
+    self.prompt_tokens = 0
+
+  def analyze_articles(self, articles: ListArticleData):
+    self.analyzed.extend(article.title for article in articles.articles)
+    return [
+      {"is_threat": "weather" not in article.title.lower(), "threat_level": 7, "category": "cyber",
+       "summary": "s", "keywords": ["k"], "confidence": 0.9, "title": article.title, "reason": "r",
+       "article_id": str(index)}
+      for index, article in enumerate(articles.articles)
+    ]
+
+
+def make_article(title, url, description="desc", source="Wire"):
+  return ArticleData(title=title, description=description, url=url, source=source,
+                     published_at=datetime(2025, 6, 1))
+
+
+def make_processor():
+  processor = ThreatProcessor()
+  processor.ai_analyzer = FakeAnalyzer()
+  return processor
+
+
+def test_process_articles_saves_threats_and_marks_everything_seen(db):
+  processor = make_processor()
+  articles = ListArticleData(articles=[
+      make_article("Ransomware hits city", "https://a"),
+      make_article("Weather is nice", "https://b"),
+  ])
+
+  saved = processor.process_articles(articles, db)
+
+  assert [threat.source_url for threat in saved] == ["https://a"]
+  assert db.query(Threat).count() == 1
+  assert {row.url for row in db.query(SeenArticle)} == {"https://a", "https://b"}
+
+
+def test_cache_hit_skips_the_llm_for_a_reworded_copy(db):
+  processor = make_processor()
+  # stored threats are out of the near-duplicate window, so the copy reaches the cache
+  processor.near_duplicates.window_hours = 0
+  processor.process_articles(ListArticleData(articles=[make_article("Ransomware hits city", "https://a")]), db)
+
+  # same story under a new URL, with cosmetic title edits
+  copy = make_article("  RANSOMWARE hits city! ", "https://a-copy")
+  saved = processor.process_articles(ListArticleData(articles=[copy]), db)
+
+  assert processor.ai_analyzer.analyzed == ["Ransomware hits city"]
+  assert processor.stats["cache_hits"] == 1
+  assert processor.stats["cache_misses"] == 0
+  assert [threat.title for threat in saved] == ["  RANSOMWARE hits city! "]
+
+
+def test_cache_evicts_least_recently_used_beyond_max_entries(db):
+  processor = make_processor()
+  processor.analysis_cache.max_entries = 2
+  for i in range(3):
+    processor.process_articles(ListArticleData(articles=[make_article(f"Story {i}", f"https://{i}")]), db)
+
+  assert db.query(AnalysisCacheEntry).count() == 2
+
+
+def test_cache_is_off_when_max_entries_is_zero(db):
+  processor = make_processor()
+  processor.analysis_cache = AnalysisCache(max_entries=0)
+  processor.near_duplicates.window_hours = 0
+  statements = []
+  event.listen(db.get_bind(), "before_cursor_execute",
+               lambda conn, cursor, statement, *args: statements.append(statement))
+  processor.process_articles(ListArticleData(articles=[make_article("Ransomware hits city", "https://a")]), db)
+  assert not [statement for statement in statements if "analysis_cache" in statement]
+  processor.process_articles(ListArticleData(articles=[make_article("Ransomware hits city", "https://a-copy")]), db)
+
+  assert processor.ai_analyzer.analyzed == ["Ransomware hits city"] * 2
+  assert db.query(AnalysisCacheEntry).count() == 0
+
+
+def test_batch_is_saved_in_one_insert_and_skips_existing_urls(db, engine):
+  """An overlapping run's row does not abort the batch, and only new rows are returned"""
+  processor = make_processor()
+  processor.save_threats([dict(
+      title="Old", source="Wire", source_url="https://b", ai_threat_level=3, ai_category="cyber",
+      ai_summary="s", ai_confidence=0.5, ai_keywords=[], ai_reason="r"
+  )], db)
+  db.commit()
+
+  commits = []
+  event.listen(db, "after_commit", lambda session: commits.append(session))
+  articles = ListArticleData(articles=[make_article(f"Attack {i}", f"https://{c}") for i, c in enumerate("abc")])
+  saved = processor.process_articles(articles, db)
+
+  assert sorted(threat.source_url for threat in saved) == ["https://a", "https://c"]
+  assert all(threat.id and threat.created_at for threat in saved)
+  assert db.query(Threat).filter(Threat.source_url == "https://b").one().title == "Old"
+  assert len(commits) == 1
+
+
+def test_match_results_uses_ids_then_normalized_titles():
+  processor = make_processor()
+  articles = [make_article(f"Story {i}", f"https://{i}") for i in range(4)]
+  ai_results = [
+    {"article_id": "2", "title": "something else entirely"},
+    {"article_id": None, "title": "  \u201cSTORY 0\u201d "},
+    {"article_id": "1", "title": "Story 1"},
+    {"article_id": "99", "title": "Unknown story"},
+  ]
+
+  matches, unmatched = processor.match_results(articles, ai_results)
+
+  assert matches == [ai_results[1], ai_results[2], ai_results[0], None]
+  assert unmatched == 1
+
+
+def test_near_duplicate_copies_share_one_analysis_and_one_threat(db):
+  processor = make_processor()
+  story = "Officials say the ransomware attack disrupted payments and email across city departments on Monday."
+  processor.process_articles(ListArticleData(articles=[
+      make_article("Ransomware attack shuts down Springfield city hall computer systems", "https://ap", story),
+      make_article("Ransomware attack shuts down Springfield city hall computer systems - local", "https://local",
+                   story.replace("Officials say", "Officials said")),
+      make_article("Hurricane makes landfall in Florida", "https://storm", "Forecasters warn of storm surge."),
+  ]), db)
+
+  # a later wire copy of the stored story is attached to it as well
+  saved = processor.process_articles(ListArticleData(articles=[
+      make_article("Ransomware attack shuts down Springfield city hall computer systems", "https://reuters", story),
+  ]), db)
+
+  assert saved == []
+  assert len(processor.ai_analyzer.analyzed) == 2
+  assert processor.stats["near_duplicates"] == 1
+  threat = db.query(Threat).filter(Threat.source_url == "https://ap").one()
+  assert threat.related_urls == ["https://local", "https://reuters"]
+  assert threat.simhash is not None
+  assert {row.url for row in db.query(SeenArticle)} >= {"https://local", "https://reuters"}
+
+
+def test_simhash_lookup_compares_against_a_small_part_of_the_index(monkeypatch):
+  rng = random.Random(7)
+  index = SimHashIndex(max_distance=10)
+  for i in range(4000):
+    index.add(rng.getrandbits(64), i)
+  stored = rng.getrandbits(64)
+  index.add(stored, "stored")
+
+  compared = []
+  monkeypatch.setattr(near_duplicates, "hamming_distance",
+                      lambda first, second: compared.append(second) or hamming_distance(first, second))
+  copy = stored
+  for bit in rng.sample(range(64), 10):
+    copy ^= 1 << bit
+
+  assert index.nearest(copy) == "stored"
+  assert len(compared) < 4000 // 10
+
+
+def test_triage_skips_clearly_safe_articles_and_tracks_agreement(db):
+  processor = make_processor()
+  processor.triage = TriageFilter(cutoff=0.75, sample_rate=0)
+  processor.process_articles(ListArticleData(articles=[
+      make_article("Community garden brings joy and growth", "https://garden",
+                   "Volunteers celebrate progress and unity."),
+      make_article("Hackers breach water utility", "https://utility"),
+  ]), db)
+
+  assert processor.ai_analyzer.analyzed == ["Hackers breach water utility"]
+  assert processor.stats["triage_skipped"] == 1
+  assert {row.url for row in db.query(SeenArticle)} == {"https://garden", "https://utility"}
+  assert db.query(Threat).count() == 1
+  assert processor.triage.agreement(db)["buckets"] == [{"min_score": 0.0, "llm_threats": 1, "llm_safe": 0}]
+
+
+def test_triage_never_skips_an_article_with_a_threat_word(db):
+  processor = make_processor()
+  processor.triage = TriageFilter(cutoff=0.75, sample_rate=0)
+  # six safe words would have outweighed the one threat word
+  processor.process_articles(ListArticleData(articles=[
+      make_article("Community relief and support after shooting", "https://mixed",
+                   "Volunteers bring care, help and unity to the neighborhood."),
+  ]), db)
+
+  assert processor.ai_analyzer.analyzed == ["Community relief and support after shooting"]
+  assert processor.stats["triage_skipped"] == 0
+
+
+def test_word_lists_count_inflections_but_not_words_that_merely_start_alike():
+  def counts(text):
+    return MockAI().count_words(make_article(text, "https://x", description=None))
+
+  assert counts("Hackers attacked bombers as warring gangs gunned down a guard") == (5, 0)
+  assert counts("Terrorists threatened the city, improving care helped") == (2, 3)
+  assert counts("Warner warm Bombay software") == (0, 0)
+  # safe-looking false hits would let a real threat skip Gemini
+  assert counts("Career guidelines for helpers") == (0, 0)
+
+
+def test_process_articles_records_stage_metrics(db):
+  before = metrics.stage_seconds.count(stage="persist")
+  saved_before = metrics.stage_articles.value(stage="persist", direction="out")
+  make_processor().process_articles(ListArticleData(articles=[make_article("Ransomware hits city", "https://a")]), db)
+
+  assert metrics.stage_seconds.count(stage="persist") == before + 1
+  assert metrics.stage_articles.value(stage="persist", direction="out") == saved_before + 1